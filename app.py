@@ -14,12 +14,14 @@ from pdb import set_trace as st
 
 from model.searchVotes import query
 import model.downloadVotes  # Namespace issue
+import model.searchVotes
+import model.searchAssemble
 from model.emailContact import sendEmail, newsletterSub
-from model.searchMembers import memberLookup, getMembersByCongress, getMembersByParty, getMembersByPrivate
+from model.searchMembers import memberLookup, getMembersByPrivate
 from model.searchParties import partyLookup
 from model.articles import get_article_meta, list_articles
 from model.searchMeta import metaLookup
-from model.bioData import congressToYear, assemblePersonMeta, twitterCard
+from model.bioData import assemblePersonMeta, twitterCard
 from model.prepVotes import prepVotes
 from model.geoLookup import addressToLatLong, latLongToDistrictCodes, lat_long_to_polygon
 from model.searchAssemble import assembleSearch
@@ -30,6 +32,10 @@ import model.downloadXLS
 import model.stashCart
 import model.partyData
 import model.logQuota
+import model.rosterCache
+import model.ideology
+import model.memberVotes
+import model.payloadStore
 
 # Turn this off on production:
 devserver = int(open("server.txt", "r").read().strip())
@@ -356,7 +362,8 @@ def rollcall(rollcall_id=""):
         return(output)
 
     # Get the rollcall and also whether or not to collapse minor parties.
-    rollcall = model.downloadVotes.downloadAPI(rollcall_id, "Web")
+    rollcallJSON = model.payloadStore.webResponse(rollcall_id)
+    rollcall = json.loads(rollcallJSON)
     mapParties = int(defaultValue(bottle.request.params.mapParties, 1))
 
     # After we got the rollcall, we found it didn't exist.
@@ -377,6 +384,11 @@ def rollcall(rollcall_id=""):
         except:
             sponsor = {}
 
+    # The charts get the same payload /api/download/<rollcall_id> returns,
+    # embedded in the page so it isn't assembled a second time. "<" is
+    # escaped so nothing in the text can close the script tag.
+    rollcallJSON = rollcallJSON.replace("<", "\\u003c")
+
     # Subset the rollcall to the stuff we care about.
     current_rollcall = rollcall["rollcalls"][0]
 
@@ -415,7 +427,8 @@ def rollcall(rollcall_id=""):
         sources=mark_linkable_sources(current_rollcall.get("dtl_sources", [])),
         noteText=noteText,
         title_text=title_text,
-        plotTitle=plotTitle
+        plotTitle=plotTitle,
+        rollcallJSON=rollcallJSON
     )
     return(output)
 
@@ -441,26 +454,22 @@ def savedHashRedirect(savedhash):
 @app.route("/api/getmembersbycongress", method="POST")
 @app.route("/api/getmembersbycongress")
 def getmembersbycongress():
-    st = time.time()
     congress = defaultValue(bottle.request.params.congress, 0)
     chamber = defaultValue(bottle.request.params.chamber, "").title()
     if chamber != "Senate" and chamber != "House":
         chamber = ""
     api = defaultValue(bottle.request.params.api, "")
-    out = getMembersByCongress(congress, chamber, api)
-    if api == "Web_Congress" and "results" in out:
-        for i in range(0, len(out["results"])):
-            memberRow = out["results"][i]
-            if not "congresses" in memberRow:
-                continue
-
-            memberRow["minElected"] = congressToYear(
-                memberRow["congresses"][0][0], 0)
+    payload = model.rosterCache.membersByCongress(congress, chamber, api)
+    return model.rosterCache.respond(payload, bottle.request, bottle.response)
 
-            out["results"][i] = memberRow
 
-    out["timeElapsed"] = time.time() - st
-    return out
+@app.route("/api/ideologyHistogram")
+def ideologyHistogram():
+    congress = defaultValue(bottle.request.params.congress, 0)
+    chamber = defaultValue(bottle.request.params.chamber, "")
+    bins = defaultValue(bottle.request.params.bins, 15)
+    icpsr = defaultValue(bottle.request.params.icpsr, 0)
+    return model.ideology.ideologyHistogram(congress, chamber, bins, icpsr)
 
 
 @app.route("/api/geocode")
@@ -555,26 +564,14 @@ def districtLookup():
 
 @app.route("/api/getmembersbyparty")
 def getmembersbyparty():
-    st = time.time()
     id = defaultValue(bottle.request.params.id, 0)
     try:
         congress = int(defaultValue(bottle.request.params.congress, 0))
     except:
         congress = 0
     api = defaultValue(bottle.request.params.api, "")
-    out = getMembersByParty(id, congress, api)
-    if api == "Web_Party" and "results" in out:
-        for i in range(0, len(out["results"])):
-            memberRow = out["results"][i]
-            if not "congresses" in memberRow:
-                continue
-
-            memberRow["minElected"] = congressToYear(
-                memberRow["congresses"][0][0], 0)
-            out["results"][i] = memberRow
-
-    out["timeElapsed"] = time.time() - st
-    return out
+    payload = model.rosterCache.membersByParty(id, congress, api)
+    return model.rosterCache.respond(payload, bottle.request, bottle.response)
 
 
 @app.route("/api/getmembers", method="POST")
@@ -607,11 +604,30 @@ def searchAssemble():
     return(out)
 
 
+@app.route("/api/cacheStats")
+def cacheStats():
+    return({"searchWindows": model.searchAssemble.searchWindows.stats(),
+            "queryCache": model.searchVotes.queryCache.stats(),
+            "rosterPayloads": model.rosterCache.payloads.stats(),
+            "partyPositions": model.memberVotes.positionCache.stats()})
+
+
+@app.route("/api/searchFacets", method="POST")
+@app.route("/api/searchFacets")
+def searchFacets():
+    # Count against the same query the results came from: the search box plus the sidebar.
+    q, startdate, enddate, chamber = model.searchAssemble.facetQuery(defaultValue(bottle.request.params.q, ""), bottle.request.params)
+    return(model.searchVotes.searchFacets(q, startdate=startdate, enddate=enddate, chamber=chamber, request=bottle.request,
+                                          maxTimeMS=model.searchAssemble.BRANCH_TIMEOUTS["rollcalls"]*1000))
+
+
 @app.route("/api/getMemberVotesAssemble")
 def getMemberVotesAssemble(icpsr=0, qtext="", skip=0):
     icpsr = defaultValue(bottle.request.params.icpsr, 0)
     qtext = defaultValue(bottle.request.params.qtext, "")
     skip = defaultValue(bottle.request.params.skip, 0)
+    if skip == "0":  # First page; otherwise skip is the previous page's nextId cursor.
+        skip = 0
 
     if not icpsr:
         output = bottle.template(
@@ -630,16 +646,24 @@ def getMemberVotesAssemble(icpsr=0, qtext="", skip=0):
 
     votes = []
 
-    if qtext:
-        qtext = qtext + " AND (voter: " + str(person["icpsr"]) + ")"
-    else:
-        qtext = "voter: " + str(person["icpsr"])
+    # The unfiltered table pages straight off the stored member votes; searches
+    # within the member's votes go through the rollcall search.
+    voteQuery = None
+    if not qtext:
+        voteQuery = model.searchVotes.memberVotePage(
+            person["icpsr"], sortSkip=skip, rowLimit=25, request=bottle.request)
 
-    if skip:
-        voteQuery = query(qtext, rowLimit=25, jsapi=1,
-                          sortSkip=skip, request=bottle.request)
-    else:
-        voteQuery = query(qtext, rowLimit=25, jsapi=1, request=bottle.request)
+    if voteQuery is None:
+        if qtext:
+            qtext = qtext + " AND (voter: " + str(person["icpsr"]) + ")"
+        else:
+            qtext = "voter: " + str(person["icpsr"])
+
+        if skip:
+            voteQuery = query(qtext, rowLimit=25, jsapi=1, keepKeys=1,
+                              sortSkip=skip, request=bottle.request)
+        else:
+            voteQuery = query(qtext, rowLimit=25, jsapi=1, keepKeys=1, request=bottle.request)
 
     # Outsourced the vote assembly to a model for future API buildout.
     votes = prepVotes(voteQuery, person)
@@ -679,6 +703,9 @@ def downloadAPI(rollcall_id=""):
     if not rollcall_id:
         rollcall_id = defaultValue(bottle.request.params.rollcall_id)
     apitype = defaultValue(bottle.request.params.apitype, "Web")
+    if apitype == "Web":
+        bottle.response.content_type = "application/json"
+        return(model.payloadStore.webResponse(rollcall_id))
     res = model.downloadVotes.downloadAPI(rollcall_id, apitype)
     for k, v in res.iteritems():
         print k, v
@@ -0,0 +1,185 @@
+""" Timing harness for the hot request paths.
+
+Run from the model directory against a loaded voteview database, e.g.
+
+	python benchmarks.py downloadAPI pivots parser memberScoring
+"""
+import sys
+import time
+import math
+import json
+import pymongo
+import numpy as np
+from downloadVotes import downloadAPI, _flagPivots
+import searchVotes
+import searchMembers
+import searchAssemble
+import nameIndex
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+def timeCall(fn, repeat=3):
+	""" Best-of-N wall clock time for a zero-argument callable. """
+	best = None
+	for i in xrange(repeat):
+		start = time.time()
+		fn()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def sampleRollcalls(n, chamber="House"):
+	""" The n most recent rollcall IDs in a chamber. """
+	rows = db.voteview_rollcalls.find({"chamber": chamber}, {"id": 1, "_id": 0}).sort("date_chamber_rollnumber", -1).limit(n)
+	return [r["id"] for r in rows]
+
+def sampleVoter(rollcall_id):
+	""" Any member who voted on the given rollcall, for the Web_Person API. """
+	r = db.voteview_rollcalls.find_one({"id": rollcall_id}, {"votes.icpsr": 1, "_id": 0})
+	return r["votes"][0]["icpsr"]
+
+def benchDownloadAPI(sizes=[1, 100, 500], apitypes=["Web", "R", "exportJSON", "Web_Person"]):
+	""" Per-rollcall assembly time of downloadAPI by API type and request size.
+	APIs capped at 100 votes per request are fed in 100-vote batches. """
+	ids = sampleRollcalls(max(sizes))
+	voterId = sampleVoter(ids[0])
+	print "%-12s %6s %10s %14s" % ("apitype", "n", "total (s)", "per rc (ms)")
+	for apitype in apitypes:
+		batch = 500 if apitype == "exportJSON" else 100
+		for n in sizes:
+			subset = ids[:n]
+			chunks = [subset[i:i + batch] for i in xrange(0, len(subset), batch)]
+			elapsed = timeCall(lambda: [downloadAPI(c, apitype, voterId) for c in chunks])
+			print "%-12s %6d %10.3f %14.2f" % (apitype, len(subset), elapsed, 1000 * elapsed / len(subset))
+
+def legacyFlagPivots(result, chamber, congress):
+	""" The pivot marking downloadAPI did before _flagPivots: a full sort of the voters and list membership tests. """
+	pivotCopy = sorted([x for x in result if "x" in x and x["x"] is not None], key=lambda x: x["x"])
+	if len(pivotCopy) % 2:
+		median = [pivotCopy[int(math.ceil(len(pivotCopy) / 2)) - 1]["icpsr"]]
+	else:
+		median = [pivotCopy[(len(pivotCopy) / 2) - 1]["icpsr"], pivotCopy[(len(pivotCopy) / 2)]["icpsr"]]
+	fbPivot = []
+	if chamber == "Senate" and congress >= 94 and len(pivotCopy) >= 60:
+		fbPivot = [pivotCopy[59]["icpsr"], pivotCopy[len(pivotCopy) - 60]["icpsr"]]
+	numVotes = len([x for x in result if "vote" in x and x["vote"] != "Abs"])
+	voPivotNum = int(math.ceil(float(numVotes) * float(2) / float(3)))
+	voPivot = [pivotCopy[voPivotNum]["icpsr"], pivotCopy[len(pivotCopy) - voPivotNum - 1]["icpsr"]]
+	for i in xrange(len(result)):
+		if result[i]["icpsr"] in median:
+			result[i]["flags"] = "median"
+		if result[i]["icpsr"] in fbPivot:
+			result[i]["flags"] = "fbPivot"
+		if result[i]["icpsr"] in voPivot:
+			result[i]["flags"] = "voPivot"
+
+def benchPivots(sizes=[1, 100, 500], repeat=10):
+	""" Time to mark the median and pivots of n House rollcalls, sorting
+	(legacy) against argpartition (_flagPivots). Voters are fetched once
+	through the Web API so only the marking is timed; downloadAPI gathers
+	_flagPivots' columns in its voter loop, so they are built up front too. """
+	ids = sampleRollcalls(max(sizes))
+	rollcalls = []
+	for i in xrange(0, len(ids), 100):
+		rollcalls += downloadAPI(ids[i:i + 100], "Web").get("rollcalls", [])
+	print "%6s %12s %12s %8s" % ("n", "legacy (ms)", "numpy (ms)", "speedup")
+	for n in sizes:
+		subset = rollcalls[:n]
+		columns = [(rc["votes"], np.array([v.get("x") for v in rc["votes"]], dtype=np.float64), np.array([v["icpsr"] for v in rc["votes"]]),
+			len([v for v in rc["votes"] if v.get("vote", "Abs") != "Abs"]), rc["chamber"], rc["congress"]) for rc in subset]
+		legacy = timeCall(lambda: [legacyFlagPivots(rc["votes"], rc["chamber"], rc["congress"]) for rc in subset for r in xrange(repeat)]) / repeat
+		vectorized = timeCall(lambda: [_flagPivots(*args) for args in columns for r in xrange(repeat)]) / repeat
+		print "%6d %12.2f %12.2f %7.1fx" % (len(subset), 1000 * legacy, 1000 * vectorized, legacy / vectorized if vectorized else 0)
+
+# Query shapes seen in the search logs.
+queryCorpus = ["tax", "iraq war", "rhodesia bonker amendment", "estate tax congress:113", "alltext:tax", "codes:energy",
+	"congress:113 chamber:House", "voter: 29940", "voter: 29940 congress:[110 to 115]",
+	"(nay:[0 to 9] OR nay:[91 to 100] OR yea:[0 to 5]) AND congress:112",
+	"tax startdate:2008-04-07 enddate:2013-03-03 dates:[2013 to 2015]",
+	"shortdescription:Iraq congress:[112 to 113]", "iraq war AND congress:113",
+	"voter: 29940 15021 OR congress:[113 to ]", "alltext:afghanistan iraq OR codes:defense",
+	"((vote_desc: tax congress: 113) OR congress:114 OR (voter:29940 AND congress:112) OR congress:[55 to 58]) AND support:[58 to 100]",
+	" keyvote: 1 (codes.Clausen: Agriculture OR codes.Peltzman: Budget) congress:[100 to 115]"]
+
+def benchParser(repeat=1000):
+	""" Per-query cost of parsing alone, of a cold dispatch (parse and compile), and of a cached dispatch. """
+	print "%-60s %10s %10s %10s" % ("query", "parse (us)", "cold (us)", "cached (us)")
+	for q in queryCorpus:
+		def cold():
+			searchVotes.queryCache.clear()
+			searchVotes.queryDispatcher(q)
+		parse = timeCall(lambda: [searchVotes.parseQuery(q) for i in xrange(repeat)])
+		coldTime = timeCall(lambda: [cold() for i in xrange(repeat)])
+		searchVotes.queryDispatcher(q)
+		cached = timeCall(lambda: [searchVotes.queryDispatcher(q) for i in xrange(repeat)])
+		print "%-60s %10.1f %10.1f %10.1f" % (q.strip()[:60], 1e6 * parse / repeat, 1e6 * coldTime / repeat, 1e6 * cached / repeat)
+
+# Member searches: surnames, full names in both orders, nicknames, and typos.
+memberCorpus = ["johnson", "smith", "lyndon johnson", "johnson, lyndon", "bill clinton", "ted kennedy", "dick cheney",
+	"nancy pelosi", "pelosi", "jim jordan", "bob dole", "mitch mcconnel", "alexandria ocasio-cortez"]
+
+legacyNicknames = json.load(open(nameIndex.NICKNAME_FILE, "r"))
+
+def legacyNicknameSub(name):
+	""" singleNicknameSub as it was before the nickname list was compiled: two scans of the list per word. """
+	done=0
+	steps=0
+	while done==0 and steps<20:
+		candidates = []
+		candidates = candidates + [x["nickname"] for x in legacyNicknames if x["name"].lower()==name.lower()]
+		candidates = candidates + [x["name"] for x in legacyNicknames if x["nickname"].lower()==name.lower()]
+		if len(candidates):
+			candidates.append(name)
+			candidates = sorted(list(set(candidates)), key=lambda x: (len(x), x))
+			newName = candidates[0]
+			if newName!=name:
+				name = newName
+				steps=steps+1
+			else:
+				done=1
+		done=1
+	return name
+
+def benchMemberScoring():
+	""" Time to rank the candidate members of a search in findMembers: fuzzy
+	scoring with the old nickname scans, fuzzy scoring with the compiled
+	nickname map, and the name index scores. Candidates are fetched once up
+	front so only the ranking is timed. """
+	originalLookup = searchAssemble.memberLookup
+	compiledSub = searchMembers.singleNicknameSub
+	print "%-30s %6s %12s %12s %12s" % ("query", "n", "legacy (ms)", "nickmap (ms)", "index (ms)")
+	try:
+		for q in memberCorpus:
+			found = originalLookup({"name": q}, 200, distinct=1, api="Web_FP_Search").get("results", [])
+			unscored = [dict((k, v) for k, v in m.iteritems() if k != "nameScore") for m in found]
+			lookup = ({"name": q}, 200)
+
+			searchAssemble.memberLookup = lambda *a, **k: {"results": [dict(m) for m in unscored]}
+			searchMembers.singleNicknameSub = legacyNicknameSub
+			legacy = timeCall(lambda: searchAssemble.findMembers(q, lookup, 1, 0))
+			searchMembers.singleNicknameSub = compiledSub
+			compiled = timeCall(lambda: searchAssemble.findMembers(q, lookup, 1, 0))
+
+			searchAssemble.memberLookup = lambda *a, **k: {"results": [dict(m) for m in found]}
+			indexed = timeCall(lambda: (nameIndex.search(q, 200), searchAssemble.findMembers(q, lookup, 1, 0)))
+			print "%-30s %6d %12.2f %12.2f %12.2f" % (q, len(found), 1000 * legacy, 1000 * compiled, 1000 * indexed)
+	finally:
+		searchAssemble.memberLookup = originalLookup
+		searchMembers.singleNicknameSub = compiledSub
+
+benchmarks = {"downloadAPI": benchDownloadAPI, "pivots": benchPivots, "parser": benchParser, "memberScoring": benchMemberScoring}
+
+if __name__ == "__main__":
+	names = sys.argv[1:] or sorted(benchmarks)
+	for name in names:
+		print "=====", name
+		benchmarks[name]()
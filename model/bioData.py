@@ -1,12 +1,11 @@
-import os
 from searchMembers import memberLookup
+from bioImages import bioImageFile
 from loyalty import getLoyalty
 
 def getBioImage(icpsr, default):
 	""" Check for file presence of bio image or fall back to default. """
 
-	bio_image = "%s.jpg" % str(icpsr).zfill(6)
-	bio_image = bio_image if os.path.isfile("static/img/bios/%s" % bio_image) else default
+	bio_image = bioImageFile(icpsr, default)
 
 	return bio_image, int(bio_image != default)
 
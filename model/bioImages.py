@@ -0,0 +1,52 @@
+import os
+import time
+
+# In-memory manifest of the member bio photos in static/img/bios. Roster and
+# rollcall pages need to know for hundreds of members at a time whether a photo
+# exists, so we list the directory once per worker and only re-list it when
+# its mtime changes (i.e. a photo deploy added or removed files).
+BIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static", "img", "bios")
+CHECK_INTERVAL = 60 # Seconds between directory mtime checks.
+
+manifest = {"mtime": None, "checked": 0, "files": frozenset()}
+
+def refreshManifest(force=0):
+	""" Re-list the bio image directory if its mtime has changed. Cheap to call:
+	the mtime itself is only checked once every CHECK_INTERVAL seconds. """
+	global manifest
+
+	now = time.time()
+	if not force and now - manifest["checked"] < CHECK_INTERVAL:
+		return manifest
+
+	try:
+		mtime = os.stat(BIO_DIR).st_mtime
+	except OSError:
+		manifest = {"mtime": None, "checked": now, "files": frozenset()}
+		return manifest
+
+	if force or mtime != manifest["mtime"]:
+		manifest = {"mtime": mtime, "checked": now, "files": frozenset(os.listdir(BIO_DIR))}
+	else:
+		manifest["checked"] = now
+	return manifest
+
+def bioImageName(icpsr):
+	""" Filename a member's bio photo would have. """
+	return str(icpsr).zfill(6) + ".jpg"
+
+def hasBioImage(icpsr):
+	""" Does this member have a bio photo? """
+	return bioImageName(icpsr) in refreshManifest()["files"]
+
+def bioImageFile(icpsr, default="silhouette.png"):
+	""" A member's bio photo filename, or the default if there is none. """
+	name = bioImageName(icpsr)
+	return name if name in refreshManifest()["files"] else default
+
+# List the image directory once per worker, up front.
+refreshManifest(force=1)
+
+if __name__ == "__main__":
+	print len(manifest["files"]), "bio images in", BIO_DIR
+	print bioImageFile(99869), bioImageFile(0)
@@ -0,0 +1,20 @@
+""" Vote cast codes. Kept free of database and search imports so the build
+scripts (memberVotes.py) can use them without loading the search indexes. """
+
+def _get_yeanayabs(vote_id):
+	"""
+	Map vote ids with the proper values
+	Yea -> [1..3], Nay -> [4..6], Abs -> [7..9]
+	"""
+	if vote_id < 4:
+		return "Yea"
+	elif vote_id < 7:
+		return "Nay"
+	elif vote_id < 10:
+		return "Abs"
+
+def _get_pairedvote(vote_id):
+	"""
+	Map vote its to a 0/1 flag for paired voting.
+	"""
+	return 1 if vote_id in [2, 5] else 0
@@ -0,0 +1,156 @@
+""" Cutting line geometry for every rollcall, stored on the rollcall.
+
+downloadAPI draws each rollcall's cutting line from nominate.mid, spread and
+the second dimension weight (add_endpoints). Those only change when a data
+load lands, so this computes the slope, intercept and endpoints for all
+rollcalls at once with NumPy and stores them in the rollcall's nominate
+field along with nominate.dimweight, the weight they were built with.
+downloadAPI uses stored geometry whose dimweight is current and computes
+the rest itself.
+
+	python cuttingLines.py build            # rollcalls with missing or stale geometry
+	python cuttingLines.py build all        # every rollcall
+	python cuttingLines.py patch <oplog>    # stale ones plus those the patch touched
+	python cuttingLines.py check            # report stale rollcalls without writing
+"""
+import sys
+import time
+import json
+import numpy as np
+import pymongo
+from pymongo import UpdateOne
+from searchMeta import currentDimweight
+from patchOplog import touchedIds
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+BATCH_SIZE = 5000
+GEOMETRY = ["slope", "intercept", "x", "y"]
+
+def numeric(values):
+	return isinstance(values, list) and len(values) >= 2 and all(type(v) in (int, long, float) for v in values[:2])
+
+def cuttingLines(mids, spreads, dimWeight):
+	""" add_endpoints for many rollcalls at once.
+
+	Parameters
+	----------
+	mids, spreads: array
+		n x 2 arrays of each rollcall's nominate.mid and nominate.spread
+	dimWeight: float
+		Second dimension weight
+
+	Returns
+	-------
+	list
+		(slope, intercept, x, y) per rollcall, exactly as add_endpoints
+		gives them (slope and intercept are None for an unestimated vote)
+	"""
+	mids = np.asarray(mids, dtype=np.float64).reshape(-1, 2)
+	spreads = np.asarray(spreads, dtype=np.float64).reshape(-1, 2)
+	zero = (spreads[:, 0] == 0) & (spreads[:, 1] == 0) & (mids[:, 0] == 0) & (mids[:, 1] == 0)
+	vertical = ~zero & (np.abs(spreads[:, 1]) < 1e-16)
+	general = ~zero & ~vertical
+
+	# Same operation order as add_endpoints, so results match it bit for bit.
+	slope = np.zeros(len(mids))
+	intercept = np.zeros(len(mids))
+	with np.errstate(divide="ignore", invalid="ignore"):
+		slope[general] = -spreads[general, 0] / (spreads[general, 1] * dimWeight * dimWeight)
+	intercept[general] = -slope[general] * mids[general, 0] + mids[general, 1]
+	slope[vertical] = 1000
+	intercept[vertical] = -slope[vertical] * (mids[vertical, 0] + mids[vertical, 1])
+	y0 = intercept + slope * 10
+	y1 = intercept + slope * -10
+
+	lines = []
+	for i in xrange(len(mids)):
+		if zero[i]:
+			lines.append((None, None, [0, 0], [0, 0]))
+		elif vertical[i]:
+			lines.append((1000, float(intercept[i]), [float(mids[i, 0]), float(mids[i, 0])], [-10, 10]))
+		else:
+			lines.append((float(slope[i]), float(intercept[i]), [10, -10], [float(y0[i]), float(y1[i])]))
+	return lines
+
+def scanRollcalls(query):
+	""" Rollcalls matching query whose mid and spread we can draw a line from, as
+	(_id, id, nominate) rows, plus the IDs of those we can't (downloadAPI handles them). """
+	rows = []
+	skipped = []
+	fields = {"id": 1, "nominate.mid": 1, "nominate.spread": 1, "nominate.dimweight": 1}
+	fields.update(dict(("nominate." + f, 1) for f in GEOMETRY))
+	for rollcall in db.voteview_rollcalls.find(query, fields).batch_size(BATCH_SIZE):
+		nominate = rollcall.get("nominate") or {}
+		if numeric(nominate.get("mid")) and numeric(nominate.get("spread")):
+			rows.append((rollcall["_id"], rollcall.get("id"), nominate))
+		elif nominate.get("spread") and nominate["spread"][0] is not None:
+			skipped.append(rollcall.get("id"))
+	return rows, skipped
+
+def staleRollcalls(rows, dimWeight):
+	""" The rows whose stored geometry is missing, built with another weight,
+	or no longer what their mid and spread give; with the correct geometry. """
+	lines = cuttingLines([r[2]["mid"][:2] for r in rows], [r[2]["spread"][:2] for r in rows], dimWeight)
+	stale = []
+	for row, line in zip(rows, lines):
+		nominate = row[2]
+		if nominate.get("dimweight") != dimWeight or tuple(nominate.get(f) for f in GEOMETRY) != line:
+			stale.append((row, line))
+	return stale
+
+def storeGeometry(query={}, force=0):
+	""" Compute and store the geometry of the rollcalls matching query; only
+	the stale ones unless forced. Returns how many were written. """
+	start = time.time()
+	dimWeight = currentDimweight()
+	rows, skipped = scanRollcalls(query)
+	if force:
+		updates = zip(rows, cuttingLines([r[2]["mid"][:2] for r in rows], [r[2]["spread"][:2] for r in rows], dimWeight))
+	else:
+		updates = staleRollcalls(rows, dimWeight)
+
+	for i in xrange(0, len(updates), BATCH_SIZE):
+		ops = []
+		for row, line in updates[i:i + BATCH_SIZE]:
+			fields = dict(("nominate." + f, v) for f, v in zip(GEOMETRY, line))
+			fields["nominate.dimweight"] = dimWeight
+			ops.append(UpdateOne({"_id": row[0]}, {"$set": fields}))
+		db.voteview_rollcalls.bulk_write(ops, ordered=False)
+	print "Stored cutting lines for", len(updates), "of", len(rows), "rollcalls in", round(time.time() - start, 1), "s;", len(skipped), "without usable mid/spread"
+	return len(updates)
+
+def checkGeometry():
+	""" Rollcall IDs whose stored geometry is stale for the current second_dimweight. """
+	dimWeight = currentDimweight()
+	rows, skipped = scanRollcalls({})
+	return [row[1] for row, line in staleRollcalls(rows, dimWeight)]
+
+def patchGeometry(oplogDir):
+	""" Rebuild the rollcalls an hourly patch touched, and any other stale ones. """
+	touched = touchedIds(oplogDir, ["voteview_rollcalls", "voteview_metadata"])
+	if touched["voteview_metadata"]["ids"] or touched["voteview_metadata"]["dropped"]:
+		return storeGeometry()
+	ids = list(touched["voteview_rollcalls"]["ids"])
+	return storeGeometry({"_id": {"$in": ids}}, force=1) + storeGeometry({"nominate.dimweight": {"$ne": currentDimweight()}})
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "build":
+		storeGeometry(force=int(len(sys.argv) > 2 and sys.argv[2] == "all"))
+	elif len(sys.argv) > 2 and sys.argv[1] == "patch":
+		patchGeometry(sys.argv[2])
+	elif len(sys.argv) > 1 and sys.argv[1] == "check":
+		stale = checkGeometry()
+		print len(stale), "rollcalls with stale cutting lines"
+		for rid in stale[:100]:
+			print rid
+	else:
+		print "Usage: python cuttingLines.py build [all] | patch <oplog directory> | check"
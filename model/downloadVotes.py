@@ -1,12 +1,14 @@
 import time
-import os
 import json
 import traceback
 import math
+import numpy as np
 from searchMembers import cqlabel
-from searchParties import partyName, shortName
-from searchMeta import metaLookup
+from searchParties import resolveParties
+from searchMeta import currentDimweight
 from slugify import slugify
+from bioImages import bioImageFile
+from castCodes import _get_yeanayabs, _get_pairedvote
 from pymongo import MongoClient
 client = MongoClient()
 try:
@@ -18,9 +20,6 @@ except:
         dbConf = {'dbname': 'voteview'}
 db = client[dbConf["dbname"]]
 
-m = metaLookup()
-dimWeight = m['nominate']['second_dimweight']
-
 
 def waterfallQuestion(rollcall):
     waterfall = ["vote_question", "question"]
@@ -41,10 +40,13 @@ def waterfallText(rollcall):
     return "Vote " + rollcall["id"]
 
 
-def add_endpoints(mid, spread):
+def add_endpoints(mid, spread, dimWeight=None):
     """Add attributes to nomimate attribute that aid in
-    drawing cutting lines
+    drawing cutting lines. dimWeight defaults to the current
+    second dimension weight.
     """
+    if dimWeight is None:
+        dimWeight = currentDimweight()
 
     if (spread[0] == 0 and
         float(spread[1]) == 0 and
@@ -69,26 +71,84 @@ def add_endpoints(mid, spread):
     return slope, intercept, x, y
 
 
-def _get_yeanayabs(vote_id):
+def _stableRank(xs, positions):
+    """
+    Indices into xs of the elements at the given positions of a stable sort
+    of xs, i.e. what sorted(...)[position] picks, ties kept in input order.
+    Positions may be negative, as with list indexing. Uses one argpartition
+    rather than a full sort.
     """
-    Map vote ids with the proper values
-    Yea -> [1..3], Nay -> [4..6], Abs -> [7..9]
+    n = len(xs)
+    positions = np.array([p + n if p < 0 else p for p in positions], dtype=np.int64)
+    if len(positions) and (positions.min() < 0 or positions.max() >= n):
+        raise IndexError("pivot position out of range")
+    picked = np.argpartition(xs, np.unique(positions))[positions]
+
+    # argpartition isn't stable: where the picked value is shared, take the
+    # tied element the stable sort would have put at that position.
+    values = xs[picked]
+    equal = xs[:, None] == values
+    for j in np.flatnonzero(equal.sum(axis=0) > 1):
+        picked[j] = np.flatnonzero(equal[:, j])[positions[j] - np.count_nonzero(xs < values[j])]
+    return picked
+
+def _flagPivots(result, xs, icpsrs, numVotes, chamber, congress):
     """
-    if vote_id < 4:
-        return "Yea"
-    elif vote_id < 7:
-        return "Nay"
-    elif vote_id < 10:
-        return "Abs"
-
-def _get_pairedvote(vote_id):
+    Mark the median voter(s) and the filibuster and veto override pivots of
+    a rollcall's voters in their "flags" field. xs and icpsrs are the
+    voters' first dimension scores (NaN if unscored, and then not ranked)
+    and ICPSRs, in the order of result; numVotes counts the non-abstentions.
+    A voter who is several pivots is flagged as the last of median, fbPivot,
+    voPivot.
     """
-    Map vote its to a 0/1 flag for paired voting.
+    ranked = np.flatnonzero(~np.isnan(xs))
+    n = len(ranked)
+
+    pivots = [("median", [n / 2 - 1] if n % 2 else [n / 2 - 1, n / 2])]
+    if chamber == "Senate" and congress >= 94 and n >= 60:
+        pivots.append(("fbPivot", [59, n - 60]))
+    voPivotNum = int(math.ceil(float(numVotes) * float(2) / float(3)))
+    pivots.append(("voPivot", [voPivotNum, n - voPivotNum - 1]))
+
+    # One partition finds every pivot position at once.
+    picked = ranked[_stableRank(xs[ranked], [p for flag, positions in pivots for p in positions])]
+    start = 0
+    for flag, positions in pivots:
+        pivotIcpsrs = icpsrs[picked[start:start + len(positions)]]
+        start += len(positions)
+        for i in np.flatnonzero((icpsrs[:, None] == pivotIcpsrs).any(axis=1)):
+            result[i]["flags"] = flag
+
+def downloadMemberVotes(rollcall_ids, icpsr):
+    """One member's vote on each of a set of rollcalls, for the person page.
+
+    Unlike downloadAPI(..., "Web_Person", icpsr), which reads every voter on
+    every rollcall, this projects only the member's own entry of the votes
+    array. Returns a dict keyed by rollcall id holding the party_vote_counts
+    and, if the member voted, their vote, paired_flag and rounded prob.
     """
-    return 1 if vote_id in [2, 5] else 0
+    icpsr = int(icpsr)
+    results = {}
+    rollcalls = db.voteview_rollcalls.find(
+        {"id": {"$in": list(rollcall_ids)}},
+        {"id": 1, "party_vote_counts": 1, "votes": {"$elemMatch": {"icpsr": icpsr}}, "_id": 0})
+    for rollcall in rollcalls:
+        row = {"party_vote_counts": rollcall.get("party_vote_counts", {})}
+        for v in rollcall.get("votes", []):
+            row["vote"] = _get_yeanayabs(v["cast_code"])
+            row["paired_flag"] = _get_pairedvote(v["cast_code"])
+            if "prob" in v:
+                try:
+                    row["prob"] = int(round(v["prob"]))
+                except:
+                    row["prob"] = 0
+        results[rollcall["id"]] = row
+    return results
 
 def downloadAPI(rollcall_id, apitype="Web", voterId=0):
     starttime = time.time()
+    # Read per request so a NOMINATE reload takes effect without a restart.
+    dimWeight = currentDimweight()
     # Setup API version response
     webexportapis = ["Web", "Web_Person", "exportJSON", "exportCSV"]
 
@@ -129,17 +189,16 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
 
     setupTime = time.time()
     # Do we need to fold in members?
-    peopleIds = []
-    memberSet = []
+    peopleIds = set()
     if apitype == "Web_Person":  # I need to fold in one specific member
         needPeople = -1  # Just one specific member
-        peopleIds = [voterId]
+        peopleIds = set([voterId])
     elif apitype == "exportCSV":
         needPeople = 0  # No members at all
     else:
         needPeople = 1
-        peopleIds = db.voteview_rollcalls.distinct(
-            "votes.icpsr", {"id": {"$in": rollcall_ids}})  # All relevant members
+        peopleIds = set(db.voteview_rollcalls.distinct(
+            "votes.icpsr", {"id": {"$in": rollcall_ids}}))  # All relevant members
 
     congresses = []
     for rollcall_id in rollcall_ids:
@@ -149,15 +208,19 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
             pass
 
     memberTime1 = time.time()
-    # Now fetch the members
-    memberSet = []
+    # Now fetch the members, indexed once by (congress, icpsr) so the voter
+    # loop below is a dict lookup rather than a scan of the member list.
+    memberIndex = {}
     if len(peopleIds):
         memberFields = {"icpsr": 1, "nominate": 1, "bioname": 1, "party_code": 1,
                         "state_abbrev": 1, "chamber": 1, "district_code": 1, "congress": 1, "id": 1}
         members = db.voteview_members.find(
-            {"icpsr": {"$in": peopleIds}, "congress": {"$in": congresses}}, memberFields)
+            {"icpsr": {"$in": list(peopleIds)}, "congress": {"$in": congresses}}, memberFields)
         for m in members:
-            memberSet.append(m)
+            memberIndex.setdefault((m["congress"], m["icpsr"]), m)
+
+    # Every party the voters belong to, resolved once for the whole request.
+    parties = resolveParties(set(m.get("party_code") for m in memberIndex.itervalues()))
 
     memberTime2 = time.time()
     # Now iterate through the rollcalls
@@ -185,12 +248,14 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
     )
     for rollcall in rollcalls:
         result = []  # Hold new votes output, start blank
+        # Columns for the pivot search, gathered as the voters are assembled.
+        pivotX = []
+        pivotIcpsr = []
+        numVotes = 0
         try:
             # If we need some people, let's iterate through the voters and fill
             # them out
             if needPeople != 0:
-                metaMembers = [m for m in memberSet if m[
-                    "congress"] == rollcall["congress"]]
                 for v in rollcall["votes"]:
                     newV = {}
                     # Only add the person if they're in our validated list of
@@ -199,13 +264,9 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
                         # print "In here"
                         newV.update(v)
 
-                        # Do the match from the member list
-                        try:
-                            memberMap = next((m for m in metaMembers if m[
-                                             "icpsr"] == v["icpsr"]), None)
-                            if memberMap is None:
-                                print v["icpsr"], "Error! We don't have a member with this icpsr. Skipping"
-                        except:
+                        # Do the match from the member index
+                        memberMap = memberIndex.get((rollcall["congress"], v["icpsr"]))
+                        if memberMap is None:
                             print v["icpsr"], "Error! We don't have a member with this icpsr. Skipping"
                             continue
 
@@ -237,16 +298,12 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
                                 print traceback.format_exc()
                                 pass
 
-                            newV["party"] = partyName(memberMap["party_code"])
-                            newV["party_short_name"] = shortName(
-                                memberMap["party_code"])
+                            party = parties[memberMap["party_code"]]
+                            newV["party"] = party[0]
+                            newV["party_short_name"] = party[3]
                             newV["party_code"] = memberMap["party_code"]
                             newV["state_abbrev"] = memberMap["state_abbrev"]
-                            if os.path.isfile("./static/img/bios/" + str(memberMap["icpsr"]).zfill(6) + ".jpg") or os.path.isfile("../static/img/bios/" + str(memberMap["icpsr"]).zfill(6) + ".jpg"):
-                                newV["img"] = str(
-                                    memberMap["icpsr"]).zfill(6) + ".jpg"
-                            else:
-                                newV["img"] = "silhouette.png"
+                            newV["img"] = bioImageFile(memberMap["icpsr"])
 
                             if memberMap["state_abbrev"] == "USA":
                                 newV["district"] = "POTUS"
@@ -277,61 +334,42 @@ def downloadAPI(rollcall_id, apitype="Web", voterId=0):
                             newV['district_code'] = memberMap['district_code']
                         # Append the new voter to the list of voters.
                         result.append(newV)
+                        if apitype == "Web":
+                            pivotX.append(newV.get("x"))
+                            pivotIcpsr.append(newV["icpsr"])
+                            if newV.get("vote", "Abs") != "Abs":
+                                numVotes += 1
                     else:
                         continue
 
-            # Sort by ideology, and then identify the median and pivots
+            # Identify the median and pivots by ideology
             if apitype == "Web":
-                median = []
-                pivotCopy = [
-                    x for x in result if "x" in x and x["x"] is not None]
-                pivotCopy = sorted(pivotCopy, key=lambda x: x["x"])
-                if len(pivotCopy) % 2:
-                    median = [
-                        pivotCopy[int(math.ceil(len(pivotCopy) / 2)) - 1]["icpsr"]]
-                else:
-                    median = [pivotCopy[
-                        (len(pivotCopy) / 2) - 1]["icpsr"], pivotCopy[(len(pivotCopy) / 2)]["icpsr"]]
-
-                # Filibuster pivot
-                fbPivot = []
-                if rollcall["chamber"] == "Senate" and rollcall["congress"] >= 94 and len(pivotCopy) >= 60:
-                    fbPivot = [pivotCopy[59]["icpsr"],
-                               pivotCopy[len(pivotCopy) - 60]["icpsr"]]
-                # Veto Override pivot
-                numVotes = len(
-                    [x for x in result if "vote" in x and x["vote"] != "Abs"])
-                voPivotNum = int(
-                    math.ceil(float(numVotes) * float(2) / float(3)))
-                voPivot = [pivotCopy[voPivotNum]["icpsr"], pivotCopy[
-                    len(pivotCopy) - voPivotNum - 1]["icpsr"]]
-
-                for i in xrange(len(result)):
-                    if result[i]["icpsr"] in median:
-                        result[i]["flags"] = "median"
-                    if result[i]["icpsr"] in fbPivot:
-                        result[i]["flags"] = "fbPivot"
-                    if result[i]["icpsr"] in voPivot:
-                        result[i]["flags"] = "voPivot"
+                _flagPivots(result, np.array(pivotX, dtype=np.float64), np.array(pivotIcpsr),
+                            numVotes, rollcall["chamber"], rollcall["congress"])
 
             # Top level nominate metadata
-            # Debug code to delete nominate data so we can regenerate it.
-            if "nominate" in rollcall and "slope" in rollcall["nominate"]:
-                del rollcall["nominate"]["slope"]
-            if "nominate" in rollcall and "intercept" in rollcall["nominate"]:
-                del rollcall["nominate"]["intercept"]
-            if "nominate" in rollcall and "x" in rollcall["nominate"]:
-                del rollcall["nominate"]["x"]
-            if "nominate" in rollcall and "y" in rollcall["nominate"]:
-                del rollcall["nominate"]["y"]
-
-            # Generate other nominate fields
-            if "nominate" in rollcall and "mid" in rollcall["nominate"] and "spread" in rollcall["nominate"] and rollcall["nominate"]["spread"][0] is not None:
-                rollcall["nominate"]["slope"], rollcall["nominate"]["intercept"], rollcall["nominate"]["x"], rollcall[
-                    "nominate"]["y"] = add_endpoints(rollcall["nominate"]["mid"], rollcall["nominate"]["spread"])
-            # Ensure everything has at least some nominate field.
-            elif "nominate" not in rollcall:
-                rollcall["nominate"] = {}
+            # Cutting line geometry stored by cuttingLines.py is used if it
+            # was built with the current dimension weight; otherwise delete
+            # it and regenerate it here.
+            storedLine = "nominate" in rollcall and rollcall["nominate"].pop("dimweight", None) == dimWeight and \
+                all(f in rollcall["nominate"] for f in ["slope", "intercept", "x", "y"])
+            if not storedLine:
+                if "nominate" in rollcall and "slope" in rollcall["nominate"]:
+                    del rollcall["nominate"]["slope"]
+                if "nominate" in rollcall and "intercept" in rollcall["nominate"]:
+                    del rollcall["nominate"]["intercept"]
+                if "nominate" in rollcall and "x" in rollcall["nominate"]:
+                    del rollcall["nominate"]["x"]
+                if "nominate" in rollcall and "y" in rollcall["nominate"]:
+                    del rollcall["nominate"]["y"]
+
+                # Generate other nominate fields
+                if "nominate" in rollcall and "mid" in rollcall["nominate"] and "spread" in rollcall["nominate"] and rollcall["nominate"]["spread"][0] is not None:
+                    rollcall["nominate"]["slope"], rollcall["nominate"]["intercept"], rollcall["nominate"]["x"], rollcall[
+                        "nominate"]["y"] = add_endpoints(rollcall["nominate"]["mid"], rollcall["nominate"]["spread"], dimWeight)
+                # Ensure everything has at least some nominate field.
+                elif "nominate" not in rollcall:
+                    rollcall["nominate"] = {}
 
             # Flatten nominate for the R API.
             if apitype in webexportapis:
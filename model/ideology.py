@@ -0,0 +1,131 @@
+""" Ideology histogram and loyalty summaries for the person page.
+
+The person page used to download the whole Web_PI roster of a congress and
+bin it in the browser. Here the roster is turned into NumPy columns once per
+congress and dataset version, and each request only bins, ranks and takes
+medians over those columns.
+"""
+import numpy as np
+from searchMembers import getMembersByCongress
+from searchMeta import datasetVersion
+from lruCache import LRUCache
+
+CHAMBERS = ["House", "Senate", "President"]
+MAX_BINS = 100
+
+columnCache = LRUCache(200)
+
+def congressColumns(congress):
+	""" The Web_PI roster of a congress as NumPy columns, plus the rows themselves by ICPSR. """
+	key = (datasetVersion(), congress)
+	columns = columnCache.get(key)
+	if columns is not None:
+		return columns
+
+	out = getMembersByCongress(congress, "", "Web_PI")
+	rows = out.get("results", [])
+	def column(field, dtype=np.float64):
+		return np.array([row[field] if row.get(field) is not None else np.nan for row in rows], dtype=dtype)
+
+	columns = {
+		"dim1": np.array([row["nominate"].get("dim1", np.nan) if isinstance(row.get("nominate"), dict) else np.nan for row in rows], dtype=np.float64),
+		"party": np.array([row["party_code"] if row.get("party_code") is not None else -1 for row in rows], dtype=np.int64),
+		"chamber": np.array([CHAMBERS.index(row["chamber"]) if row.get("chamber") in CHAMBERS else -1 for row in rows], dtype=np.int64),
+		"votes": column("nvotes_yea_nay"),
+		"against": column("nvotes_against_party"),
+		"abs": column("nvotes_abs"),
+		"members": dict((row["icpsr"], row) for row in rows),
+	}
+	columnCache.set(key, columns)
+	return columns
+
+def median(values):
+	values = values[np.isfinite(values)]
+	return round(float(np.median(values)), 2) if len(values) else None
+
+def loyaltySummary(columns, mask):
+	""" Median votes cast, attendance and party loyalty (both in percent) of the masked members. """
+	votes = columns["votes"][mask]
+	with np.errstate(divide="ignore", invalid="ignore"):
+		attendance = 100 * votes / (votes + columns["abs"][mask])
+		loyalty = 100 * (1 - columns["against"][mask] / votes)
+	return {"members": int(mask.sum()), "votes": median(votes), "attendance": median(attendance), "loyalty": median(loyalty)}
+
+def rank(values, ideal):
+	""" How many of the values are below (more liberal than) ideal, out of how many. """
+	values = values[np.isfinite(values)]
+	return {"below": int((values < ideal).sum()), "total": len(values)}
+
+def ideologyHistogram(congress, chamber="", bins=15, icpsr=None):
+	""" Histogram of first dimension scores in a chamber, with loyalty medians.
+
+	Parameters
+	----------
+	congress: int
+		Congress number
+	chamber: str
+		House, Senate or President; defaults to the member's chamber
+	bins: int
+		Bins per unit of DW-NOMINATE: a score goes in bin floor(dim1 * bins)
+	icpsr: int
+		Optional member to place in the distribution
+
+	Returns
+	-------
+	dict
+		histogram: bins in the chamber with their total and per-party counts
+		loyalty: medians over the chamber and over each party in it; a
+		president is compared with the whole congress
+		member, ranks: the member's row, and how many members of the
+		congress, chamber, and their party in the chamber are more liberal
+	"""
+	try:
+		congress = int(congress)
+		bins = int(bins)
+		icpsr = int(icpsr) if icpsr else None
+	except (ValueError, TypeError):
+		return {"errormessage": "Invalid congress, bins or ICPSR supplied."}
+	if not 0 < bins <= MAX_BINS:
+		return {"errormessage": "bins must be between 1 and %d." % MAX_BINS}
+
+	columns = congressColumns(congress)
+	if not columns["members"]:
+		return {"errormessage": "No members found in this congress."}
+
+	member = columns["members"].get(icpsr) if icpsr else None
+	chamber = (chamber or (member["chamber"] if member else "")).capitalize()
+	if chamber not in CHAMBERS:
+		return {"errormessage": "Invalid chamber provided. Please select House, Senate or President."}
+
+	dim1 = columns["dim1"]
+	scored = np.isfinite(dim1)
+	inChamber = columns["chamber"] == CHAMBERS.index(chamber)
+
+	# Bin the chamber, then count each party in each occupied bin.
+	histMask = inChamber & scored
+	keys = np.floor(dim1[histMask] * bins).astype(np.int64)
+	parties = columns["party"][histMask]
+	occupied, keyIndex = np.unique(keys, return_inverse=True)
+	histogram = [{"key": int(k), "count": 0, "parties": {}} for k in occupied]
+	for party in np.unique(parties):
+		counts = np.bincount(keyIndex[parties == party], minlength=len(occupied))
+		for i in np.flatnonzero(counts):
+			histogram[i]["parties"][str(party)] = int(counts[i])
+			histogram[i]["count"] += int(counts[i])
+
+	# Presidents have no chamber to compare with, so they get the whole congress.
+	if chamber == "President" or (member and member.get("chamber") == "President"):
+		scope = scored
+	else:
+		scope = inChamber & scored
+	loyalty = {"chamber": loyaltySummary(columns, scope),
+		"parties": dict((str(party), loyaltySummary(columns, scope & (columns["party"] == party))) for party in np.unique(columns["party"][scope]))}
+
+	out = {"congress": congress, "chamber": chamber, "bins": bins, "histogram": histogram, "loyalty": loyalty}
+	if member and isinstance(member.get("nominate"), dict) and "dim1" in member["nominate"]:
+		ideal = member["nominate"]["dim1"]
+		inParty = columns["party"] == member.get("party_code")
+		out["member"] = member
+		out["ranks"] = {"congress": rank(dim1, ideal), "chamber": rank(dim1[inChamber], ideal),
+			"partyChamber": rank(dim1[inChamber & inParty], ideal)}
+	return out
@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import OrderedDict
+
+class LRUCache(object):
+	""" Bounded least-recently-used mapping, safe to share between request threads.
+
+	Parameters
+	----------
+	maxSize: int
+		Number of entries to hold before evicting the least recently used one.
+	ttl: int
+		If set, entries expire this many seconds after they were stored.
+	"""
+
+	def __init__(self, maxSize=1000, ttl=None):
+		self.maxSize = maxSize
+		self.ttl = ttl
+		self.data = OrderedDict()
+		self.sizes = {}
+		self.bytes = 0
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, default=None):
+		""" Look up a key, marking it as most recently used. """
+		with self.lock:
+			try:
+				expires, value = self.data.pop(key)
+			except KeyError:
+				self.misses += 1
+				return default
+			if expires is not None and expires < time.time():
+				self.bytes -= self.sizes.pop(key, 0)
+				self.misses += 1
+				return default
+			self.data[key] = (expires, value)
+			self.hits += 1
+			return value
+
+	def set(self, key, value, size=0):
+		""" Insert or replace a key, evicting the oldest entry if we're full.
+		size is the caller's estimate of the entry's memory use, for stats(). """
+		with self.lock:
+			if key in self.data:
+				del self.data[key]
+				self.bytes -= self.sizes.pop(key, 0)
+			elif len(self.data) >= self.maxSize:
+				oldKey, junk = self.data.popitem(last=False)
+				self.bytes -= self.sizes.pop(oldKey, 0)
+			self.data[key] = (time.time() + self.ttl if self.ttl else None, value)
+			if size:
+				self.sizes[key] = size
+				self.bytes += size
+
+	def clear(self):
+		with self.lock:
+			self.data.clear()
+			self.sizes.clear()
+			self.bytes = 0
+
+	def __len__(self):
+		return len(self.data)
+
+	def stats(self):
+		""" Size, memory use and hit rate, for monitoring. """
+		lookups = self.hits + self.misses
+		return {"size": len(self.data), "maxSize": self.maxSize, "ttl": self.ttl, "bytes": self.bytes,
+			"hits": self.hits, "misses": self.misses, "hitRate": round(self.hits / float(lookups), 3) if lookups else 0}
@@ -0,0 +1,208 @@
+""" Resident copy of the members table for the roster endpoints.
+
+The congress, party and ideology pages fetch whole rosters
+(getmembersbycongress, getmembersbyparty), and each call used to query
+Mongo, count the result, and derive the state name, party names and
+colours, image file and slug row by row. The table is small enough to keep
+in memory, so every worker loads it once, derives the display fields once,
+and indexes the rows by congress, chamber, party and ICPSR. The directory
+is reloaded when a new data load lands (see searchMeta.datasetVersion).
+
+Only the roster APIs are served from here; lookup() returns None for
+anything else and the caller falls back to memberLookup.
+"""
+import json
+import time
+import threading
+import pymongo
+from stateHelper import stateName
+from searchParties import partySnapshot
+from slugify import slugify
+from bioImages import bioImageFile
+from searchMeta import datasetVersion
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+# Fields returned by each roster API, as in memberLookup's field sets.
+API_FIELDS = {
+	"Web_PI": ["nominate.dim1", "party_code", "district_code", "icpsr", "chamber", "nvotes_yea_nay", "nvotes_against_party", "nvotes_abs"],
+	"Web_Congress": ["bioname", "party_code", "icpsr", "state_abbrev", "congress", "minElected", "nominate.dim1", "nominate.dim2", "congresses", "elected_senate", "elected_house"],
+	"Web_Party": ["bioname", "party_code", "icpsr", "state_abbrev", "congress", "minElected", "nominate.dim1", "nominate.dim2", "congresses", "chamber"],
+}
+
+MISSING = object()
+
+class Member(object):
+	""" One member-congress row, with its display fields already derived. """
+	__slots__ = ["icpsr", "congress", "chamber", "bioname", "party_code", "state_abbrev", "district_code", "nominate",
+		"congresses", "minElected", "elected_senate", "elected_house", "nvotes_yea_nay", "nvotes_against_party", "nvotes_abs",
+		"state", "party_name", "party_noun", "party_color", "party_short_name", "bioImgURL", "seo_name"]
+	stored = __slots__[:15]
+
+	def __init__(self, doc, parties):
+		for field in self.stored:
+			setattr(self, field, doc.get(field, MISSING))
+		if isinstance(self.nominate, dict):
+			self.nominate = dict((k, v) for k, v in self.nominate.iteritems() if k in ("dim1", "dim2"))
+		else:
+			self.nominate = MISSING
+
+		self.state = stateName(self.state_abbrev) if self.state_abbrev is not MISSING else None
+		if self.party_code is not MISSING:
+			self.party_name, self.party_noun, self.party_color, self.party_short_name = parties.lookup(self.party_code)
+		self.bioImgURL = bioImageFile(self.icpsr)
+		try:
+			self.seo_name = slugify(self.bioname) if self.bioname is not MISSING else None
+		except:
+			self.seo_name = None
+
+	def asDict(self, fields):
+		""" The row as memberLookup would return it with these fields. """
+		row = {}
+		for field in fields:
+			if field.startswith("nominate."):
+				if self.nominate is not MISSING:
+					nominate = row.setdefault("nominate", {})
+					key = field.split(".", 1)[1]
+					if key in self.nominate:
+						nominate[key] = self.nominate[key]
+				continue
+			value = getattr(self, field)
+			if value is not MISSING:
+				row[field] = value
+
+		if "state_abbrev" in row:
+			row["state"] = self.state
+		if "party_code" in row:
+			row["party_name"] = self.party_name
+			row["party_noun"] = self.party_noun
+			row["party_color"] = self.party_color
+			row["party_short_name"] = self.party_short_name
+		row["bioImgURL"] = self.bioImgURL
+		if "bioname" in row and self.seo_name is not None:
+			row["seo_name"] = self.seo_name
+		return row
+
+def buildDirectory():
+	""" Load every member row, newest congress first, and index them. """
+	start = time.time()
+	projection = dict([(f, 1) for f in Member.stored] + [("_id", 0)])
+	parties = partySnapshot()
+	rows = []
+	for doc in db.voteview_members.find({}, projection).sort('congress', -1):
+		if "icpsr" in doc and "congress" in doc:
+			rows.append(Member(doc, parties))
+
+	byCongress = {}
+	byCongressChamber = {}
+	byParty = {}
+	byPartyCongress = {}
+	byIcpsr = {}
+	for row in rows:
+		byCongress.setdefault(row.congress, []).append(row)
+		byCongressChamber.setdefault((row.congress, row.chamber), []).append(row)
+		byIcpsr.setdefault(row.icpsr, []).append(row)
+		if row.party_code is not MISSING:
+			byParty.setdefault(row.party_code, []).append(row)
+			byPartyCongress.setdefault((row.party_code, row.congress), []).append(row)
+
+	print "Loaded", len(rows), "member rows in", round(time.time() - start, 2), "s"
+	return {"rows": rows, "byCongress": byCongress, "byCongressChamber": byCongressChamber,
+		"byParty": byParty, "byPartyCongress": byPartyCongress, "byIcpsr": byIcpsr}
+
+directory = {"version": MISSING, "data": None}
+loadLock = threading.Lock()
+
+def loadDirectory(force=0):
+	""" Current directory, reloaded when the dataset version changes. While
+	one thread reloads, the others get None and fall back to Mongo rather
+	than serve rows from the previous data load. """
+	global directory
+
+	version = datasetVersion()
+	if not force and version == directory["version"]:
+		return directory["data"]
+	if not loadLock.acquire(force or directory["data"] is None):
+		return None
+	try:
+		if force or version != directory["version"]:
+			directory = {"version": version, "data": buildDirectory()}
+	finally:
+		loadLock.release()
+	return directory["data"]
+
+def lookup(qDict, maxResults, distinct, api):
+	""" Serve a roster query the way memberLookup would.
+
+	Parameters
+	----------
+	qDict: dict
+		congress, and either chamber or party_code
+	maxResults: int
+		Cap on returned rows
+	distinct: int
+		1 to return only each member's most recent row
+	api: str
+		One of the roster APIs in API_FIELDS
+
+	Returns
+	-------
+	dict
+		The memberLookup response, or None if the directory can't answer.
+	"""
+	if api not in API_FIELDS or not set(qDict) <= set(["congress", "chamber", "party_code"]):
+		return None
+	try:
+		congress = int(qDict["congress"]) if qDict.get("congress") else 0
+		party = int(qDict["party_code"]) if qDict.get("party_code") else 0
+	except (ValueError, TypeError):
+		return None
+	chamber = qDict.get("chamber", "").capitalize()
+	if chamber not in ("", "House", "Senate") or not (congress or party):
+		return None
+
+	data = loadDirectory()
+	if data is None:
+		return None
+	if party and congress:
+		rows = data["byPartyCongress"].get((party, congress), [])
+	elif party:
+		rows = data["byParty"].get(party, [])
+	elif chamber:
+		rows = data["byCongressChamber"].get((congress, chamber), [])
+	else:
+		rows = data["byCongress"].get(congress, [])
+	if party and chamber:
+		rows = [row for row in rows if row.chamber == chamber]
+
+	if len(rows) > 1000 and api != "Web_Party":
+		return {"errormessage": "Too many results found."}
+
+	fields = API_FIELDS[api]
+	if api == "Web_Congress" and chamber:
+		fields = [f for f in fields if not f.startswith("elected_")] + ["elected_" + chamber.lower()]
+
+	response = []
+	seen = set()
+	for row in rows:
+		if distinct == 1:
+			if row.icpsr in seen:
+				continue
+			seen.add(row.icpsr)
+		response.append(row.asDict(fields))
+		if len(response) >= maxResults:
+			break
+
+	if not response:
+		return {'errormessage': 'No members found matching your search query.', 'query': qDict}
+	return {'results': response}
+
+loadDirectory(force=1)
@@ -0,0 +1,184 @@
+""" Materialized per-member vote history.
+
+The person page's vote table needs, for each of a member's rollcalls, their
+cast code and probability and how their party voted. Those used to be worked
+out on every page by reading rollcalls and summing party_vote_counts. This
+module stores one record per (icpsr, rollcall):
+
+	icpsr, dcr (the rollcall's date_chamber_rollnumber), id, congress,
+	cast_code, prob, party_code, yea, nay, abs, pVSum, partyLabelVote
+
+in voteview_member_votes, indexed on (icpsr, dcr) so a member's votes can be
+read or paged in date order straight off the index (searchVotes.memberVotePage
+pages the person page's unfiltered vote table this way).
+
+Build everything once with
+
+	python memberVotes.py build
+
+and after each hourly patch rebuild only the congresses it touched
+(DEPLOY_HOURLY does this) with
+
+	python memberVotes.py patch <oplog directory>
+"""
+import sys
+import time
+import json
+import pymongo
+from castCodes import _get_yeanayabs, _get_pairedvote
+from patchOplog import touchedIds
+from searchMeta import datasetVersion
+from lruCache import LRUCache
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+BATCH_SIZE = 10000
+
+# (dataset version, rollcall id, party code) -> partyVoteSummary, for rollcalls read live.
+positionCache = LRUCache(50000)
+
+def partyVoteSummary(partyVote):
+	""" How a party voted on a rollcall, from its party_vote_counts entry
+	(cast code -> count). pVSum is yeas minus nays; partyLabelVote is the
+	majority position, or N/A without counts. """
+	try:
+		if partyVote is not None:
+			yea = sum([v for k, v in partyVote.iteritems() if int(k)<=3])
+			nay = sum([v for k, v in partyVote.iteritems() if int(k)>3 and int(k)<=6])
+			absent = sum([v for k, v in partyVote.iteritems() if int(k)>6])
+			pVSum = yea - nay
+			return {"yea": yea, "nay": nay, "abs": absent, "pVSum": pVSum,
+				"partyLabelVote": "Yea" if pVSum>0 else "Nay" if pVSum<0 else "Tie"}
+	except:
+		print "Error calculating party vote."
+	return {"pVSum": 0, "partyLabelVote": "N/A"}
+
+def partyPositions(counts):
+	""" partyVoteSummary for every party in a rollcall's party_vote_counts, keyed by party code. """
+	return dict((party, partyVoteSummary(partyVote)) for party, partyVote in (counts or {}).iteritems())
+
+def partyPosition(rollcallId, party_code, counts):
+	""" partyVoteSummary of one party on one rollcall, worked out once per dataset version.
+	counts is the rollcall's party_vote_counts, used on a miss. """
+	key = (datasetVersion(), rollcallId, party_code)
+	position = positionCache.get(key)
+	if position is None:
+		position = partyVoteSummary((counts or {}).get(str(party_code)))
+		positionCache.set(key, position)
+	return position
+
+def ensureIndexes():
+	db.voteview_member_votes.create_index([("icpsr", 1), ("dcr", -1)], name="memberVotesIndex")
+	db.voteview_member_votes.create_index([("congress", 1), ("built", 1)], name="memberVotesBuildIndex")
+	db.voteview_member_votes_meta.create_index("congress", unique=True)
+
+def buildCongress(congress, stamp):
+	""" (Re)write the records of one congress. New records are written before
+	the old ones are removed, so readers never see the congress empty. """
+	parties = dict((m["icpsr"], m.get("party_code")) for m in
+		db.voteview_members.find({"congress": congress}, {"icpsr": 1, "party_code": 1, "_id": 0}))
+	fields = {"id": 1, "date_chamber_rollnumber": 1, "votes": 1, "party_vote_counts": 1, "_id": 0}
+
+	noPosition = partyVoteSummary(None)
+	batch = []
+	rollcalls = 0
+	for rollcall in db.voteview_rollcalls.find({"congress": congress}, fields).batch_size(100):
+		rollcalls += 1
+		positions = partyPositions(rollcall.get("party_vote_counts"))
+		for v in rollcall.get("votes", []):
+			party = parties.get(v["icpsr"])
+			record = {"icpsr": v["icpsr"], "dcr": rollcall["date_chamber_rollnumber"], "id": rollcall["id"], "congress": congress,
+				"cast_code": v["cast_code"], "party_code": party, "built": stamp}
+			if "prob" in v:
+				record["prob"] = v["prob"]
+			record.update(positions.get(str(party), noPosition))
+			batch.append(record)
+			if len(batch) >= BATCH_SIZE:
+				db.voteview_member_votes.insert_many(batch, ordered=False)
+				batch = []
+	if batch:
+		db.voteview_member_votes.insert_many(batch, ordered=False)
+
+	db.voteview_member_votes.delete_many({"congress": congress, "built": {"$ne": stamp}})
+	db.voteview_member_votes_meta.replace_one({"congress": congress}, {"congress": congress, "rollcalls": rollcalls, "built": stamp}, upsert=True)
+	return rollcalls
+
+def buildMemberVotes(congresses=None):
+	""" Rebuild the given congresses, or every congress with rollcalls. """
+	start = time.time()
+	ensureIndexes()
+	if congresses is None:
+		congresses = db.voteview_rollcalls.distinct("congress")
+	stamp = time.time()
+	for congress in sorted(congresses):
+		rollcalls = buildCongress(congress, stamp)
+		print "Congress", congress, ":", rollcalls, "rollcalls"
+	print "Rebuilt", len(congresses), "congresses in", round(time.time() - start, 1), "s"
+
+def staleCongresses():
+	""" Congresses whose rollcall count no longer matches the last build:
+	new congresses, and ones that lost rollcalls (deletes in the oplog only
+	carry an _id, so we can't tell their congress directly). """
+	built = dict((m["congress"], m["rollcalls"]) for m in db.voteview_member_votes_meta.find({}, {"congress": 1, "rollcalls": 1, "_id": 0}))
+	current = dict((c["_id"], c["n"]) for c in db.voteview_rollcalls.aggregate([{"$group": {"_id": "$congress", "n": {"$sum": 1}}}]))
+	return set(c for c in set(built) | set(current) if built.get(c) != current.get(c, 0))
+
+def patchCongresses(oplogDir):
+	""" Congresses whose rollcalls or member records the patch changed. None means rebuild everything. """
+	touched = touchedIds(oplogDir, ["voteview_rollcalls", "voteview_members"])
+	if any(t["dropped"] for t in touched.itervalues()):
+		return None
+	congresses = set()
+	for collection in touched:
+		ids = list(touched[collection]["ids"])
+		for i in xrange(0, len(ids), BATCH_SIZE):
+			for doc in db[collection].find({"_id": {"$in": ids[i:i + BATCH_SIZE]}}, {"congress": 1, "_id": 0}):
+				if "congress" in doc:
+					congresses.add(doc["congress"])
+	return congresses | staleCongresses()
+
+def lookupVotes(icpsr, dcrs, party_code):
+	""" A member's stored votes on the given rollcalls (by date_chamber_rollnumber),
+	keyed by rollcall id, shaped like downloadVotes.downloadMemberVotes rows plus
+	the party summary. Rows recorded under a different party (the member switched)
+	are left out, since the person page compares against their current party. """
+	results = {}
+	dcrs = [d for d in dcrs if d is not None]
+	if not dcrs:
+		return results
+	return recordVotes(db.voteview_member_votes.find({"icpsr": int(icpsr), "dcr": {"$in": dcrs}}, {"_id": 0, "built": 0}), party_code)
+
+def recordVotes(records, party_code):
+	""" lookupVotes rows, keyed by rollcall id, for stored records already read. """
+	results = {}
+	for record in records:
+		if record.get("party_code") != party_code:
+			continue
+		row = {"vote": _get_yeanayabs(record["cast_code"]), "paired_flag": _get_pairedvote(record["cast_code"])}
+		if "prob" in record:
+			try:
+				row["prob"] = int(round(record["prob"]))
+			except:
+				row["prob"] = 0
+		for key in ["yea", "nay", "abs", "pVSum", "partyLabelVote"]:
+			if key in record:
+				row[key] = record[key]
+		results[record["id"]] = row
+	return results
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "build":
+		buildMemberVotes()
+	elif len(sys.argv) > 2 and sys.argv[1] == "patch":
+		congresses = patchCongresses(sys.argv[2])
+		buildMemberVotes(congresses)
+	else:
+		print "Usage: python memberVotes.py build | patch <oplog directory>"
@@ -0,0 +1,106 @@
+""" On-disk numpy indexes shared by the phrase and rollcall indexes.
+
+An index is a directory of .npy arrays plus a meta.json. Each build writes a
+fresh directory next to the index path and then repoints a symlink at it, so
+a worker reading the index sees either the whole old build or the whole new
+one, never a mix. Workers memory-map the arrays and check the symlink every
+so often for a new build.
+
+	phrase_index -> phrase_index.3m9Xq2/
+	                  meta.json
+	                  postings.npy
+"""
+import os
+import glob
+import time
+import json
+import shutil
+import tempfile
+import numpy as np
+
+def writeIndex(indexDir, meta, arrays):
+	""" Write a build and swap it in as indexDir.
+
+	Parameters
+	----------
+	indexDir: str
+		Path workers load the index from; becomes a symlink to the new build
+	meta: dict
+		JSON-serializable metadata, written to meta.json
+	arrays: list
+		(name, numpy array) pairs, written to <name>.npy
+	"""
+	parent, base = os.path.split(os.path.abspath(indexDir))
+	if not os.path.isdir(parent):
+		os.makedirs(parent)
+	parent = os.path.realpath(parent)
+	indexDir = os.path.join(parent, base)
+
+	buildDir = tempfile.mkdtemp(prefix=base + ".", dir=parent)
+	for name, values in arrays:
+		np.save(os.path.join(buildDir, name + ".npy"), values)
+	meta = dict(meta, arrays=[name for name, values in arrays])
+	with open(os.path.join(buildDir, "meta.json"), "w") as f:
+		json.dump(meta, f)
+	os.chmod(buildDir, 0755)
+
+	previous = os.path.realpath(indexDir) if os.path.islink(indexDir) else None
+	if os.path.isdir(indexDir) and not os.path.islink(indexDir):
+		# An index from before builds were swapped in; move it out of the way
+		# so it is cleaned up with the other old builds.
+		os.rename(indexDir, tempfile.mkdtemp(prefix=base + ".", dir=parent) + "/old")
+
+	# rename() over an existing symlink is atomic, so build a new link beside it first.
+	link = indexDir + ".link"
+	if os.path.lexists(link):
+		os.remove(link)
+	os.symlink(os.path.basename(buildDir), link)
+	os.rename(link, indexDir)
+
+	# Keep the build just replaced, since workers may still be reading it, and drop older ones.
+	for path in glob.glob(os.path.join(parent, base + ".*")):
+		if os.path.isdir(path) and not os.path.islink(path) and path not in (buildDir, previous):
+			shutil.rmtree(path, ignore_errors=True)
+
+class MappedIndex(object):
+	""" The current build of an index, reloaded when a new one is swapped in.
+
+	decode(meta, arrays) turns the build's meta.json and its memory-mapped
+	arrays (by name) into whatever the index module searches. """
+
+	def __init__(self, indexDir, decode, checkInterval=60):
+		self.indexDir = indexDir
+		self.decode = decode
+		self.checkInterval = checkInterval
+		self.state = {"build": None, "checked": 0, "data": None}
+
+	def load(self, force=0):
+		""" Current index, or None if it hasn't been built. The symlink and
+		meta.json mtime are only checked once every checkInterval seconds. """
+		now = time.time()
+		if not force and now - self.state["checked"] < self.checkInterval:
+			return self.state["data"]
+
+		# Resolve the link once so every file comes from the same build.
+		buildDir = os.path.realpath(self.indexDir)
+		metaFile = os.path.join(buildDir, "meta.json")
+		try:
+			build = (buildDir, os.stat(metaFile).st_mtime)
+		except OSError:
+			self.state = {"build": None, "checked": now, "data": None}
+			return None
+
+		if force or build != self.state["build"]:
+			try:
+				meta = json.load(open(metaFile, "r"))
+				arrays = dict((name, np.load(os.path.join(buildDir, name + ".npy"), mmap_mode="r")) for name in meta["arrays"])
+				data = self.decode(meta, arrays)
+			except (IOError, OSError, ValueError, KeyError):
+				# Most likely the build was replaced while we read it; keep
+				# what we have and look again at the next check.
+				self.state["checked"] = now
+				return self.state["data"]
+			self.state = {"build": build, "checked": now, "data": data}
+		else:
+			self.state["checked"] = now
+		return self.state["data"]
@@ -0,0 +1,248 @@
+""" In-memory trigram index over member names, for typo-tolerant member search.
+
+Name searches used to run a $text query, fall back to an unanchored bioname
+regex (a collection scan) when that found nothing, and then rescore every row
+with two fuzzy string comparisons. This index ranks members directly.
+
+Every distinct word of every bioname is split into padded trigrams, and two
+words are as similar as the Dice coefficient of their trigram sets. Words that
+the nickname list maps to the same name ("bill", "william") match fully. A
+member's score is the mean, over the words searched for, of the best match
+among the words of their name, on a 0-100 scale: searching for words that all
+appear in the name scores 100, like the old token set ratio did.
+
+The index is built from voteview_members when a worker starts and rebuilt when
+the collection changes.
+"""
+import os
+import re
+import sys
+import time
+import json
+import threading
+import unicodedata
+import pymongo
+import numpy as np
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+NICKNAME_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nicknames.json")
+CHECK_INTERVAL = 60 # Seconds between checks of the member count.
+REBUILD_INTERVAL = 3600 # Rebuild at least this often, in case names changed but the count didn't.
+MIN_SCORE = 40 # Low enough for one typo or swapped pair of letters in a surname.
+MAX_WORDS = 6
+MAX_NICKNAME_GROUP = 16 # Above the largest group in the list (15 names, margaret and elizabeth).
+
+wordRe = re.compile(r"[a-z0-9]+")
+
+def loadNicknames():
+	""" Map each name in the nickname list to the representative of its group.
+
+	Nicknames are ambiguous ("ron" is listed for Aaron, Cameron, Ronald and
+	Veronica), so plain connected components of the list run together into
+	one group of hundreds of names. Instead each nickname joins the group of
+	one name it is listed for: the one it is paired with most often, then the
+	one with the most nicknames of its own, then the first in the file. The
+	name it joins must list more nicknames than it does, so chains such as
+	billy -> bill -> william end at the most formal name, which represents the
+	group. A group stops taking nicknames once it has MAX_NICKNAME_GROUP names.
+	"""
+	try:
+		pairs = json.load(open(NICKNAME_FILE, "r"))
+	except (IOError, ValueError):
+		return {}
+	pairs = [(pair["name"].lower(), pair["nickname"].lower()) for pair in pairs]
+	pairs = [(name, nickname) for name, nickname in pairs if name != nickname]
+	pairCount = {}
+	nicknames = {}
+	for position, (name, nickname) in enumerate(pairs):
+		count, first = pairCount.get((name, nickname), (0, position))
+		pairCount[(name, nickname)] = (count + 1, first)
+		nicknames.setdefault(name, set()).add(nickname)
+	formality = lambda x: len(nicknames.get(x, ()))
+
+	parent = {}
+	for name, nickname in pairs:
+		if formality(name) <= formality(nickname):
+			continue
+		count, first = pairCount[(name, nickname)]
+		best = parent.get(nickname)
+		if best is None or (count, formality(name), -first) > (pairCount[(best, nickname)][0], formality(best), -pairCount[(best, nickname)][1]):
+			parent[nickname] = name
+
+	def root(x):
+		while x in parent:
+			x = parent[x]
+		return x
+
+	# Attach names to their groups in order of formality, so a group that is
+	# already full turns away the least formal names.
+	canon = {}
+	groupSize = {}
+	for name in sorted(set(x for pair in pairs for x in pair), key=lambda x: (-formality(x), x)):
+		top = root(name)
+		if groupSize.get(top, 0) >= MAX_NICKNAME_GROUP:
+			top = name
+		groupSize[top] = groupSize.get(top, 0) + 1
+		canon[name] = top
+	return canon
+
+nicknameCanon = loadNicknames()
+
+def nameWords(text):
+	""" Lowercase ASCII words of a name, with accents and punctuation dropped. """
+	if isinstance(text, str):
+		text = text.decode("utf-8", "ignore")
+	text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore")
+	return wordRe.findall(text.lower())
+
+def trigrams(word):
+	padded = "  " + word + " "
+	return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+def buildIndex():
+	""" Index every distinct (icpsr, bioname) pair in voteview_members. """
+	start = time.time()
+	seen = set()
+	entryIcpsr = []
+	entryWords = []
+	vocab = {}
+	for member in db.voteview_members.find({"bioname": {"$exists": True}}, {"icpsr": 1, "bioname": 1, "_id": 0}):
+		if not member.get("bioname") or "icpsr" not in member:
+			continue
+		key = (member["icpsr"], member["bioname"])
+		if key in seen:
+			continue
+		seen.add(key)
+		words = set(nameWords(member["bioname"]))
+		if not words:
+			continue
+		entryIcpsr.append(member["icpsr"])
+		entryWords.append(sorted(vocab.setdefault(word, len(vocab)) for word in words))
+
+	words = [None] * len(vocab)
+	for word, wordId in vocab.iteritems():
+		words[wordId] = word
+
+	# Trigram -> ids of the words containing it.
+	postings = {}
+	trigramCount = np.zeros(len(words), dtype=np.float32)
+	for wordId, word in enumerate(words):
+		grams = trigrams(word)
+		trigramCount[wordId] = len(grams)
+		for gram in grams:
+			postings.setdefault(gram, []).append(wordId)
+	postings = dict((gram, np.array(ids, dtype=np.int32)) for gram, ids in postings.iteritems())
+
+	# Words in the same nickname group share a canon id; others get their own.
+	canonIds = {}
+	wordCanon = np.array([canonIds.setdefault(nicknameCanon.get(word, word), len(canonIds)) for word in words], dtype=np.int32)
+
+	# Flattened (entry, word) pairs, grouped by entry, so the best word per
+	# entry is one maximum.reduceat.
+	pairStart = np.zeros(len(entryWords), dtype=np.int64)
+	offset = 0
+	for i, ids in enumerate(entryWords):
+		pairStart[i] = offset
+		offset += len(ids)
+	pairWord = np.fromiter((wordId for ids in entryWords for wordId in ids), dtype=np.int32, count=offset)
+
+	print "Indexed", len(entryIcpsr), "member names,", len(words), "words in", round(time.time() - start, 2), "s"
+	return {"vocab": vocab, "postings": postings, "trigramCount": trigramCount, "canonIds": canonIds, "wordCanon": wordCanon,
+		"pairStart": pairStart, "pairWord": pairWord, "entryIcpsr": np.array(entryIcpsr, dtype=np.int64)}
+
+index = {"count": None, "built": 0, "checked": 0, "data": None}
+buildLock = threading.Lock()
+
+def loadIndex(force=0):
+	""" Current index, or None if there are no members to index. The member
+	count is only checked once every CHECK_INTERVAL seconds; one thread
+	rebuilds while the others keep serving the previous index. """
+	global index
+
+	now = time.time()
+	if not force and now - index["checked"] < CHECK_INTERVAL:
+		return index["data"]
+	if not buildLock.acquire(force):
+		return index["data"]
+	try:
+		index["checked"] = now
+		try:
+			count = db.voteview_members.count()
+		except pymongo.errors.PyMongoError:
+			return index["data"]
+		if force or count != index["count"] or now - index["built"] >= REBUILD_INTERVAL:
+			data = buildIndex() if count else None
+			index = {"count": count, "built": now, "checked": now, "data": data}
+	finally:
+		buildLock.release()
+	return index["data"]
+
+def wordSimilarity(data, word):
+	""" Similarity of one searched word to every indexed word, from 0 to 1. """
+	grams = trigrams(word)
+	shared = np.zeros(len(data["trigramCount"]), dtype=np.float32)
+	for gram in grams:
+		if gram in data["postings"]:
+			shared[data["postings"][gram]] += 1
+	similarity = 2 * shared / (len(grams) + data["trigramCount"])
+	canonId = data["canonIds"].get(nicknameCanon.get(word, word))
+	if canonId is not None:
+		similarity[data["wordCanon"] == canonId] = 1
+	return similarity
+
+def search(name, k=200, minScore=MIN_SCORE):
+	""" Best matching members for a name.
+
+	Parameters
+	----------
+	name: str
+		The name searched for, in any order ("Lyndon Johnson", "johnson, lyndon")
+	k: int
+		Maximum number of members to return, or None for all of them
+	minScore: int
+		Drop members scoring below this
+
+	Returns
+	-------
+	list
+		(icpsr, score) pairs, best first; ties go to the higher ICPSR.
+		None if the index isn't available.
+	"""
+	data = loadIndex()
+	if data is None:
+		return None
+	words = list(set(nameWords(name)))[:MAX_WORDS]
+	if not words or not len(data["entryIcpsr"]):
+		return []
+
+	total = np.zeros(len(data["entryIcpsr"]), dtype=np.float32)
+	for word in words:
+		similarity = wordSimilarity(data, word)
+		total += np.maximum.reduceat(similarity[data["pairWord"]], data["pairStart"])
+	scores = np.rint(100 * total / len(words)).astype(np.int64)
+
+	matched = np.flatnonzero(scores >= minScore)
+	icpsrs = data["entryIcpsr"][matched]
+	scores = scores[matched]
+	order = np.lexsort((-icpsrs, -scores))
+	# A member with several spellings of their name keeps the best one.
+	icpsrs, first = np.unique(icpsrs[order], return_index=True)
+	best = order[np.sort(first)]
+	if k is not None:
+		best = best[:k]
+	return [(int(icpsr), int(score)) for icpsr, score in zip(data["entryIcpsr"][matched][best], scores[best])]
+
+loadIndex(force=1)
+
+if __name__ == "__main__":
+	for name in sys.argv[1:] or ["johnson"]:
+		print name, ":", search(name, 10)
@@ -0,0 +1,72 @@
+""" What an hourly patch changed, read from the mongo oplog it ships.
+
+DEPLOY_HOURLY replays hourly_patch/oplogRestore/ with mongorestore. Anything
+derived from the database at build time (the member vote store, cached
+payloads) only needs redoing for the documents that oplog touched.
+"""
+import os
+import glob
+import bson
+
+def oplogEntries(oplogDir):
+	""" Every entry of the .bson oplog files in oplogDir, in file order. """
+	for path in sorted(glob.glob(os.path.join(oplogDir, "*.bson"))):
+		with open(path, "rb") as f:
+			for entry in bson.decode_file_iter(f):
+				yield entry
+
+def recordEntry(touched, entry):
+	""" Adds what one oplog entry did to touched (see touchedIds). """
+	op = entry.get("op")
+	body = entry.get("o", {})
+	if op == "c":
+		# Transactions and batched writes arrive as one applyOps command
+		# holding ordinary i/u/d (or nested command) entries.
+		if "applyOps" in body:
+			for inner in body["applyOps"]:
+				recordEntry(touched, inner)
+			return
+		# Other commands are logged against "<db>.$cmd" and name their collection
+		# in the body, either bare ("drop") or as a full namespace ("renameCollection").
+		for value in body.values():
+			if isinstance(value, basestring) and value.split(".", 1)[-1] in touched:
+				touched[value.split(".", 1)[-1]]["dropped"] = True
+		return
+
+	collection = entry.get("ns", "").split(".", 1)[-1]
+	if collection not in touched:
+		return
+	if op == "i":
+		touched[collection]["ids"].add(body.get("_id"))
+	elif op == "u":
+		touched[collection]["ids"].add(entry.get("o2", {}).get("_id"))
+	elif op == "d":
+		touched[collection]["deleted"].add(body.get("_id"))
+
+def touchedIds(oplogDir, collections):
+	""" The _ids each collection's inserts, updates and deletes touched.
+
+	Parameters
+	----------
+	oplogDir: str
+		Directory holding the patch's oplog.bson
+	collections: list
+		Collection names to report on, e.g. ["voteview_rollcalls"]
+
+	Returns
+	-------
+	dict
+		For each collection: "ids", the _ids inserted or updated (look them
+		up after the replay to see their new contents); "deleted", the _ids
+		removed; and "dropped", true if a command such as a drop or rename
+		hit the whole collection, in which case everything derived from it
+		should be rebuilt.
+	"""
+	touched = dict((c, {"ids": set(), "deleted": set(), "dropped": False}) for c in collections)
+	for entry in oplogEntries(oplogDir):
+		recordEntry(touched, entry)
+
+	for collection in touched.itervalues():
+		collection["ids"].discard(None)
+		collection["deleted"].discard(None)
+	return touched
@@ -0,0 +1,158 @@
+""" Finished "Web" rollcall payloads, stored between hourly patches.
+
+A rollcall's Web payload (voters with names, parties, districts, ideal
+points and pivot flags, plus cutting line endpoints and description) only
+changes when the hourly patch touches the rollcall or its members, yet
+downloadAPI used to rebuild it on every rollcall page and chart load. Here
+each rollcall's entry of downloadAPI(..., "Web")["rollcalls"] is stored
+JSON-encoded in voteview_rollcall_payloads, with
+
+	id, oid (the rollcall's _id), congress, chamber, built,
+	dimweight, bios, payload
+
+It is filled on demand, or in bulk with
+
+	python payloadStore.py build [congress ...]
+
+and after each hourly patch DEPLOY_HOURLY drops the payloads of whatever
+the oplog touched with
+
+	python payloadStore.py patch <oplog directory>
+
+A stored payload is only used if it was built with the current second
+dimension weight (cutting lines depend on it) and bio photo directory
+(voters' img fields do).
+"""
+import sys
+import time
+import json
+import pymongo
+from searchMeta import currentDimweight
+from bioImages import refreshManifest
+from patchOplog import touchedIds
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+# downloadVotes loads the member name index and directory at import (through
+# searchMembers), so it is imported only where payloads are built: "patch"
+# runs just drop payloads and shouldn't pay for those scans.
+
+API_VERSION = "Web 2016-10" # As reported by downloadAPI for the Web API.
+MAX_VOTES = 100 # downloadAPI's limit for the Web API.
+BATCH_SIZE = 100
+
+def stamp():
+	""" What a stored payload must have been built with to still be current. """
+	return {"dimweight": currentDimweight(), "bios": refreshManifest()["mtime"]}
+
+def ensureIndexes():
+	db.voteview_rollcall_payloads.create_index("id", unique=True)
+	db.voteview_rollcall_payloads.create_index("oid")
+	db.voteview_rollcall_payloads.create_index([("congress", 1), ("chamber", 1)])
+
+def storePayloads(rollcall_ids):
+	""" Assemble the Web payloads of the given rollcalls and store them.
+	Returns the encoded payloads by rollcall id; IDs that don't exist are left out. """
+	from downloadVotes import downloadAPI
+	current = stamp()
+	built = {}
+	for i in xrange(0, len(rollcall_ids), BATCH_SIZE):
+		batch = rollcall_ids[i:i + BATCH_SIZE]
+		oids = dict((r["id"], r["_id"]) for r in db.voteview_rollcalls.find({"id": {"$in": batch}}, {"id": 1}))
+		for rollcall in downloadAPI(batch, "Web").get("rollcalls", []):
+			if rollcall["id"] not in oids:
+				continue
+			payload = json.dumps(rollcall)
+			record = {"id": rollcall["id"], "oid": oids[rollcall["id"]], "congress": rollcall.get("congress"),
+				"chamber": rollcall.get("chamber"), "built": time.time(), "payload": payload}
+			record.update(current)
+			db.voteview_rollcall_payloads.replace_one({"id": rollcall["id"]}, record, upsert=True)
+			built[rollcall["id"]] = payload
+	return built
+
+def rollcallPayloads(rollcall_ids):
+	""" Encoded Web payloads of the given rollcalls by id, read from the
+	store and built for any that are missing or stale. """
+	current = stamp()
+	found = {}
+	for record in db.voteview_rollcall_payloads.find({"id": {"$in": rollcall_ids}}, {"id": 1, "payload": 1, "dimweight": 1, "bios": 1, "_id": 0}):
+		if all(record.get(k) == v for k, v in current.iteritems()):
+			found[record["id"]] = record["payload"]
+	missing = [rid for rid in rollcall_ids if rid not in found]
+	if missing:
+		found.update(storePayloads(missing))
+	return found
+
+def splitIds(rollcall_id):
+	""" Rollcall IDs from a list or comma separated string, as downloadAPI takes them. """
+	if type(rollcall_id) == type([""]):
+		return rollcall_id
+	return [x.strip() for x in rollcall_id.split(",")]
+
+def webResponse(rollcall_id):
+	""" The JSON text downloadAPI(rollcall_id, "Web") would produce, served
+	from stored payloads. Requests the store can't answer whole (unknown or
+	repeated IDs, too many IDs) go to downloadAPI for its error handling. """
+	start = time.time()
+	rollcall_ids = splitIds(rollcall_id) if rollcall_id else []
+	if 0 < len(rollcall_ids) <= MAX_VOTES and len(set(rollcall_ids)) == len(rollcall_ids):
+		payloads = rollcallPayloads(rollcall_ids)
+		if len(payloads) == len(rollcall_ids):
+			return '{"rollcalls": [%s], "apitype": %s, "elapsedTime": %s}' % (
+				", ".join(payloads[rid] for rid in sorted(rollcall_ids)), json.dumps(API_VERSION), round(time.time() - start, 3))
+	from downloadVotes import downloadAPI
+	return json.dumps(downloadAPI(rollcall_id, "Web"))
+
+def invalidate(oplogDir):
+	""" Drop the stored payloads of rollcalls the patch touched: rollcalls
+	inserted, updated or deleted, every rollcall in the congress and chamber
+	of a member record that changed, and everything if parties changed or a
+	collection was dropped. Returns how many were dropped. """
+	touched = touchedIds(oplogDir, ["voteview_rollcalls", "voteview_members", "voteview_parties"])
+	if any(t["dropped"] for t in touched.itervalues()) or touched["voteview_parties"]["ids"] or touched["voteview_parties"]["deleted"]:
+		return db.voteview_rollcall_payloads.delete_many({}).deleted_count
+
+	dropped = 0
+	rollcalls = list(touched["voteview_rollcalls"]["ids"] | touched["voteview_rollcalls"]["deleted"])
+	for i in xrange(0, len(rollcalls), 10000):
+		dropped += db.voteview_rollcall_payloads.delete_many({"oid": {"$in": rollcalls[i:i + 10000]}}).deleted_count
+
+	# Member deletes only carry an _id, and the record is gone, so their
+	# rollcalls are left to the rollcall-side changes that come with them.
+	members = list(touched["voteview_members"]["ids"])
+	scopes = set()
+	for i in xrange(0, len(members), 10000):
+		for m in db.voteview_members.find({"_id": {"$in": members[i:i + 10000]}}, {"congress": 1, "chamber": 1, "_id": 0}):
+			scopes.add((m.get("congress"), m.get("chamber")))
+	for congress, chamber in scopes:
+		# Presidents vote in both chambers.
+		query = {"congress": congress} if chamber == "President" else {"congress": congress, "chamber": chamber}
+		dropped += db.voteview_rollcall_payloads.delete_many(query).deleted_count
+	return dropped
+
+def prewarm(congresses=None):
+	""" Build the payloads of every rollcall in the given congresses, or all of them. """
+	start = time.time()
+	ensureIndexes()
+	query = {"congress": {"$in": congresses}} if congresses else {}
+	ids = [r["id"] for r in db.voteview_rollcalls.find(query, {"id": 1, "_id": 0}).sort("id", 1)]
+	for i in xrange(0, len(ids), BATCH_SIZE):
+		storePayloads(ids[i:i + BATCH_SIZE])
+	print "Stored", len(ids), "rollcall payloads in", round(time.time() - start, 1), "s"
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "build":
+		prewarm([int(c) for c in sys.argv[2:]] or None)
+	elif len(sys.argv) > 2 and sys.argv[1] == "patch":
+		ensureIndexes()
+		print "Dropped", invalidate(sys.argv[2]), "stored rollcall payloads"
+	else:
+		print "Usage: python payloadStore.py build [congress ...] | patch <oplog directory>"
@@ -0,0 +1,175 @@
+""" Positional inverted index over the rollcall text fields, for exact-phrase searches.
+
+Quoted searches used to run a $text query, copy every matching ID into a list,
+and then run a case-insensitive regex over that list. This index answers the
+phrase directly: every token occurrence is stored as a single int64 key
+
+	doc << 32 | field << 24 | position
+
+and the postings for each term are sorted. A phrase is found by shifting the
+postings of its n-th word back by n positions and intersecting.
+
+Build it after each data load (DEPLOY_HOURLY does this) with
+
+	python phraseIndex.py build
+
+Request workers memory-map the files and reload them when a new build is
+swapped in (see mmapIndex).
+"""
+import os
+import re
+import bisect
+import sys
+import time
+import json
+import pymongo
+import numpy as np
+from mmapIndex import MappedIndex, writeIndex
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phrase_index")
+CHECK_INTERVAL = 60 # Seconds between index mtime checks.
+
+# Every field the old regex fallback scanned, in a fixed order: a key's field
+# number is its position in this list, so appending is fine but reordering
+# requires a rebuild.
+TEXT_FIELDS = ["cg_official_titles", "cg_summary", "short_description", "vote_desc", "dtl_desc",
+		"vote_document_text", "bill", "vote_title", "vote_question_text", "question"]
+
+DOC_SHIFT = 32
+FIELD_SHIFT = 24
+POS_MASK = (1 << FIELD_SHIFT) - 1
+FIELD_MASK = 0xFF
+
+tokenRe = re.compile(r"[a-z0-9]+")
+phraseRe = re.compile(r"^[a-z0-9\s]+$")
+
+def tokenize(text):
+	""" Lowercase alphanumeric tokens; everything else separates words. """
+	if isinstance(text, str):
+		text = text.decode("utf-8", "ignore")
+	return tokenRe.findall(text.lower())
+
+def fieldTokens(value):
+	""" Tokens of a field value with their positions. List-valued fields
+	(e.g. cg_official_titles) leave a gap between items so phrases can't span them. """
+	if isinstance(value, list):
+		pos = 0
+		for item in value:
+			for token in tokenize(item if isinstance(item, basestring) else unicode(item)):
+				yield pos, token
+				pos += 1
+			pos += 1
+	elif isinstance(value, basestring):
+		for pos, token in enumerate(tokenize(value)):
+			yield pos, token
+
+def buildIndex(outDir=INDEX_DIR):
+	""" Build the index from voteview_rollcalls and write it to outDir. """
+	start = time.time()
+	projection = dict([(f, 1) for f in TEXT_FIELDS] + [("id", 1), ("_id", 0)])
+	docIds = []
+	postings = {}
+	for doc, rollcall in enumerate(db.voteview_rollcalls.find({}, projection).sort("date_chamber_rollnumber", 1)):
+		docIds.append(rollcall["id"])
+		for fieldNum, field in enumerate(TEXT_FIELDS):
+			if field not in rollcall or not rollcall[field]:
+				continue
+			base = (doc << DOC_SHIFT) | (fieldNum << FIELD_SHIFT)
+			for pos, token in fieldTokens(rollcall[field]):
+				if pos > POS_MASK:
+					break
+				postings.setdefault(token, []).append(base | pos)
+
+	# Docs, fields, and positions are all visited in increasing order, so each
+	# term's postings come out already sorted.
+	vocab = {}
+	total = sum(len(p) for p in postings.itervalues())
+	keys = np.empty(total, dtype=np.int64)
+	offset = 0
+	for term in sorted(postings):
+		p = postings[term]
+		keys[offset:offset + len(p)] = p
+		vocab[term] = [offset, len(p)]
+		offset += len(p)
+
+	writeIndex(outDir, {"fields": TEXT_FIELDS, "docs": docIds, "vocab": vocab, "built": time.time()}, [("postings", keys)])
+	print "Indexed", len(docIds), "rollcalls,", len(vocab), "terms,", total, "postings in", round(time.time() - start, 1), "s"
+
+def decodeIndex(meta, arrays):
+	return {"fields": dict((f, i) for i, f in enumerate(meta["fields"])), "docs": meta["docs"], "vocab": meta["vocab"],
+		"terms": sorted(meta["vocab"]), "postings": arrays["postings"]}
+
+index = MappedIndex(INDEX_DIR, decodeIndex, CHECK_INTERVAL)
+
+def loadIndex(force=0):
+	""" Current index, or None if it hasn't been built. """
+	return index.load(force)
+
+def canSearch(phrase):
+	""" Can the index answer this phrase exactly? Phrases with punctuation need the substring regex. """
+	return bool(phraseRe.match(phrase.lower())) and len(tokenize(phrase)) > 0 and loadIndex() is not None
+
+def termPostings(data, term):
+	""" Sorted postings of one vocabulary term. """
+	offset, count = data["vocab"][term]
+	return np.asarray(data["postings"][offset:offset + count])
+
+def prefixPostings(data, prefix):
+	""" Sorted postings of every vocabulary term starting with prefix. """
+	terms = data["terms"]
+	start = bisect.bisect_left(terms, prefix)
+	end = bisect.bisect_left(terms, prefix + u"\uffff", start)
+	if end - start == 1:
+		return termPostings(data, terms[start])
+	return np.sort(np.concatenate([termPostings(data, term) for term in terms[start:end]] or [np.empty(0, dtype=np.int64)]))
+
+def phraseSearch(phrase, field=None):
+	""" Rollcall IDs containing the phrase as consecutive words, optionally
+	restricted to one text field. The last word also matches longer words it
+	begins ("tax cut" finds "tax cuts"), as the substring regex this replaced
+	did. Returns None if the index can't answer. """
+	data = loadIndex()
+	tokens = tokenize(phrase)
+	if data is None or not tokens:
+		return None
+	if field is not None and field not in data["fields"]:
+		return None
+
+	matches = None
+	for shift, token in enumerate(tokens):
+		if shift == len(tokens) - 1:
+			keys = prefixPostings(data, token)
+		elif token in data["vocab"]:
+			keys = termPostings(data, token)
+		else:
+			return []
+		if shift:
+			keys = keys[(keys & POS_MASK) >= shift] - shift
+		matches = keys if matches is None else np.intersect1d(matches, keys, assume_unique=True)
+		if not len(matches):
+			return []
+
+	if field is not None:
+		matches = matches[((matches >> FIELD_SHIFT) & FIELD_MASK) == data["fields"][field]]
+	docs = data["docs"]
+	return [docs[d] for d in np.unique(matches >> DOC_SHIFT)]
+
+loadIndex(force=1)
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "build":
+		buildIndex(sys.argv[2] if len(sys.argv) > 2 else INDEX_DIR)
+	else:
+		for phrase in sys.argv[1:] or ["estate tax"]:
+			ids = phraseSearch(phrase)
+			print phrase, ":", "index not built" if ids is None else "%d rollcalls" % len(ids)
@@ -1,5 +1,6 @@
 import traceback
 import model.downloadVotes
+import model.memberVotes
 
 # Completes the member-vote merge.
 def prepVotes(voteQuery, person):
@@ -7,20 +8,29 @@ def prepVotes(voteQuery, person):
 		votes = voteQuery["rollcalls"]
 		idSet = [v["id"] for v in votes]
 		print idSet
-		rollcallsFinal = model.downloadVotes.downloadAPI(idSet,"Web_Person", person["icpsr"])
+		# Stored votes first; anything the store lacks (not built yet, or the
+		# member has since switched parties) comes from the rollcalls.
+		if "memberVotes" in voteQuery:
+			memberVotes = model.memberVotes.recordVotes(voteQuery["memberVotes"], person.get("party_code"))
+		else:
+			memberVotes = model.memberVotes.lookupVotes(person["icpsr"], [v.pop("date_chamber_rollnumber", None) for v in votes], person.get("party_code"))
+		missing = [i for i in idSet if i not in memberVotes]
+		if missing:
+			memberVotes.update(model.downloadVotes.downloadMemberVotes(missing, person["icpsr"]))
 
-		if "rollcalls" in rollcallsFinal and len(rollcallsFinal["rollcalls"])>0:
+		if len(memberVotes)>0:
 			for i in xrange(0, len(idSet)):
 				# Isolate votes from the rollcall
 				try:
-					iV = next((r for r in rollcallsFinal["rollcalls"] if r["id"]==votes[i]["id"]), None)
-					if not iV or iV is None:
+					iV = memberVotes.get(votes[i]["id"])
+					if iV is None:
 						print "Error finding the rollcall data based on vote id."
 						votes[i]["myVote"] = "Abs"
 						votes[i]["partyLabelVote"] = "N/A"
 						votes[i]["pVSum"] = 0
+						continue
 					else:
-						myVote = next((v["vote"] for v in iV["votes"] if v["icpsr"]==person["icpsr"]), None)
+						myVote = iV.get("vote")
 						if myVote is not None:
 							votes[i]["myVote"] = myVote
 						else:
@@ -33,31 +43,17 @@ def prepVotes(voteQuery, person):
 					votes[i]["pVSum"] = 0
 					continue
 
-				# Isolate my probability from the rollcall, if it's there.
-				try:
-					probResult = next((v["prob"] for v in iV["votes"] if v["icpsr"]==person["icpsr"]), None)
-					if probResult is not None:
-						votes[i]["myProb"] = probResult
-				except:
-					print "Error calculating probability of vote."
-					pass
+				# My probability from the rollcall, if it's there.
+				if "prob" in iV:
+					votes[i]["myProb"] = iV["prob"]
 
 				# Now isolate the party vote info.
-				try:
-					votes[i]["partyVote"] = next((v for k, v in iV["party_vote_counts"].iteritems() if k==str(person["party_code"])),None) 
-					if votes[i]["partyVote"] is not None:
-						votes[i]["pVSum"] = sum([1*v if int(k)<=3 else -1*v if int(k)<=6 else 0 for k, v in votes[i]["partyVote"].iteritems()])
-						votes[i]["yea"] = sum([1*v if int(k)<=3 else 0 for k, v in votes[i]["partyVote"].iteritems()])
-						votes[i]["nay"] = sum([1*v if int(k)>3 and int(k)<=6 else 0 for k, v in votes[i]["partyVote"].iteritems()])
-						votes[i]["abs"] = sum([1*v if int(k)>6 else 0 for k, v in votes[i]["partyVote"].iteritems()])
-						votes[i]["partyLabelVote"] = "Yea" if votes[i]["pVSum"]>0 else "Nay" if votes[i]["pVSum"]<0 else "Tie"
-					else:
-						votes[i]["partyLabelVote"] = "N/A"
-						votes[i]["pVSum"] = 0
-				except:
-					print "Error calculating party vote."
-					votes[i]["partyLabelVote"] = "N/A"
-					votes[i]["pVSum"] = 0
+				if "partyLabelVote" in iV:
+					for key in ["yea", "nay", "abs", "pVSum", "partyLabelVote"]:
+						if key in iV:
+							votes[i][key] = iV[key]
+				else:
+					votes[i].update(model.memberVotes.partyPosition(votes[i]["id"], person.get("party_code"), iV.get("party_vote_counts")))
 		else:
 			votes = []
 	else:
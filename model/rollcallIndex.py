@@ -0,0 +1,304 @@
+""" Per-member rollcall index for voter:, congress: and chamber: searches.
+
+A voter: search is a votes.icpsr match, which makes Mongo walk the vote arrays
+of every candidate rollcall, and every member vote page is one. Instead, we
+number the rollcalls 0..N-1 in date_chamber_rollnumber order and store for each
+member the sorted array of ordinals they voted on, plus a congress and chamber
+column. A query built only from those fields is then array intersection and
+filtering, and a page is a slice of the result.
+
+Build it after each data load (DEPLOY_HOURLY does this) with
+
+	python rollcallIndex.py build
+
+Rollcalls added since the last build are picked up from Mongo on each query.
+
+The same ordinal space carries the search sidebar's facet columns (Clausen and
+Peltzman codes, key vote flags, percent support), so facet counts for any
+result set are a handful of bincounts.
+"""
+import os
+import sys
+import time
+import json
+import array
+import bisect
+import pymongo
+import numpy as np
+from mmapIndex import MappedIndex, writeIndex
+
+client = pymongo.MongoClient()
+try:
+	dbConf = json.load(open("./model/db.json","r"))
+except:
+	try:
+		dbConf = json.load(open("./db.json","r"))
+	except:
+		dbConf = {'dbname':'voteview'}
+db = client[dbConf["dbname"]]
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rollcall_index")
+CHECK_INTERVAL = 60 # Seconds between index mtime checks.
+CHAMBERS = {"House": 0, "Senate": 1}
+# Multi-valued facets: facet name -> rollcall field holding a list of values.
+CODE_FACETS = {"clausen": ("codes", "Clausen"), "peltzman": ("codes", "Peltzman"), "keyvote": ("key_flags", None)}
+NO_SUPPORT = 255
+
+def buildIndex(outDir=INDEX_DIR):
+	""" Build the index from voteview_rollcalls and write it to outDir. """
+	start = time.time()
+	dcrs = []
+	congress = array.array("H")
+	chamber = array.array("B")
+	support = array.array("B")
+	voters = array.array("I")
+	ordinals = array.array("I")
+	facetValues = dict((f, []) for f in CODE_FACETS)
+	facetPairs = dict((f, (array.array("I"), array.array("H"))) for f in CODE_FACETS)
+	projection = {"date_chamber_rollnumber": 1, "congress": 1, "chamber": 1, "votes.icpsr": 1, "_id": 0,
+		      "codes.Clausen": 1, "codes.Peltzman": 1, "key_flags": 1, "percent_support": 1}
+	for ordinal, rollcall in enumerate(db.voteview_rollcalls.find({}, projection).sort("date_chamber_rollnumber", 1)):
+		dcrs.append(rollcall["date_chamber_rollnumber"])
+		congress.append(rollcall["congress"])
+		chamber.append(CHAMBERS.get(rollcall["chamber"], 255))
+		pct = rollcall.get("percent_support")
+		support.append(int(pct) if isinstance(pct, (int, long, float)) and 0 <= pct <= 100 else NO_SUPPORT)
+		for v in rollcall.get("votes", []):
+			voters.append(v["icpsr"])
+			ordinals.append(ordinal)
+		for facet, (field, subfield) in CODE_FACETS.iteritems():
+			values = rollcall.get(field) or []
+			if subfield is not None:
+				values = (values.get(subfield) or []) if isinstance(values, dict) else []
+			if isinstance(values, basestring):
+				values = [values]
+			for value in set(values):
+				if value not in facetValues[facet]:
+					facetValues[facet].append(value)
+				facetPairs[facet][0].append(ordinal)
+				facetPairs[facet][1].append(facetValues[facet].index(value))
+
+	# Group the (icpsr, ordinal) pairs by member. A stable sort keeps each
+	# member's ordinals in the increasing order we visited them in.
+	voters = np.frombuffer(voters, dtype=np.uint32)
+	ordinals = np.frombuffer(ordinals, dtype=np.uint32)
+	order = np.argsort(voters, kind="mergesort")
+	icpsrs, offsets, counts = np.unique(voters[order], return_index=True, return_counts=True)
+	members = dict((str(i), [int(o), int(c)]) for i, o, c in zip(icpsrs, offsets, counts))
+
+	columns = [("postings", ordinals[order]), ("congress", np.frombuffer(congress, dtype=np.uint16)),
+		   ("chamber", np.frombuffer(chamber, dtype=np.uint8)), ("support", np.frombuffer(support, dtype=np.uint8))]
+	for facet, (pairOrdinals, pairValues) in facetPairs.iteritems():
+		columns.append((facet + "_ordinals", np.frombuffer(pairOrdinals, dtype=np.uint32)))
+		columns.append((facet + "_values", np.frombuffer(pairValues, dtype=np.uint16)))
+	writeIndex(outDir, {"dcrs": dcrs, "members": members, "facetValues": facetValues, "built": time.time()}, columns)
+	print "Indexed", len(dcrs), "rollcalls,", len(members), "members,", len(ordinals), "votes in", round(time.time() - start, 1), "s"
+
+def decodeIndex(meta, arrays):
+	data = {"dcrs": meta["dcrs"], "members": dict((int(k), v) for k, v in meta["members"].iteritems()),
+		"ordinalOf": dict((d, i) for i, d in enumerate(meta["dcrs"])), "facetValues": meta["facetValues"]}
+	data.update(arrays)
+	return data
+
+index = MappedIndex(INDEX_DIR, decodeIndex, CHECK_INTERVAL)
+
+def loadIndex(force=0):
+	""" Current index, or None if it hasn't been built. """
+	return index.load(force)
+
+def memberOrdinals(data, icpsr):
+	""" Sorted ordinals of the rollcalls a member voted on. """
+	if icpsr not in data["members"]:
+		return np.empty(0, dtype=np.uint32)
+	offset, count = data["members"][icpsr]
+	return np.asarray(data["postings"][offset:offset + count])
+
+def columnMatch(value):
+	""" Boolean test of an index column against a simple Mongo condition, or None if unsupported. """
+	if isinstance(value, dict):
+		ops = {"$gte": np.greater_equal, "$gt": np.greater, "$lte": np.less_equal, "$lt": np.less}
+		if not value or any(op not in ops and op != "$in" for op in value):
+			return None
+		def test(col):
+			mask = np.ones(len(col), dtype=bool)
+			for op, v in value.iteritems():
+				mask &= np.in1d(col, v) if op == "$in" else ops[op](col, v)
+			return mask
+		return test
+	if isinstance(value, (int, long)) and not isinstance(value, bool):
+		return lambda col: col == value
+	return None
+
+def resolve(data, queryDict):
+	""" Sorted ordinals of the rollcalls matching a query dict, or None if the
+	query uses anything other than votes.icpsr, congress, chamber, $and and $or. """
+	if not isinstance(queryDict, dict) or not queryDict:
+		return None
+
+	matches = None
+	filters = []
+	for key, value in queryDict.iteritems():
+		if key == "votes.icpsr":
+			if not isinstance(value, (int, long)) or isinstance(value, bool):
+				return None
+			found = memberOrdinals(data, value)
+		elif key in ["$and", "$or"]:
+			if not isinstance(value, list) or not value:
+				return None
+			found = None
+			for sub in value:
+				subMatch = resolve(data, sub)
+				if subMatch is None:
+					return None
+				if found is None:
+					found = subMatch
+				elif key == "$and":
+					found = np.intersect1d(found, subMatch, assume_unique=True)
+				else:
+					found = np.union1d(found, subMatch)
+		elif key == "congress":
+			test = columnMatch(value)
+			if test is None:
+				return None
+			filters.append(("congress", test))
+			continue
+		elif key == "chamber":
+			if value not in CHAMBERS:
+				return None
+			filters.append(("chamber", lambda col, code=CHAMBERS[value]: col == code))
+			continue
+		else:
+			return None
+		matches = found if matches is None else np.intersect1d(matches, found, assume_unique=True)
+
+	# Column conditions only look at the candidates we already have, if any.
+	if matches is None:
+		matches = np.arange(len(data["dcrs"]), dtype=np.uint32)
+	for column, test in filters:
+		matches = matches[test(np.asarray(data[column])[matches])]
+	return matches
+
+def page(queryDict, after=None, sortDir=-1, limit=25):
+	""" Keys (date_chamber_rollnumber) of one page of a query's results in sort
+	order, and the total result count. Returns None if the index can't answer,
+	in which case the caller should run the query in Mongo as usual.
+
+	Parameters
+	----------
+	queryDict: dict
+		Compiled search query
+	after: date_chamber_rollnumber key or None
+		Resume after this row (the previous page's cursor)
+	sortDir: int
+		-1 for newest first, 1 for oldest first
+	limit: int
+		Page size
+
+	Returns
+	-------
+	list, int
+	"""
+	data = loadIndex()
+	if data is None:
+		return None
+	ordinals = resolve(data, queryDict)
+	if ordinals is None:
+		return None
+
+	# Rollcalls loaded since the build are not in the index: ask Mongo for
+	# those. This only looks past the newest indexed row, so it's cheap.
+	dcrs = data["dcrs"]
+	tail = []
+	if dcrs:
+		newer = {"$and": [queryDict, {"date_chamber_rollnumber": {"$gt": dcrs[-1]}}]}
+		tail = [r["date_chamber_rollnumber"] for r in
+			db.voteview_rollcalls.find(newer, {"date_chamber_rollnumber": 1, "_id": 0}).sort("date_chamber_rollnumber", 1)]
+
+	# As in Mongo, the count is of the rows from the cursor on.
+	if sortDir == -1:
+		if after is not None:
+			tail = [d for d in tail if d < after]
+			ordinals = ordinals[:np.searchsorted(ordinals, bisect.bisect_left(dcrs, after))]
+		total = len(ordinals) + len(tail)
+		keys = tail[::-1][:limit]
+		if len(keys) < limit:
+			keys += [dcrs[o] for o in ordinals[::-1][:limit - len(keys)]]
+	else:
+		if after is not None:
+			tail = [d for d in tail if d > after]
+			ordinals = ordinals[np.searchsorted(ordinals, bisect.bisect_right(dcrs, after)):]
+		total = len(ordinals) + len(tail)
+		keys = [dcrs[o] for o in ordinals[:limit]]
+		if len(keys) < limit:
+			keys += tail[:limit - len(keys)]
+	return keys, total
+
+def matchOrdinals(data, queryDict, maxTimeMS=0):
+	""" Ordinals of every indexed rollcall matching a query dict. Queries the
+	index can't resolve itself cost one Mongo query that returns only keys,
+	limited to maxTimeMS milliseconds if set (raises ExecutionTimeout). """
+	ordinals = resolve(data, queryDict)
+	if ordinals is not None:
+		return ordinals
+	ordinalOf = data["ordinalOf"]
+	keys = db.voteview_rollcalls.find(queryDict, {"date_chamber_rollnumber": 1, "_id": 0})
+	if maxTimeMS:
+		keys = keys.max_time_ms(maxTimeMS)
+	return np.array(sorted(ordinalOf[r["date_chamber_rollnumber"]] for r in keys if r["date_chamber_rollnumber"] in ordinalOf), dtype=np.uint32)
+
+def facetCounts(queryDict, maxTimeMS=0):
+	""" Number of results of a query under each value of each search sidebar facet,
+	or None if the index hasn't been built. Rollcalls loaded since the last build
+	are not counted.
+
+	Parameters
+	----------
+	queryDict: dict
+		Compiled search query
+	maxTimeMS: int
+		If set, give up after this many milliseconds in the database
+
+	Returns
+	-------
+	dict
+		Total result count and {facet: {value: count}} for congress, chamber,
+		clausen, peltzman, keyvote and support (in 10-point buckets).
+	"""
+	data = loadIndex()
+	if data is None:
+		return None
+	ordinals = matchOrdinals(data, queryDict, maxTimeMS)
+
+	facets = {}
+	congress = np.bincount(np.asarray(data["congress"])[ordinals])
+	facets["congress"] = dict((str(c), int(n)) for c, n in enumerate(congress) if n)
+	chamber = np.bincount(np.asarray(data["chamber"])[ordinals], minlength=len(CHAMBERS))
+	facets["chamber"] = dict((name, int(chamber[code])) for name, code in CHAMBERS.iteritems())
+
+	# Multi-valued facets: count the (rollcall, value) pairs whose rollcall is in the results.
+	inResults = np.zeros(len(data["dcrs"]), dtype=bool)
+	inResults[ordinals] = True
+	for facet in CODE_FACETS:
+		pairOrdinals = np.asarray(data[facet + "_ordinals"])
+		values = data["facetValues"][facet]
+		counts = np.bincount(np.asarray(data[facet + "_values"])[inResults[pairOrdinals]], minlength=len(values))
+		facets[facet] = dict((value, int(n)) for value, n in zip(values, counts) if n)
+	# keyvote: 1 matches any flag.
+	keyOrdinals = np.asarray(data["keyvote_ordinals"])
+	facets["keyvote"]["1"] = len(np.unique(keyOrdinals[inResults[keyOrdinals]]))
+
+	support = np.asarray(data["support"])[ordinals]
+	support = np.bincount(np.minimum(support[support != NO_SUPPORT] // 10, 9), minlength=10)
+	facets["support"] = dict((str(10 * b), int(n)) for b, n in enumerate(support))
+
+	return {"total": len(ordinals), "facets": facets}
+
+loadIndex(force=1)
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "build":
+		buildIndex(sys.argv[2] if len(sys.argv) > 2 else INDEX_DIR)
+	else:
+		icpsr = int(sys.argv[1]) if len(sys.argv) > 1 else 29940
+		res = page({"votes.icpsr": icpsr})
+		print "index not built" if res is None else "%d rollcalls, latest %s" % (res[1], res[0][:3])
@@ -0,0 +1,136 @@
+""" Finished responses for the roster endpoints, cached between data loads.
+
+A congress or party roster only changes when a data load lands, but every
+getmembersbycongress and getmembersbyparty hit used to rebuild the rows and
+JSON-encode them again. Here each response is encoded and gzipped once per
+parameter tuple and dataset version, given an ETag, and served as bytes.
+Browsers that send the ETag back get a 304.
+
+Whenever the dataset version changes (including at worker start), a
+background thread warms the cache with every congress in the shapes the
+site requests: each chamber for the congress page and the whole congress
+for the ideology histogram.
+"""
+import json
+import gzip
+import time
+import hashlib
+import threading
+from StringIO import StringIO
+from searchMembers import getMembersByCongress, getMembersByParty
+from bioData import congressToYear
+from searchMeta import datasetVersion
+from lruCache import LRUCache
+
+# (chamber, api) pairs the site's pages request for every congress.
+WARM_SHAPES = [("House", "Web_Congress"), ("Senate", "Web_Congress"), ("", "Web_PI")]
+
+payloads = LRUCache(2000)
+warmState = {"version": None}
+warmLock = threading.Lock()
+
+def maxCongress():
+	try:
+		return json.load(open("static/config.json", "r"))["maxCongress"]
+	except:
+		try:
+			return json.load(open("../static/config.json", "r"))["maxCongress"]
+		except:
+			return 117
+
+def addMinElected(out):
+	""" Year each member was first elected, for the congress and party pages. """
+	if "results" in out:
+		for memberRow in out["results"]:
+			if "congresses" in memberRow:
+				memberRow["minElected"] = congressToYear(memberRow["congresses"][0][0], 0)
+	return out
+
+# No timeElapsed in these (the uncached handlers added one): the body is
+# cached and its hash is the ETag, so it has to come out the same on every
+# worker and every rebuild of a dataset version.
+def buildMembersByCongress(congress, chamber, api):
+	out = getMembersByCongress(congress, chamber, api)
+	if api == "Web_Congress":
+		addMinElected(out)
+	return out
+
+def buildMembersByParty(id, congress, api):
+	out = getMembersByParty(id, congress, api)
+	if api == "Web_Party":
+		addMinElected(out)
+	return out
+
+def encodePayload(out):
+	""" JSON body, gzipped, with an ETag for the uncompressed bytes. Keys are
+	sorted so equal results always encode to the same bytes. """
+	body = json.dumps(out, sort_keys=True)
+	buf = StringIO()
+	with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0) as f:
+		f.write(body)
+	return {"gzip": buf.getvalue(), "etag": '"%s"' % hashlib.md5(body).hexdigest()}
+
+def cachedPayload(key, build, *args):
+	""" Encoded response for key, built with build(*args) on a miss. """
+	version = datasetVersion()
+	checkWarm(version)
+	payload = payloads.get((version, key))
+	if payload is None:
+		payload = encodePayload(build(*args))
+		payloads.set((version, key), payload, len(payload["gzip"]))
+	return payload
+
+def congressKey(congress):
+	try:
+		return int(congress)
+	except (ValueError, TypeError):
+		return congress
+
+def membersByCongress(congress, chamber, api):
+	return cachedPayload(("congress", congressKey(congress), chamber, api), buildMembersByCongress, congress, chamber, api)
+
+def membersByParty(id, congress, api):
+	return cachedPayload(("party", congressKey(id), congress, api), buildMembersByParty, id, congress, api)
+
+def respond(payload, request, response):
+	""" Serve an encoded payload through bottle: 304 if the client's copy is
+	current, otherwise the gzipped bytes (or plain JSON for the rare client
+	that doesn't accept gzip). """
+	response.content_type = "application/json"
+	response.set_header("ETag", payload["etag"])
+	response.set_header("Vary", "Accept-Encoding")
+	if payload["etag"] in request.headers.get("If-None-Match", ""):
+		response.status = 304
+		return ""
+	if "gzip" in request.headers.get("Accept-Encoding", ""):
+		response.set_header("Content-Encoding", "gzip")
+		return payload["gzip"]
+	return gzip.GzipFile(fileobj=StringIO(payload["gzip"])).read()
+
+def warmRosters(version):
+	""" Encode every congress in each of WARM_SHAPES. Stops early if a newer data load lands. """
+	start = time.time()
+	for congress in xrange(maxCongress(), 0, -1):
+		for chamber, api in WARM_SHAPES:
+			if warmState["version"] != version:
+				return
+			try:
+				membersByCongress(congress, chamber, api)
+			except:
+				pass
+	print "Warmed roster cache in", round(time.time() - start, 1), "s"
+
+def checkWarm(version):
+	""" Start a warm-up the first time we see a dataset version. """
+	if version == warmState["version"]:
+		return
+	with warmLock:
+		if version == warmState["version"]:
+			return
+		warmState["version"] = version
+	thread = threading.Thread(target=warmRosters, args=(version,))
+	thread.daemon = True
+	thread.start()
+
+# Start warming as soon as the worker loads us.
+checkWarm(datasetVersion())
@@ -3,12 +3,31 @@ from searchMembers import memberLookup, nicknameHelper
 from bioData import congressToYear
 from searchParties import partyLookup
 from slugify import slugify
+from bioImages import bioImageFile
+from lruCache import LRUCache
+import logQuota
 import traceback
-import os
 import json
+import os
+import re
 import datetime
+import time
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from pymongo.errors import ExecutionTimeout
 from fuzzywuzzy import fuzz
 
+# The vote count in the search header stops being exact past this many results.
+SEARCH_COUNT_CAP = 10000
+
+# Each rollcall query fetches this many pages at once; the pages after the first are
+# kept here so scrolling ("load more") is answered from memory.
+SEARCH_WINDOW_PAGES = 3
+searchWindows = LRUCache(1000, ttl=300)
+# Request parameters that change which rollcalls a search returns, or their order.
+SEARCH_PARAMS = ["fromDate", "toDate", "chamber", "fromCongress", "toCongress", "support", "clausen", "peltzman", "keyvote", "sortD", "sortScore", "icpsr"]
+
 def defaultValue(x,value = None):
     return x is not "" and x or value
 
@@ -24,155 +43,241 @@ def current_congress():
 	return congress
 
 
-def assembleSearch(q, nextId, bottle):
-	# First, get the current congress
-	max_congress = current_congress()
-
-	#Party search
+# Party, member and rollcall searches run concurrently on a pool of this many threads
+# per worker process; a branch that runs past its timeout (seconds) is left out of the page.
+# The member and rollcall queries are also capped at their timeout in the database, so a
+# branch left behind frees its pool thread instead of running on.
+SEARCH_POOL_SIZE = 8
+BRANCH_TIMEOUTS = {"parties": 3, "members": 5, "rollcalls": 25}
+searchPool = None
+searchPoolLock = threading.Lock()
+
+# Search intent grammar (state delegations, speakers, presidents, freshmen), compiled once.
+DELEGATION_JOBS = ["representatives", "reps", "senators", "members", "senate", "house", "house delegation", "senate delegation", "congressmen", "congresspersons", "congressional delegation", "congress delegation", "delegation"]
+DELEGATION_PREPOSITIONS = ["of", "in", "from"]
+SPEAKER_QUERIES = frozenset(["speaker of the house","speakers of the house","speaker: 1", "speaker:1","house speaker"])
+PRESIDENT_QUERIES = frozenset(["potus", "president of the united states", "president", "the president", "president:1", "president: 1","presidents","presidents of the united states","presidents of the united states of america","president of the united states of america"])
+FRESHMEN_QUERIES = frozenset(["freshmen", "freshman", "new hires", "first-years", "just elected", "tenderfoot", "newly elected"])
+
+stateSet = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "states.json"), "r"))
+stateNames = [(stateLabel["name"].lower(), stateLabel["state_abbrev"]) for stateLabel in stateSet]
+stateAbbrevs = [stateLabel["state_abbrev"] for stateLabel in stateSet]
+stateAbbrevsLower = frozenset(abbrev.lower() for abbrev in stateAbbrevs)
+
+# A delegation query mentions a state name anywhere (except "washington", which is
+# usually a person), or "<job> <preposition> <state name or abbreviation>".
+alternation = lambda words: "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+delegationRe = re.compile("(?:%s) (?:%s) (?:%s)|%s" % (alternation(DELEGATION_JOBS), alternation(DELEGATION_PREPOSITIONS),
+			   alternation([s for s, a in stateNames] + list(stateAbbrevsLower)),
+			   alternation([s for s, a in stateNames if s != "washington"])))
+congressAfterRe = re.compile(r"(\d+)(st|nd|rd|th)? congress")
+congressBeforeRe = re.compile(r"congress (\d+)")
+
+rcSuffix = lambda n: "%d%s" % (n,"tsnrhtdd"[(n/10%10!=1)*(n%10<4)*n%10::4])
+
+def congressOrdinal(queryLower, maxCongress):
+	""" Highest congress number mentioned in a query as "115 congress", "115th congress"
+	or "congress 115" (matching inside longer numbers, as a substring test would), or 0. """
+	found = 0
+	for match in congressAfterRe.finditer(queryLower):
+		digits, suffix = match.groups()
+		for start in xrange(len(digits)):
+			number = int(digits[start:])
+			if str(number)==digits[start:] and 0<number<=maxCongress and (not suffix or rcSuffix(number)==digits[start:]+suffix):
+				found = max(found, number)
+	for match in congressBeforeRe.finditer(queryLower):
+		digits = match.group(1)
+		for end in xrange(1, len(digits)+1):
+			number = int(digits[:end])
+			if str(number)==digits[:end] and 0<number<=maxCongress:
+				found = max(found, number)
+	return found
+
+def searchWindowKey(q, params):
+	""" Cache key for a search's result pages: the query plus every facet and sort parameter. """
+	facets = tuple((k, tuple(params.getall(k))) for k in SEARCH_PARAMS)
+	return (" ".join((q or "").split()), facets)
+
+def storeSearchWindow(key, res, pageSize):
+	""" Splits a multi-page query result into pages, caches every page after the
+	first under the nextId that will ask for it, and returns the first page. """
+	rollcalls = res["rollcalls"]
+	cursors = res["pageCursors"]
+	for page in xrange(1, len(cursors)):
+		rows = rollcalls[page*pageSize:(page+1)*pageSize]
+		total = res["recordcountTotal"]
+		if type(total)==type(0):
+			total = max(total - page*pageSize, 0)
+		entry = {"rollcalls": rows, "nextId": cursors[page], "recordcountTotal": total,
+			 "needScore": res["needScore"], "fulltextSearch": res.get("fulltextSearch", "")}
+		searchWindows.set((key, cursors[page-1]), entry, size=len(json.dumps(rows, default=str)))
+
+	res["rollcalls"] = rollcalls[:pageSize]
+	if cursors:
+		res["nextId"] = cursors[0]
+	return res
+
+def findRollcalls(q, queryArgs, windowKey):
+	""" Rollcall search: the first page of results, with the pages after it cached. """
+	res = query(q, **queryArgs)
+	if not "errormessage" in res:
+		res = storeSearchWindow(windowKey, res, queryArgs["pageSize"])
+	return res
+
+def getSearchPool():
+	""" The shared search thread pool, started on first use so each (forked) worker process gets its own. """
+	global searchPool
+	with searchPoolLock:
+		if searchPool is None:
+			searchPool = ThreadPool(SEARCH_POOL_SIZE)
+	return searchPool
+
+def timedCall(fn, args):
+	start = time.time()
+	return fn(*args), time.time() - start
+
+def dispatchBranch(fn, *args):
+	""" Starts one search branch on the search pool. """
+	return {"job": getSearchPool().apply_async(timedCall, (fn, args)), "start": time.time()}
+
+def collectBranch(branches, name, default):
+	""" Waits for a search branch until its timeout. Returns default if the branch
+	wasn't run, failed, or timed out; the branch keeps its timing either way. """
+	if name not in branches:
+		return default
+	branch = branches[name]
+	try:
+		result, branch["elapsed"] = branch["job"].get(max(0, branch["start"] + BRANCH_TIMEOUTS[name] - time.time()))
+		return result
+	except (TimeoutError, ExecutionTimeout):
+		branch["status"] = "timeout"
+	except:
+		print traceback.format_exc()
+		branch["status"] = "error"
+	branch["elapsed"] = time.time() - branch["start"]
+	return default
+
+def branchTimings(branches):
+	""" Server-Timing header value with each branch's duration in ms. """
+	timings = []
+	for name in sorted(branches):
+		desc = ";desc=\"%s\"" % branches[name]["status"] if "status" in branches[name] else ""
+		timings.append("%s%s;dur=%.1f" % (name, desc, 1000*branches[name].get("elapsed", 0)))
+	return ", ".join(timings)
+
+def findParties(q):
+	""" Party search: parties matching the query name or ID, best match first. """
 	resultParties = []
-	if q is not None and not nextId and not ":" in q and len(q.split())<4 and len(q):
-		try:
-			testQ = int(q)
-			if testQ>0 and testQ<10000:
-				partySearch = partyLookup({"id": q}, api="Web_FP_Search")
-			else:
-				partySearch = {}
-		except:
-			partySearch = partyLookup({"name": q}, api="Web_FP_Search")
-		if "results" in partySearch:
-			for party in partySearch["results"]:
-				party["scoreMatch"] = fuzz.token_set_ratio(party["fullName"].lower().replace(" party",""), q.lower().replace(" party",""))
-				if party["count"] > 1000:
-					party["scoreMatch"] += 25
-				elif party["count"] > 100:
-					party["scoreMatch"] += 10
-				party["seo_name"] = slugify(party["fullName"])
-				party["min_year"] = congressToYear(party["minCongress"], 0)
-				party["max_year"] = congressToYear(party["maxCongress"], 1)
-
-				resultParties.append(party)
-			resultParties.sort(key=lambda x: (-x["scoreMatch"], -x["maxCongress"]))
-
-	# Member search
-	resultMembers = []
-	count_members = 0
+	try:
+		testQ = int(q)
+		if testQ>0 and testQ<10000:
+			partySearch = partyLookup({"id": q}, api="Web_FP_Search")
+		else:
+			partySearch = {}
+	except:
+		partySearch = partyLookup({"name": q}, api="Web_FP_Search")
+	if "results" in partySearch:
+		for party in partySearch["results"]:
+			party["scoreMatch"] = fuzz.token_set_ratio(party["fullName"].lower().replace(" party",""), q.lower().replace(" party",""))
+			if party["count"] > 1000:
+				party["scoreMatch"] += 25
+			elif party["count"] > 100:
+				party["scoreMatch"] += 10
+			party["seo_name"] = slugify(party["fullName"])
+			party["min_year"] = congressToYear(party["minCongress"], 0)
+			party["max_year"] = congressToYear(party["maxCongress"], 1)
+
+			resultParties.append(party)
+		resultParties.sort(key=lambda x: (-x["scoreMatch"], -x["maxCongress"]))
+	return resultParties
+
+def memberIntent(q, nextId, max_congress):
+	""" Works out from the query text alone which member lookup to run (if any) and how
+	its results are shown. Cheap, so it runs before the searches are dispatched.
+
+	Returns
+	-------
+	tuple
+		The memberLookup query dict and row limit, or None
+	int
+		needScore, redirFlag, expandResults and suppressRollcalls flags
+	"""
+	lookup = None
 	needScore=1
 	redirFlag=0
 	expandResults=0
 	suppressRollcalls=0
 	currentYear = str(datetime.datetime.now().year)
-	memberSearch = {}
-
-	# Building state delegation queries
-	jobs = ["representatives", "reps", "senators", "members", "senate", "house", "house delegation", "senate delegation", "congressmen", "congresspersons", "congressional delegation", "congress delegation", "delegation"]
-	prepositions = ["of", "in", "from"]
-	stateMap = {}
-	abbrevStateName = []
-	fullStateName = []
-	stateQueries = []
-	# Load the abbrev to full name map.
-	stateSet = json.load(open("./model/states.json","r"))
-	for stateLabel in stateSet:
-		abbrevStateName.append(stateLabel["state_abbrev"])
-		fullStateName.append(stateLabel["name"])
-		stateMap[stateLabel["name"]] = stateLabel["state_abbrev"]
-		# First, add to the query list the exact names of states/abbrevs
-		if stateLabel["name"].lower()!="washington":
-			stateQueries.append(stateLabel["name"].lower())
-
-		for job in jobs:
-			for preposition in prepositions:
-				# Then both current-prefixed and non-current prefixed versions of each combination for names and abbrevs.
-				stateQueries.append("current "+job+" "+preposition+" "+stateLabel["state_abbrev"].lower())
-				stateQueries.append("current "+job+" "+preposition+" "+stateLabel["name"].lower())
-				stateQueries.append(job+" "+preposition+" "+stateLabel["state_abbrev"].lower())
-				stateQueries.append(job+" "+preposition+" "+stateLabel["name"].lower())
-	# Time period capture:
-	rcSuffix = lambda n: "%d%s" % (n,"tsnrhtdd"[(n/10%10!=1)*(n%10<4)*n%10::4])
-	timePeriods = []
-	for i in xrange(max_congress, 0, -1):
-		timePeriods.append(str(i) + " congress")
-		timePeriods.append("congress " + str(i))
-		timePeriods.append(rcSuffix(i) + " congress")
-		timePeriods.append("congress: " + str(i))
-
-	stateQueries = list(set(stateQueries))
+
 	if q is not None and not nextId and not ":" in q and len(q):
 		try:
 			# Search overrides for custom search use cases.
 			# Vote by known ID
 			if len(q.split())==1 and (q.upper().startswith("MH") or q.upper().startswith("MS")):
-				memberSearch = memberLookup({"id": q}, 8, distinct=1, api="Web_FP_Search")
+				lookup = ({"id": q}, 8)
 			# List all speakers
-			elif q.strip().lower() in ["speaker of the house","speakers of the house","speaker: 1", "speaker:1","house speaker"]:
-				memberSearch = memberLookup({"speaker": 1, "chamber": "house"}, 60, distinct=1, api="Web_FP_Search")
+			elif q.strip().lower() in SPEAKER_QUERIES:
+				lookup = ({"speaker": 1, "chamber": "house"}, 60)
 				needScore=0
 				expandResults=1
 			# List all presidents
-			elif q.strip().lower() in ["potus", "president of the united states", "president", "the president", "president:1", "president: 1","presidents","presidents of the united states","presidents of the united states of america","president of the united states of america"]:
-				memberSearch = memberLookup({"chamber": "President"}, 50, distinct=1, api="Web_FP_Search")
+			elif q.strip().lower() in PRESIDENT_QUERIES:
+				lookup = ({"chamber": "President"}, 50)
 				needScore=0
 				expandResults=1
 			# List all freshmen
-			elif q.strip().lower() in ["freshmen", "freshman", "new hires", "first-years", "just elected", "tenderfoot", "newly elected", "class of "+currentYear]:
-				memberSearch = memberLookup({"freshman": 1}, 75, distinct=1, api="Web_FP_Search")
+			elif q.strip().lower() in FRESHMEN_QUERIES or q.strip().lower() == "class of "+currentYear:
+				lookup = ({"freshman": 1}, 75)
 				needScore=0
 				expandResults=1
 			# List state delegation
-			elif len([s for s in stateQueries if s in q.strip().lower()]) or len([s for s in abbrevStateName if s.lower()==q.strip().lower()]):
+			elif delegationRe.search(q.strip().lower()) or q.strip().lower() in stateAbbrevsLower:
 				# A priori assume that any query that hits here is a members-only query unless it's the exact state name.
 				foundExact = 0
+				queryLower = q.strip().lower()
 
 				# Which chamber do we think they're asking for?
 				chamberFind=""
-				if "senators" in q.strip().lower() or "senate" in q.strip().lower():
+				if "senators" in queryLower or "senate" in queryLower:
 					chamberFind="Senate"
-				elif "representatives" in q.strip().lower() or "reps" in q.strip().lower() or "house" in q.strip().lower():
+				elif "representatives" in queryLower or "reps" in queryLower or "house" in queryLower:
 					chamberFind="House"
 
 				# Which state do we think they're asking for?
 				stateName = ""
-				for state in fullStateName:
-					if state.lower() in q.strip().lower():
-						stateName = stateMap[state]
-						if state.lower()==q.strip().lower():
+				for state, abbrev in stateNames:
+					if state in queryLower:
+						stateName = abbrev
+						if state==queryLower:
 							foundExact=1
 						break
 				if not stateName:
-					for state in abbrevStateName:
-						if any([qs == state.lower() for qs in q.strip().lower().split()]):
-							stateName = state
-							if state.lower()==q.strip().lower():
+					queryWords = queryLower.split()
+					for abbrev in stateAbbrevs:
+						if abbrev.lower() in queryWords:
+							stateName = abbrev
+							if abbrev.lower()==queryLower:
 								foundExact=1
 							break
 
 				# Which congress do we think they're asking for?
 				congress = 0
-				if "current" in q.strip().lower():
+				if "current" in queryLower:
 					congress = max_congress
 				else:
-					for timeP in timePeriods:
-						if timeP in q.strip().lower():
-							suppressRollcalls=1
-							numeral = 0
-							for numeralTime in timeP.split(" "):
-								numeral = numeralTime.replace("th","").replace("nd","").replace("rd","")
-								if numeral.isdigit():
-									numeral = int(numeral)
-									break
-							if numeral:
-								congress = numeral
-								break
+					congress = congressOrdinal(queryLower, max_congress)
+					if congress:
+						suppressRollcalls=1
 				if not congress:
 					congress = max_congress
 
 				if chamberFind and stateName and congress:
-					memberSearch = memberLookup({"state_abbrev": stateName, "congress": congress, "chamber": chamberFind}, 100, distinct=1, api="Web_FP_Search") 
+					lookup = ({"state_abbrev": stateName, "congress": congress, "chamber": chamberFind}, 100)
 					suppressRollcalls = -1*(foundExact-1) # Switch 1 to 0 or vice versa
 					needScore=0
 					expandResults=1
 				elif stateName and congress:
-					memberSearch = memberLookup({"state_abbrev": stateName, "congress": congress}, 100, distinct=1, api="Web_FP_Search") 
+					lookup = ({"state_abbrev": stateName, "congress": congress}, 100)
 					suppressRollcalls = -1*(foundExact-1) # Switch 1 to 0 or vice versa
 					needScore=0
 					expandResults=1
@@ -181,22 +286,37 @@ def assembleSearch(q, nextId, bottle):
 
 			# ICPSR of user
 			elif len(q.split())==1 and type(q)==type(0) and int(q):
-				memberSearch = memberLookup({"icpsr": int(q)}, 5, distinct=1, api="Web_FP_Search")
+				lookup = ({"icpsr": int(q)}, 5)
 				redirFlag=1
 			# Okay, probably a normal search then.
 			elif len(q.split())<=5:
-				memberSearch = memberLookup({"name": q}, 200, distinct=1, api="Web_FP_Search")
+				lookup = ({"name": q}, 200)
 		except:
 			print traceback.format_exc()
-			memberSearch = memberLookup({"name": q}, 200, distinct=1, api="Web_FP_Search")
+			lookup = ({"name": q}, 200)
 
 	# Biography search
 	if q is not None and len(q) and len(q.split())>1 and q.lower().split()[0]=="biography:":
 		bioSearch = " ".join(q.strip().lower().split()[1:])
-		memberSearch = memberLookup({"biography": bioSearch}, 50, distinct=1, api="Web_FP_Search")
+		lookup = ({"biography": bioSearch}, 50)
 		suppressRollcalls = 1
 		expandResults = 1
 
+	return lookup, needScore, redirFlag, expandResults, suppressRollcalls
+
+def findMembers(q, lookup, needScore, expandResults):
+	""" Member search: runs the lookup and ranks the members by fuzzy name match plus bonuses. """
+	resultMembers = []
+	count_members = 0
+	maxTimeMS = BRANCH_TIMEOUTS["members"]*1000
+	try:
+		memberSearch = memberLookup(lookup[0], lookup[1], distinct=1, api="Web_FP_Search", maxTimeMS=maxTimeMS)
+	except ExecutionTimeout:
+		raise
+	except:
+		print traceback.format_exc()
+		memberSearch = memberLookup({"name": q}, 200, distinct=1, api="Web_FP_Search", maxTimeMS=maxTimeMS)
+
 	if "results" in memberSearch:
 		seen_bioguide_ids = []
 		for member in memberSearch["results"]:
@@ -205,21 +325,24 @@ def assembleSearch(q, nextId, bottle):
 					continue
 				seen_bioguide_ids.append(member["bioguide_id"])
 
-			memName = ""
-			if "bioname" in member and member["bioname"] is not None:
-				memName = member["bioname"]
+			if "nameScore" in member: # Already ranked by the name index
+				member["scoreMatch"] = member["nameScore"]
 			else:
-				memName = "Error, Invalid Name."
+				memName = ""
+				if "bioname" in member and member["bioname"] is not None:
+					memName = member["bioname"]
+				else:
+					memName = "Error, Invalid Name."
 
-			try:
-				memName = memName.replace(",","").lower()
-			except:
-				memName = memName.lower()
+				try:
+					memName = memName.replace(",","").lower()
+				except:
+					memName = memName.lower()
 
-			searchNameToScore = q.replace(",","").lower()
-			scoreBasic = fuzz.token_set_ratio(memName, q.replace(",","").lower()) # Score base search
-			scoreNick = fuzz.token_set_ratio(nicknameHelper(memName, searchNameToScore), nicknameHelper(searchNameToScore)) # Come up with a best nickname match
-			member["scoreMatch"] = max(scoreBasic, scoreNick)
+				searchNameToScore = q.replace(",","").lower()
+				scoreBasic = fuzz.token_set_ratio(memName, q.replace(",","").lower()) # Score base search
+				scoreNick = fuzz.token_set_ratio(nicknameHelper(memName, searchNameToScore), nicknameHelper(searchNameToScore)) # Come up with a best nickname match
+				member["scoreMatch"] = max(scoreBasic, scoreNick)
 			member["bonusMatch"] = 0
 
 			# Exact last name bonus
@@ -251,10 +374,7 @@ def assembleSearch(q, nextId, bottle):
 				if duration >= 5:
 					member["bonusMatch"] += 12
 
-			if not os.path.isfile("static/img/bios/"+str(member["icpsr"]).zfill(6)+".jpg"):
-				member["bioImg"] = "silhouette.png"
-			else:
-				member["bioImg"] = str(member["icpsr"]).zfill(6)+".jpg"
+			member["bioImg"] = bioImageFile(member["icpsr"])
 			member["minElected"] = congressToYear(member["congresses"][0][0], 0)
 			member["seo_name"] = slugify(member["bioname"])
 
@@ -281,24 +401,19 @@ def assembleSearch(q, nextId, bottle):
 		else:
 			count_members = len(resultMembers)
 
-	if suppressRollcalls:
-		bottle.response.headers["rollcall_number"] = 0
-		bottle.response.headers["member_number"] = count_members
-		bottle.response.headers["party_number"] = 0
-
-		if len(resultMembers) > 50:
-			resultMembers = resultMembers[:50]
-
-		out = bottle.template("views/search_results", rollcalls = [], errormessage="", resultMembers=resultMembers, resultParties=[])
-		return out
+	return resultMembers, count_members
 
+def facetQuery(q, params):
+	""" Folds the search sidebar into a search: congress, support, keyvote and code
+	facets are appended to the query text; dates and chamber are returned for query().
+	Returns (q, startdate, enddate, chamber). """
 	# Date facet
-	startdate = defaultValue(bottle.request.params.fromDate)
-	enddate = defaultValue(bottle.request.params.toDate)
+	startdate = defaultValue(params.fromDate)
+	enddate = defaultValue(params.toDate)
 
 	# Chamber facet
 	try:
-		chamber = bottle.request.params.getall("chamber")
+		chamber = params.getall("chamber")
 		if len(chamber)>1:
 			chamber = None
 		elif type(chamber)==type([]):
@@ -308,8 +423,8 @@ def assembleSearch(q, nextId, bottle):
 
 	# Congress facet
 	try:
-		fromCongress = int(defaultValue(bottle.request.params["fromCongress"],0))
-		toCongress = int(defaultValue(bottle.request.params["toCongress"],0))
+		fromCongress = int(defaultValue(params["fromCongress"],0))
+		toCongress = int(defaultValue(params["toCongress"],0))
 		if (q is None or q=="") and (fromCongress or toCongress):
 			q = ""
 
@@ -327,7 +442,7 @@ def assembleSearch(q, nextId, bottle):
 
 	# Support facet
 	try:
-		support = bottle.request.params["support"]
+		support = params["support"]
 		if (q is None or q=="") and (support):
 			q = ""
 
@@ -349,12 +464,12 @@ def assembleSearch(q, nextId, bottle):
 
 	# Code facet
 	try:
-		clausen = bottle.request.params.getall("clausen")
+		clausen = params.getall("clausen")
 	except:
 		clausen = []
 
 	try:
-		keyvote = bottle.request.params.getall("keyvote")
+		keyvote = params.getall("keyvote")
 		if len(keyvote):
 			if q is None or q=="":
 				q = "keyvote: 1"
@@ -366,7 +481,7 @@ def assembleSearch(q, nextId, bottle):
 		pass
 
 	try:
-		peltzman = bottle.request.params.getall("peltzman")
+		peltzman = params.getall("peltzman")
 	except:
 		peltzman = []
 	codeString = ""
@@ -383,6 +498,58 @@ def assembleSearch(q, nextId, bottle):
 		else:
 			q += " ("+codeString+")"
 
+	return q, startdate, enddate, chamber
+
+def assembleSearch(q, nextId, bottle):
+	# Scrolling: the page may have been fetched along with an earlier one.
+	windowKey = searchWindowKey(q, bottle.request.params)
+	if nextId:
+		page = searchWindows.get((windowKey, nextId))
+		if page is not None:
+			# Cached pages still count against the user's quota check, and are logged at no cost.
+			quotaCheck = logQuota.checkQuota(bottle.request)
+			if quotaCheck["status"]:
+				bottle.response.headers["rollcall_number"] = -999
+				bottle.response.headers["member_number"] = 0
+				bottle.response.headers["nextId"] = 0
+				return bottle.template("views/search_results", rollcalls=[], errormessage=quotaCheck["error_message"], resultMembers=[], resultParties=[])
+			logQuota.logSearch(bottle.request, {"query": q, "query_extra": "Search page from cache", "resultNum": page["recordcountTotal"]})
+			bottle.response.headers["rollcall_number"] = page["recordcountTotal"]
+			bottle.response.headers["member_number"] = 0
+			bottle.response.headers["party_number"] = 0
+			bottle.response.headers["nextId"] = page["nextId"]
+			bottle.response.headers["need_score"] = page["needScore"]
+			bottle.response.headers["search_cache"] = "hit"
+			return bottle.template("views/search_results", rollcalls=page["rollcalls"], highlighter=page["fulltextSearch"], errormessage="", resultMembers=[], resultParties=[])
+
+	# First, get the current congress
+	max_congress = current_congress()
+
+	lookup, needScore, redirFlag, expandResults, suppressRollcalls = memberIntent(q, nextId, max_congress)
+
+	# The party, member and rollcall searches are independent, so they run side by side
+	# on the search pool; each gets its own timeout (see collectBranch).
+	branches = {}
+	if lookup:
+		branches["members"] = dispatchBranch(findMembers, q, lookup, needScore, expandResults)
+	if not suppressRollcalls and q is not None and not nextId and not ":" in q and len(q.split())<4 and len(q):
+		branches["parties"] = dispatchBranch(findParties, q)
+
+	if suppressRollcalls:
+		resultMembers, count_members = collectBranch(branches, "members", ([], 0))
+		bottle.response.headers["server_timing"] = branchTimings(branches)
+		bottle.response.headers["rollcall_number"] = 0
+		bottle.response.headers["member_number"] = count_members
+		bottle.response.headers["party_number"] = 0
+
+		if len(resultMembers) > 50:
+			resultMembers = resultMembers[:50]
+
+		out = bottle.template("views/search_results", rollcalls = [], errormessage="", resultMembers=resultMembers, resultParties=[])
+		return out
+
+	q, startdate, enddate, chamber = facetQuery(q, bottle.request.params)
+
 	# Sort facet
 	sortD = int(defaultValue(bottle.request.params.sortD,-1))
 	try:
@@ -395,7 +562,17 @@ def assembleSearch(q, nextId, bottle):
 	icpsr = defaultValue(bottle.request.params.icpsr)
 	jsapi = 1
 	rowLimit = 50
-	res = query(q, startdate, enddate, chamber, icpsr=icpsr, rowLimit=rowLimit, jsapi=jsapi, sortDir=sortD, sortSkip=nextId, sortScore=sortScore, request=bottle.request)
+	# bottle.request is thread-local, so the rollcall branch gets its own request object for the quota log.
+	queryArgs = {"startdate": startdate, "enddate": enddate, "chamber": chamber, "icpsr": icpsr, "rowLimit": rowLimit*SEARCH_WINDOW_PAGES,
+		     "jsapi": jsapi, "sortDir": sortD, "sortSkip": nextId, "sortScore": sortScore, "request": bottle.BaseRequest(bottle.request.environ),
+		     "countCap": SEARCH_COUNT_CAP, "pageSize": rowLimit, "maxTimeMS": BRANCH_TIMEOUTS["rollcalls"]*1000}
+	branches["rollcalls"] = dispatchBranch(findRollcalls, q, queryArgs, windowKey)
+
+	res = collectBranch(branches, "rollcalls", {"errormessage": "Your search took too long to complete. Please try a more specific search."})
+	resultParties = collectBranch(branches, "parties", [])
+	resultMembers, count_members = collectBranch(branches, "members", ([], 0))
+	bottle.response.headers["server_timing"] = branchTimings(branches)
+	bottle.response.headers["search_cache"] = "miss"
 
 	if "errormessage" in res:
 		bottle.response.headers["rollcall_number"] = -999
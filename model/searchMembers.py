@@ -1,22 +1,21 @@
 import pymongo
 import json
 import traceback
-import os
 from stateHelper import stateNameToAbbrev, stateName, stateIcpsr
-from searchParties import partyName, noun, partyColor, shortName
+from searchParties import resolveParties
 from slugify import slugify
+from bioImages import bioImageFile
+import nameIndex
+import memberDirectory
 #from searchMeta import metaLookup
 client = pymongo.MongoClient()
 try:
 	dbConf = json.load(open("./model/db.json","r"))
-	nicknames = json.load(open("./model/nicknames.json","r"))
 except:
         try:
                 dbConf = json.load(open("./db.json","r"))
-		nicknames = json.load(open("./nicknames.json", "r"))
         except:
                 dbConf = {'dbname':'voteview'}
-		nicknames = []
 db = client[dbConf["dbname"]]
 
 #m = metaLookup()
@@ -35,7 +34,7 @@ def cqlabel(state_abbrev, district_code):
                 cqlabel = ""
         return cqlabel
 
-def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
+def memberLookup(qDict, maxResults=50, distinct=0, api="Web", maxTimeMS=0):
 	# Setup so that the bottle call to this API doesn't need to know parameters we accept explicitly
 	name = qDict["name"] if "name" in qDict else ""
 	icpsr = qDict["icpsr"] if "icpsr" in qDict else ""
@@ -118,8 +117,15 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 			print traceback.format_exc()
 			return({"errormessage": "Invalid congress ID supplied."})
 
+	nameScores = None
 	if name:
-		if ", " in name: # Last, First
+		# Any other filter can cut the best matches, so then we take every match.
+		onlyName = not (icpsr or id or state_abbrev or congress or chamber or party_code or bioguide_id or district_code or speaker or freshman or idIn or biography)
+		matches = nameIndex.search(name, maxResults if onlyName else None)
+		if matches is not None:
+			nameScores = dict((i, s) for i, s in matches if "icpsr" not in searchQuery or i == searchQuery["icpsr"])
+			searchQuery["icpsr"] = {"$in": nameScores.keys()}
+		elif ", " in name: # Last, First
 			last, rest = name.split(", ",1)
 			searchQuery["$text"] = {"$search": rest+" "+last}
 		else:
@@ -189,15 +195,21 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 		fieldSet["score"] = {"$meta": "textScore"}
 
 	res = db.voteview_members.find(searchQuery, fieldSet)
-	# Try to induce regex if a name search fails?
-	hypotheticalCount = res.count()
-	if "$text" in searchQuery and hypotheticalCount==0:
+	if maxTimeMS:
+		res = res.max_time_ms(maxTimeMS)
+	# Try to induce regex if a name search fails? Only needed without the name index, which is typo tolerant.
+	if "$text" in searchQuery and res.count()==0:
 		print "No results from a name search, fall back to regex"
 		del searchQuery["$text"]
 		searchQuery["bioname"] = {'$regex': name, '$options': 'i'}
 		res = db.voteview_members.find(searchQuery, fieldSet)
+		if maxTimeMS:
+			res = res.max_time_ms(maxTimeMS)
 
-        if "$text" in searchQuery:
+	if nameScores is not None:
+		# Best name match first, then as the text search sorted.
+		sortedRes = sorted(res.sort([('icpsr', -1), ('congress', -1)]), key=lambda m: -nameScores.get(m.get("icpsr"), 0))
+        elif "$text" in searchQuery:
 		sortedRes = res.sort([('score', {'$meta': 'textScore'}), ('icpsr', -1), ('congress', -1)])
 	elif api=="exportORD":
                 db.voteview_members.ensure_index([('state_abbrev', 1), ('district_code', 1), ('icpsr', 1)], name="ordIndex")
@@ -216,6 +228,8 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 		else:
 			currentICPSRs.append(m["icpsr"])
 		newM = m
+		if nameScores is not None:
+			newM["nameScore"] = nameScores.get(newM["icpsr"], 0)
 
 		if "state_abbrev" in newM:
 			newM["state"] = stateName(newM["state_abbrev"])
@@ -224,18 +238,8 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 		if "district_code" in newM and "state_abbrev" in newM:
                         newM["cqlabel"] = cqlabel(newM["state_abbrev"], newM["district_code"])
 
-		if "party_code" in newM:
-                        newM["party_name"] = partyName(newM["party_code"])
-                        if api not in ["exportORD", "exportCSV", "R"]:
-			        newM["party_noun"] = noun(newM["party_code"])
-			        newM["party_color"] = partyColor(newM["party_code"])
-			        newM["party_short_name"] = shortName(newM["party_code"])
-
 		# Check if an image exists.
-		if os.path.isfile("/var/www/voteview/static/img/bios/"+str(newM["icpsr"]).zfill(6)+".jpg"):
-			newM["bioImgURL"] = str(newM["icpsr"]).zfill(6)+".jpg"
-		else:
-			newM["bioImgURL"] = "silhouette.png"
+		newM["bioImgURL"] = bioImageFile(newM["icpsr"])
 
                 if api in ["exportCSV", "exportORD"]:
                         if 'bioname' in newM:
@@ -258,6 +262,17 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 		if i>=maxResults:
 			break
 
+	# Party names for every row, resolved in one go.
+	parties = resolveParties(set(m["party_code"] for m in response if "party_code" in m))
+	for newM in response:
+		if "party_code" in newM:
+			party = parties[newM["party_code"]]
+			newM["party_name"] = party[0]
+			if api not in ["exportORD", "exportCSV", "R"]:
+				newM["party_noun"] = party[1]
+				newM["party_color"] = party[2]
+				newM["party_short_name"] = party[3]
+
 	if len(response)>maxResults and maxResults>1: # For regular searches get mad if we have more than max results.
 		errormessage = "Capping number of responses at "+str(maxResults)+"."
 
@@ -268,19 +283,26 @@ def memberLookup(qDict, maxResults=50, distinct=0, api="Web"):
 	else:
 		return({'results': response})
 
+def rosterLookup(qDict, maxResults, distinct, api):
+	# Rosters come from the in-memory directory when it can answer them.
+	out = memberDirectory.lookup(qDict, maxResults, distinct, api)
+	if out is None:
+		out = memberLookup(qDict, maxResults=maxResults, distinct=distinct, api=api)
+	return out
+
 def getMembersByCongress(congress, chamber, api="Web"):
 	if not chamber:
-		return(memberLookup({"congress": congress}, maxResults=600, distinct=0, api=api))
+		return(rosterLookup({"congress": congress}, 600, 0, api))
 	elif chamber and congress:
-		return(memberLookup({"congress": congress, "chamber": chamber}, maxResults=600, distinct=0, api=api))
+		return(rosterLookup({"congress": congress, "chamber": chamber}, 600, 0, api))
 	else:
 		return({'errormessage': 'You must provide a chamber or congress.'})
 
 def getMembersByParty(id, congress, api="Web"):
 	if id and congress:
-		return(memberLookup({"party_code": id, "congress": congress}, maxResults=500, distinct=1, api=api))
+		return(rosterLookup({"party_code": id, "congress": congress}, 500, 1, api))
 	elif id:
-		return(memberLookup({"party_code": id}, maxResults=500, distinct=1, api=api))
+		return(rosterLookup({"party_code": id}, 500, 1, api))
 	else:
 		return({'errormessage': 'You must provide a party ID.'})
 
@@ -302,23 +324,11 @@ def nicknameHelper(text, ref=""):
 	return name
 
 def singleNicknameSub(name):
-	done=0
-	steps=0
-	while done==0 and steps<20:
-		candidates = []
-		candidates = candidates + [x["nickname"] for x in nicknames if x["name"].lower()==name.lower()]
-		candidates = candidates + [x["name"] for x in nicknames if x["nickname"].lower()==name.lower()]
-		if len(candidates):
-			candidates.append(name)
-			candidates = sorted(list(set(candidates)), key=lambda x: (len(x), x))
-			newName = candidates[0]
-			if newName!=name:
-				name = newName
-				steps=steps+1
-			else:
-				done=1
-		done=1
-	return name
+	# The representative of the name's nickname group, so "Bill" and "Will" both become "william".
+	alternative = nameIndex.nicknameCanon.get(name.lower())
+	if alternative is None or alternative == name.lower():
+		return name
+	return alternative
 
 def getMembersByPrivate(query):
 	idIn = []
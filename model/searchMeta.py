@@ -1,5 +1,6 @@
 import pymongo
 import json
+import time
 
 cache = {}
 
@@ -15,12 +16,46 @@ except:
 db = client[dbConf["dbname"]]
 
 def metaLookup(api = ""):
-        if not api:
-                returnDict = {"loyalty_counts": 0}
-        elif api == "Web_Members":
-                returnDict = {"nominate": 0}
+	""" The newest metadata record, from memory. The default projection leaves
+	out loyalty_counts; Web_Members leaves out nominate. """
+	meta = latestMeta()
+	if not api:
+		return dict((k, v) for k, v in meta.iteritems() if k != "loyalty_counts")
+	elif api == "Web_Members":
+		return dict((k, v) for k, v in meta.iteritems() if k != "nominate")
+	return dict(meta)
 
-        for m in db.voteview_metadata.find({}, returnDict).sort('time', -1).limit(1):
-                meta = m
+def currentDimweight():
+	""" NOMINATE second dimension weight of the newest data load. """
+	return latestMeta()["nominate"]["second_dimweight"]
 
-        return meta
+def congressLoyalty(congress):
+	""" The global loyalty counts of one congress, or None if there are none. """
+	try:
+		return latestMeta().get("loyalty_counts", {}).get(str(congress))
+	except AttributeError:
+		return None
+
+DATASET_CHECK_INTERVAL = 60 # Seconds between checks for a new data load.
+dataset = {"checked": 0, "version": None}
+
+def datasetVersion():
+	""" Time stamp of the newest metadata record. Every data load writes one, so
+	in-memory caches can be keyed on it; Mongo is asked at most once every
+	DATASET_CHECK_INTERVAL seconds. """
+	now = time.time()
+	if now - dataset["checked"] >= DATASET_CHECK_INTERVAL:
+		for m in db.voteview_metadata.find({}, {"time": 1, "_id": 0}).sort('time', -1).limit(1):
+			dataset["version"] = m.get("time")
+		dataset["checked"] = now
+	return dataset["version"]
+
+def latestMeta():
+	""" The newest metadata record, re-read from Mongo only when datasetVersion()
+	sees a newer one. Shared between callers, so don't modify it. """
+	version = datasetVersion()
+	cached = cache.get("latest")
+	if cached is None or cached[0] != version:
+		cached = (version, db.voteview_metadata.find_one({}, sort=[('time', -1)]) or {})
+		cache["latest"] = cached
+	return cached[1]
@@ -1,8 +1,8 @@
 import pymongo
 import json
 import traceback
-
-cache = {}
+import threading
+from searchMeta import datasetVersion
 
 client = pymongo.MongoClient()
 try:
@@ -51,49 +51,64 @@ def partyLookup(qDict, api):
 
 	return {}
 
+class PartySnapshot(object):
+	""" The whole voteview_parties table as of one dataset version, in arrays
+	indexed by party code. Never changed once built: when the dataset
+	version moves on, partySnapshot() swaps in a new one, so a request that
+	holds a snapshot sees one consistent set of names. """
+	__slots__ = ["version", "fullName", "noun", "colorScheme", "partyname"]
+
+	def __init__(self, version, parties):
+		self.version = version
+		codes = dict((p["id"], p) for p in parties if isinstance(p.get("id"), (int, long)) and p["id"] >= 0)
+		size = max(codes) + 1 if codes else 0
+		for field in self.__slots__[1:]:
+			setattr(self, field, tuple(codes[i].get(field) if i in codes else None for i in xrange(size)))
+
+	def lookup(self, id):
+		""" (full name, noun, color scheme, short name) of a party code. """
+		try:
+			i = int(id)
+		except (ValueError, TypeError):
+			i = -1
+		if 0 <= i < len(self.fullName) and self.fullName[i] is not None:
+			return (self.fullName[i], self.noun[i] or "Error Noun "+str(id), self.colorScheme[i] or "grey", self.partyname[i] or "party "+str(id))
+		return ("Error Party "+str(id), "Error Noun "+str(id), "grey", "party "+str(id))
+
+	def resolve(self, ids):
+		""" lookup() for each of a set of party codes, keyed by code. """
+		return dict((id, self.lookup(id)) for id in ids)
+
+snapshotState = {"snapshot": None}
+snapshotLock = threading.Lock()
+
+def partySnapshot():
+	""" The current PartySnapshot, rebuilt when the dataset version changes. """
+	version = datasetVersion()
+	snapshot = snapshotState["snapshot"]
+	if snapshot is None or snapshot.version != version:
+		with snapshotLock:
+			snapshot = snapshotState["snapshot"]
+			if snapshot is None or snapshot.version != version:
+				snapshot = PartySnapshot(version, list(db.voteview_parties.find({}, {"_id": 0, "id": 1, "fullName": 1, "noun": 1, "colorScheme": 1, "partyname": 1})))
+				snapshotState["snapshot"] = snapshot
+	return snapshot
+
+def resolveParties(ids):
+	""" (full name, noun, color scheme, short name) for each of a set of party codes, keyed by code. """
+	return partySnapshot().resolve(ids)
+
 def noun(id):
-	if str(id) in cache:
-		return cache[str(id)]["noun"]
-	
-	results = partyLookup({"id": id}, "Web_FP_Search")
-	if "results" in results:
-		cache[str(id)] = results["results"][0]
-		return results["results"][0]["noun"]
-	else:
-		return "Error Noun "+str(id)
+	return partySnapshot().lookup(id)[1]
 
 def partyName(id):
-	if str(id) in cache:
-		return cache[str(id)]["fullName"]
-
-	results = partyLookup({"id": id}, "Web_FP_Search")
-	if "results" in results:
-		cache[str(id)] = results["results"][0]
-		return results["results"][0]["fullName"]
-	else:
-		return "Error Party "+str(id)
+	return partySnapshot().lookup(id)[0]
 
 def shortName(id):
-	if str(id) in cache:
-		return cache[str(id)]["partyname"]
-
-	results = partyLookup({"id": id}, "Web_FP_Search")
-	if "results" in results:
-		cache[str(id)] = results["results"][0]
-		return results["results"][0]["partyname"]
-	else:
-		return "party "+str(id)
+	return partySnapshot().lookup(id)[3]
 
 def partyColor(id):
-	if str(id) in cache:
-		return cache[str(id)]["colorScheme"]
-
-	results = partyLookup({"id": id}, "Web_FP_Search")
-	if "results" in results:
-		cache[str(id)] = results["results"][0]
-		return results["results"][0]["colorScheme"]
-	else:
-		return "grey"
+	return partySnapshot().lookup(id)[2]
 
 if __name__ == "__main__":
         print partyLookup({"id":200}, "Web_Members")
@@ -9,7 +9,14 @@ import traceback
 import time
 import re
 import json
+import copy
+import base64
+from bson.son import SON
+from collections import namedtuple
 import logQuota
+from lruCache import LRUCache
+import phraseIndex
+import rollcallIndex
 from downloadVotes import waterfallText, waterfallQuestion
 
 client = pymongo.MongoClient()
@@ -45,25 +52,6 @@ fieldTypes = {"codes": "codes", "codes.Clausen": "code", "codes.Peltzman": "code
 	        "support": "int", "voter": "voter", "chamber": "chamber", "saved": "saved", "dates": "date", "id": "strexact",
 		"startdate": "date", "enddate": "date", "keyvote": "key_flags"}
 
-# Simple tab-based pretty-printer to output debug info.
-def pPrint(printStr, depth=0,debug=0):
-	""" Simple tab-based pretty-printer.
-
-	Parameters
-	----------
-	printStr: str
-		This is the string to pretty-print
-	depth: int, optional
-		This is the number of tabs to precede the printing
-	debug: int, optional
-		If debug is set to 0 or not set, nothing will print.
-	"""
-	if not debug:
-		return
-	tabChar = "\t"*depth
-	print tabChar,
-	print printStr
-
 # Simple check that dates are formatted correctly
 def checkDate(dateStr):
 	""" Checks if date is either YYYY or YYYY-MM-DD
@@ -89,6 +77,25 @@ def checkDate(dateStr):
 	else:
 		return False
 
+# Parsed queries keyed on whitespace-normalized query text, so "load more" pages and
+# popular searches skip the parser. Entries hold the AST and, when compiling it doesn't
+# consult the database, the compiled Mongo dict as well.
+queryCache = LRUCache(2000)
+
+# Typed query AST. Leaves are atomic field queries (e.g. "congress: 113 chamber: house")
+# that parseFreeformQuery turns into a Mongo dict; interior nodes combine their children.
+QueryLeaf = namedtuple("QueryLeaf", ["text"])
+QueryAnd = namedtuple("QueryAnd", ["children"])
+QueryOr = namedtuple("QueryOr", ["children"])
+
+MAX_QUERY_DEPTH = 5
+
+# Field types whose compiled query depends on database contents (stash IDs, full-text candidates).
+VOLATILE_FIELD_TYPES = ["str", "saved"]
+
+class QuerySyntaxError(Exception):
+	pass
+
 def queryDispatcher(textQ):
 	""" Oversees the query pipeline. Takes a raw text query, outputs the final goods to hit the database.
 	
@@ -107,446 +114,246 @@ def queryDispatcher(textQ):
 	str
 		An error message
 	"""
-	textQ = str(textQ)
-	errorMessage = ""
+	textQ = " ".join(str(textQ).split())
 
-	# If there's no field specified then this is the generic search, and we should prepend it by doing
-	# the all text fuzzy search, then dispatch it.
-	if not ":" in textQ:
-		# If there's a literal string, adding description results in a regex over just that field
-		# Otherwise it will hit the fulltext index, just like alltext would
-		textQ = "alltext: " + textQ
-		simpleSearch, needScore, errorMessage = parseFreeformQuery(textQ)
-		return [simpleSearch, needScore, errorMessage]
-
-	# Remove string literals
-	strLiterals = re.findall("(\[[^\]]*\])",textQ)
-	i=0
-	for sub in strLiterals:
-		textQ = re.sub("(\[[^\]]*\])","|STR_LITERAL_"+str(i)+"|",textQ,count=1)
-		i=i+1
-
-	stage1, errorMessage = parenParser(textQ,debug=0)
-	if type(stage1)==type(0) and stage1==-1:
-		return [-1, 0, errorMessage]
-	stage2, errorMessage = booleanParser(stage1,debug=0)
-	if type(stage2)==type(0) and stage2==-1:
-		return [-1, 0, errorMessage]
-	stage3, errorMessage = organizeOr(stage2,debug=0)
-	if type(stage3)==type(0) and stage3==-1:
-		return [-1, 0, errorMessage]
+	cached = queryCache.get(textQ)
+	if cached is None:
+		try:
+			ast = parseQuery(textQ)
+		except QuerySyntaxError as e:
+			cached = (None, [-1, 0, str(e)])
+		else:
+			cached = (ast, None if queryIsVolatile(ast) else compileQuery(ast))
+		queryCache.set(textQ, cached)
 
-	# Put string literals back in
-	if len(strLiterals):
-		status, stage3Result = strLiteralParser(stage3, strLiterals)
-		if status==0:
-			return [{}, 0, "Error: Could not complete string literal substitution. "]
-	else:
-		stage3Result = stage3
-	
-	print stage3Result
-	stage4, needScore, errorMessage = metaProcessFreeformQuery(stage3Result,debug=0)
-	return [stage4, needScore, errorMessage]
+	ast, compiled = cached
+	if compiled is None:
+		return compileQuery(ast)
+	return copy.deepcopy(compiled)
 
-def strLiteralParser(searchSpace, replaceSet, i=0, debug=0):
-	""" String literal re-substitution procedure. We remove string literals contained in []
-	square braces earlier in the parsing process. This re-injects them recursively regardless of
-	how the parser has re-ordered data.
+def tokenizeQuery(textQ):
+	""" Single-pass tokenizer for query text. Square-bracketed literals such as "[1 to 5]" are
+	kept whole inside their word, so parentheses and booleans inside them are inert.
 
 	Parameters
 	----------
-	searchSpace : list
-		A list of strings or lists output by step 3 of the parser
-	replaceSet : list
-		An ordered list of strings that will be injected into the search space.
-	i : int, optional
-		What place in the replaceSet you are in. Necessary for recursion to remember place in list.
-	debug : int, optional
-		Whether or not to print debug print statements (there are none in this method as of Apr 21)
+	textQ: str
+		The query text
 
 	Returns
 	-------
-	int
-		Success? 1 or 0
 	list
-		The updated searchSpace with substitutions injected. If the process errors out, the
-		partially-completed task returns what it can.
+		(kind, value) tuples, where kind is one of "(", ")", "AND", "OR" or "WORD"
+	"""
+	tokens = []
+	word = []
+
+	def flush():
+		if word:
+			value = "".join(word)
+			tokens.append((value if value in ["AND", "OR"] else "WORD", value))
+			del word[:]
+
+	i = 0
+	while i < len(textQ):
+		c = textQ[i]
+		if c == "[" and textQ.find("]", i) != -1:
+			end = textQ.find("]", i)
+			word.append(textQ[i:end+1])
+			i = end + 1
+			continue
+		if c.isspace():
+			flush()
+		elif c == "(" or c == ")":
+			flush()
+			tokens.append((c, c))
+		else:
+			word.append(c)
+		i += 1
+	flush()
+	return tokens
+
+def dropPlainGroups(tokens):
+	""" Removes the parentheses of groups with no OR inside (including empty ones). They
+	don't change the query, so they neither count towards MAX_QUERY_DEPTH nor cost a
+	level of recursion. Unmatched parentheses are left for the parser to report. """
+	drop = set()
+	opened = []
+	ors = 0
+	for i, (kind, value) in enumerate(tokens):
+		if kind == "OR":
+			ors += 1
+		elif kind == "(":
+			opened.append((i, ors))
+		elif kind == ")" and opened:
+			start, orsBefore = opened.pop()
+			if ors == orsBefore:
+				drop.update([start, i])
+	return [token for i, token in enumerate(tokens) if i not in drop]
+
+class QueryParser(object):
+	""" Recursive-descent parser over tokenizeQuery output.
+
+		orExpr  := andExpr ("OR" andExpr)*
+		andExpr := (WORD | "AND" | "(" orExpr ")")+
+
+	Adjacent words form a single leaf, which Mongo ANDs together in one dict. Parentheses
+	only matter around an OR (see dropPlainGroups), and a group that still comes out a
+	single leaf is folded into the surrounding words.
 	"""
 
-	for litReplace in replaceSet:
-		sat=0
-		for j in xrange(0,len(searchSpace)):
-			if type(searchSpace[j])==type([]): # This chunk of query is deeper, so pass through
-				sat, searchSpace[j] = strLiteralParser(searchSpace[j], [litReplace], i)
-				if sat==0:
-					continue
+	def __init__(self, tokens):
+		self.tokens = tokens
+		self.pos = 0
+
+	def peek(self):
+		if self.pos < len(self.tokens):
+			return self.tokens[self.pos][0]
+		return None
+
+	def parse(self):
+		node = self.parseOr(0)
+		if self.peek() is not None:
+			raise QuerySyntaxError("Error: Unclosed parenthesis in query.")
+		return node
+
+	def parseOr(self, depth):
+		if depth > MAX_QUERY_DEPTH:
+			raise QuerySyntaxError("Error: Excessive query depth. Please simplify query.")
+
+		branches = []
+		while True:
+			branch = self.parseAnd(depth)
+			if branch is None:
+				if branches:
+					raise QuerySyntaxError("Invalid query: ends with OR clause.")
+				elif self.peek() == "OR":
+					raise QuerySyntaxError("Invalid query: starts with OR clause.")
+				raise QuerySyntaxError("Error: Empty search field.")
+			branches.append(branch)
+
+			if self.peek() != "OR":
+				break
+			self.pos += 1
+
+		if len(branches) == 1:
+			return branches[0]
+		return QueryOr(tuple(branches))
+
+	def parseAnd(self, depth):
+		parts = []
+		words = []
+		while self.peek() not in [None, ")", "OR"]:
+			kind, value = self.tokens[self.pos]
+			self.pos += 1
+			if kind == "WORD":
+				words.append(value)
+			elif kind == "(":
+				node = self.parseOr(depth + 1)
+				if self.peek() != ")":
+					raise QuerySyntaxError("Error: Unclosed parenthesis in query.")
+				self.pos += 1
+
+				if isinstance(node, QueryLeaf):
+					words.append(node.text)
 				else:
-					break
-			else:
-				if "STR_LITERAL_"+str(i)+"|" in searchSpace[j]:
-					searchSpace[j] = re.sub("\|STR\_LITERAL\_"+str(i)+"\|",litReplace,searchSpace[j],count=1)
-					sat=1
-					break
-		if sat==0:
-			return [0, searchSpace]
-		i=i+1
-	return [1, searchSpace]
-				
-def parenParser(myStr, depth=0, debug=1):
-	""" Step 1 of the parsing pipeline. Takes in a raw text query, identifies parenthetical groups.
-	Removes useless parenthetical groups. Returns one of several error messages if necessary.
+					if words:
+						parts.append(QueryLeaf(" ".join(words)))
+						words = []
+					parts.append(node)
+			# Explicit ANDs are implied by adjacency, so they're just dropped.
 
-	Parameters
-	----------
-	myStr : str
-		The query text
-	depth : int, optional
-		How deep we are in the depth search
-	debug : int, optional
-		Whether or not to output debug information
+		if words:
+			parts.append(QueryLeaf(" ".join(words)))
 
-	Returns
-	-------
-	list
-		A list suitable for ingestion in the boolean parser.
-		If query fails, returns the integer -1
-	str
-		Error message, if any.
-	"""
-
-	pPrint(myStr, depth, debug)
-	# Check for recursive loop
-	if depth>5:
-		pPrint("error: excessive depth",depth,debug)
-		return [-1, "Error: Excessive query depth. Please simplify query."]
-
-	# Check for parenthesis matching
-	if myStr.count("(") != myStr.count(")"):
-		pPrint("error: unmatched parentheses!", depth,debug)
-		return [-1, "Error: Syntax error in query. You have unmatched parentheses."]
-
-	# Check for obvious boolean errors that should never happen
-	if myStr.strip().endswith(" AND") or myStr.strip().startswith("AND ") or myStr.strip().endswith(" OR") or myStr.strip().startswith("OR "):
-		pPrint("error: starts or ends with invalid boolean!", depth, debug)
-		return [-1, "Error: Query starts or ends with a boolean and is invalid."]
-
-	# Pre-allocate results list
-	results = []
-	resultString = ""
-	i=0
-
-	# Parentheses are only used to override order of operations. If there's no or at this level, then we can just treat this as a string.
-	orFind = myStr.find(" OR ")
-	if orFind==-1:
-		pPrint("no logic, clean",depth,debug)
-		# No boolean logic at all
-		myStr = myStr.replace("(","").replace(")","")
-		return [myStr, ""]
-
-	# If we're here, there's an or.
-	pPrint("An or has been found...", depth, debug)
-	# Identify parenthetical groups one at a time.
-	while i!=-1:
-		oldI = i
-		# Find the first parenthesis starting from our current position, i
-		i = myStr.find("(",i)
-		if i != -1:
-			# Everything up until the parenthesis can be added into our results, untouched
-			resultString = resultString+myStr[oldI:i]
-			pPrint("Found at least one parenthesis", depth, debug)
-			# Okay now walk slowly through string to find the close parenthesis
-			parenCount=1
-			foundEnd=0
-			for j in xrange(i+1, len(myStr)):
-				# Found nested parenthesis
-				if myStr[j]=="(":
-					parenCount+=1
-				# Found a close parenthesis
-				elif myStr[j]==")":
-					parenCount-=1
-					# Found matching close parenthesis
-					if parenCount==0:
-						pPrint("Found matching close parenthesis",depth,debug)
-						# Take what's inside the parenthetical and recursively search it for parentheticals.
-						result, errorMessage = parenParser(myStr[i+1:j],depth+1,debug)
-						i = j+1 # Start looking after the current parenthesis
-						foundEnd=1 # Remind my code below we've found the matching parenthesis
-						
-						# If it's a string then there was nothing interesting in the parentheses and we can keep treating it as a string.
-						if type(result)==type(""):
-							resultString = resultString+result
-						# If it's a list, then the parenthetical parser thinks the parentheses might matter (there's an or in there).
-						elif type(result)==type([]):
-							# Append anything in the buffer so far.
-							if len(resultString.strip()):
-								results.append(resultString.strip())
-								resultString = ""
-							# Now, separately, append the recursive result.
-							results.append(result)
-						# If it's an error, cascade the error back.
-						elif type(result)==type(0) and result==-1:
-							return [-1, errorMessage]
-						break
-
-			# Unclosed parenthesis
-			if foundEnd==0:
-				return [-1, "Error: Unclosed parenthesis in query."]
-
-	# Whatever is left over at the end, add it to the buffer
-	resultString = resultString+myStr[oldI:]
-	if len(resultString.strip()):
-		results.append(resultString.strip())
-
-	# If this appears to be a redundant parenthesis [i.e. ((A))], then return what's inside, if not return the whole thing.
-	if len(results)==1 and type(results[0])==type([]):
-		return [results[0], ""]
-	else:
-		return [results, ""]
+		if not parts:
+			return None
+		elif len(parts) == 1:
+			return parts[0]
+		return QueryAnd(tuple(parts))
 
-def booleanParser(myList, depth=0, debug=1):
-	""" Step 2 of the parsing pipeline. Takes what was output from the parenthetical parser, and processes it for booleans.
-	We leverage the parenthetical parser to sort out parenthesis causing order of operations issues.
-	This will remove AND booleans, since we don't need them explicitly.
+def parseQuery(textQ):
+	""" Parses query text into the typed query AST.
 
 	Parameters
 	----------
-	myList : list
-		The output from the parenthesis parser.
-	depth : int, optional
-		How deep we are in the recursive stack
-	debug : int, optional
-		Whether or not to output debug information
+	textQ: str
+		The query text
 
 	Returns
 	-------
-	list
-		A list suitable for ingestion into the next phase of the parser
-		If query fails, returns the integer -1
-	str
-		Error message, if any.
-	"""
-	errorMessage = ""
-
-	# I got an error code, not a list
-	if type(myList)==type(0):
-		return [-1, "Boolean parser did not receive valid list."]
-
-	# I got a string, not a list, treat it as a one element list
-	if type(myList)==type(""):
-		myList = [myList]
-	results = []
-
-	# Loop through our list
-	for item in myList:
-		pPrint(item, depth, debug)
-		# The list item is a list, recursively process it
-		if type(item)==type([]):
-			res, errorMessage = booleanParser(item, depth+1, debug)
-			# It returned an error, propagate that
-			if type(res)==type(0) and res==-1:
-				return [-1, errorMessage]
-			results.append(res)
-		# The list item is a string
-		else:
-			# Remove those redundant AND queries.
-			item = re.sub("(^| )AND( |$)"," ",item)
-			done=0
-			i=0
-			while done==0:
-				# In cases where there's a OR immediately before a parenthesis, hack to make the parser realize this.
-				if item.endswith(" OR"):
-					item=item+" "
-
-				# Look for the nearest or
-				orFind = item.find("OR ",i)
-
-				# There was no or here, just append it as is
-				if orFind==-1:
-					# We're OK
-					if len(item[i:].strip()):
-						results.append(item[i:].strip())
-					done=1
-				# There is an or. Append anything we have in our buffer, then append the OR item separately.
-				else:
-					if orFind!=i and len(item[i:orFind].strip()):
-						results.append(item[i:orFind].strip())
-					results.append("OR")
-					# Update search to start after the OR we found.
-					i = orFind+2
-
-	# Query seems to start with an OR inside a parenthesis, that's an error.
-	if type(results[0])==type("") and results[0]=="OR":
-		pPrint("error: invalid query, starts with or clause.",depth,debug)
-		return [-1, "Invalid query: starts with OR clause."]
-	# Query seems to end with an OR inside a parenthesis, that's an error.
-	if type(results[-1])==type("") and (results[-1]=="OR" or results[-1].endswith(" OR")):
-		pPrint("error: invalid query, ends with or clause.",depth,debug)
-		return [-1, "Invalid query: ends with OR clause."]
-
-	return [results, ""]
-
-def organizeOr(segments,depth=0,debug=1):
-	""" Step 3 of the parsing pipeline. Takes the output from the boolean parser and re-organizes it. At the end, every atomic list will either
-	Not contain an OR statement, or start with OR and then contain a series of things that should be or-ed together
+	QueryLeaf, QueryAnd or QueryOr
+		Root of the AST.
 
-	Parameters
-	----------
-	segments : list
-		Output from boolean parser
-	depth : int
-		How deep we are in the recursive search
-	debug : int 
-		Whether or not to output debug information
-
-	Returns
-	-------
-	list
-		A list suitable for being processed by the meta freeform query parser
-		If query fails, returns the integer -1
-	str
-		Error message, if any
+	Raises
+	------
+	QuerySyntaxError
+		With the user-facing error message if the query is malformed.
 	"""
+	# If there's no field specified then this is the generic search, we send the whole thing
+	# to the all text search (fulltext index, or a literal string if quoted).
+	if not ":" in textQ:
+		return QueryLeaf("alltext: " + textQ)
 
-	errorMessage = ""
-
-	# We have an error code, not a list.
-	if type(segments)==type(0) and segments==-1:
-		return [-1, "OR parser did not receive list."]
-
-	if depth>10:
-		return [-1, "Error: Infinite recursive loop in OR processor. Segments: "+str(segments)]
-
-	# We have a string, not a list, so we have no ORs or anything tough.
-	if type(segments)==type(""):
-		pPrint("Just a string, no worries.",depth,debug)
-		return [segments, ""]
-	# We have deeper segments but not ORs. Iterate through the segments, process them recursively, return
-	# them as separate segments (this happens with weird recursive ANDs)
-	elif type(segments)==type([]) and "OR" not in segments:
-		newSegments = []
-		for segment in segments:
-			res, errorMessage = organizeOr(segment,depth+1,debug)
-			if type(res)==type(0) and res==-1:
-				return [-1, errorMessage]
-			else:
-				newSegments.append(res)
-		return [newSegments, ""]
-	# There's an or.
-	else:
-		newSegments = []
-		# We prefix the OR segment with an OR.
-		newSegments.append("OR")
-		bufferSegments = []
-		# Loop through all the segments we got, buffer them, and then output them
-		for segment in segments:
-			# We found an OR, dump everything in the buffer
-			if type(segment)==type("") and segment=="OR":
-				# Nothing in the buffer, OR came first, this is bad.
-				if not len(bufferSegments):
-					pPrint("Error: Or comes at beginning of query.",depth,debug)
-					return [-1, "Query error: OR comes at beginning of unprocessed query."]
-				# We're good, dump it in the buffer
-				else:
-					# Recursively process the buffer to make sure it doesn't contain more ORs
-					res, errorMessage = organizeOr(bufferSegments,depth+1,debug)
-					# Recursive processing failed, dump it.
-					if type(res)==type(0) and res==-1:
-						return [-1, errorMessage]
-					# We got back a list, add it.
-					elif len(res)>1:
-						newSegments.append(res)
-					# We got back an item in a redundant list, just pass-through the item.
-					else:
-						newSegments.append(res[0])
-						
-					bufferSegments = []
-			# If it's not an OR, then add it to the buffer
-			else:
-				bufferSegments.append(segment)
+	tokens = tokenizeQuery(textQ)
+	if not tokens:
+		raise QuerySyntaxError("Error: Empty search field.")
 
-		# If we have nothing in the buffer at the end then the query ended with OR
-		if not len(bufferSegments):
-			pPrint("Error: OR comes at end of query.",depth,debug)
-			return [-1, "Query error: OR comes at end of unprocessed query."]
-		# Dump the remaining buffer
-		else:
-			# Recursively process as above
-			res, errorMessage = organizeOr(bufferSegments,depth+1,debug)
-			# Returned error
-			if type(res)==type(0) and res==-1:
-				return [-1, errorMessage]
-			elif len(res)>1:
-				newSegments.append(res)
-			else:
-				newSegments.append(res[0])
+	kinds = [kind for kind, value in tokens]
+	if kinds.count("(") != kinds.count(")"):
+		raise QuerySyntaxError("Error: Syntax error in query. You have unmatched parentheses.")
+	if kinds[0] in ["AND", "OR"] or kinds[-1] in ["AND", "OR"]:
+		raise QuerySyntaxError("Error: Query starts or ends with a boolean and is invalid.")
 
-		return [newSegments, ""]
+	tokens = dropPlainGroups(tokens)
+	if not tokens:
+		raise QuerySyntaxError("Error: Empty search field.")
+	return QueryParser(tokens).parse()
 
-def metaProcessFreeformQuery(query,depth=0,debug=0):
-	""" Stage 4 of the processing pipeline. Takes the output of the or processor, dispatches it to the freeform query parser,
-	assembles it into a Mongo-ready cluster of data.
+def compileQuery(node):
+	""" Compiles a query AST into the Mongo query dict.
 
 	Parameters
 	----------
-	query : list
-		Output from the or-processor, to dispatch to freeform query parser
-	depth : int, optional
-		How deep we are in the depth search
-	debug : int, optional
-		Whether or not to output debug information
+	node: QueryLeaf, QueryAnd or QueryOr
+		Root of the (sub)query to compile
 
 	Returns
 	-------
 	dict
 		Valid mongo query dict to hit database with.
+		If compilation fails, returns the integer -1
 	int
 		Whether or not the query will need score information
 	str
 		Any error generated during the query.
 	"""
-	qDict = {}
-	needScore = 0
+	if isinstance(node, QueryLeaf):
+		return parseFreeformQuery(node.text)
 
-	# We got a string, just query it directly
-	if type(query)!=type([]) and type(query)==type(""):
-		res, needScoreRet, errorMessage = parseFreeformQuery(query)
+	key = "$or" if isinstance(node, QueryOr) else "$and"
+	qDict = {key: []}
+	needScore = 0
+	for child in node.children:
+		res, needScoreRet, errorMessage = compileQuery(child)
 		if type(res)==type(0) and res==-1:
 			return [-1, 0, errorMessage]
 		needScore = needScore or needScoreRet
-		return [res, needScore, ""]
-	else:
-		if query[0]=="OR":
-			qDict["$or"] = []
-			for i in xrange(1,len(query)):
-				if type(query[i])==type([]):
-					res, needScoreRet, errorMessage = metaProcessFreeformQuery(query[i],depth+1,debug)
-					if type(res)==type(0) and res==-1:
-						return [-1, 0, errorMessage]
-					needScore = needScore or needScoreRet
-					qDict["$or"].append(res)
-				else:
-					res, needScoreRet, errorMessage = parseFreeformQuery(query[i])
-					if type(res)==type(0) and res==-1:
-						return [-1, 0, errorMessage]
-					needScore = needScore or needScoreRet
-					qDict["$or"].append(res)
-		else:
-			if len(query)==1:
-				res, needScoreRet, errorMessage = parseFreeformQuery(query[0])
-				if type(res)==type(0) and res==-1:
-					return [-1, 0, errorMessage]
-				needScore = needScore or needScoreRet
-				qDict = res
-			else:
-				qDict["$and"] = []
-				for item in query:
-					res, needScoreRet, errorMessage = metaProcessFreeformQuery(item, depth+1, debug)
-					if type(res)==type(0) and res==-1:
-						return [-1, 0, errorMessage]
-					needScore = needScore or needScoreRet
-					qDict["$and"].append(res)
+		qDict[key].append(res)
 
-	return [qDict, needScore, errorMessage]
+	return [qDict, needScore, ""]
+
+def queryIsVolatile(node):
+	""" Does compiling this query consult the database? If so only its parse can be cached. """
+	if isinstance(node, QueryLeaf):
+		if "\"" in node.text:
+			return True
+		for word in node.text.split():
+			if ":" in word and fieldTypes.get(word.split(":", 1)[0], "str") in VOLATILE_FIELD_TYPES:
+				return True
+		return False
+
+	return any(queryIsVolatile(child) for child in node.children)
 
 def parseFreeformQuery(qtext):
 	""" Takes an atomic Mongo query (no AND, no OR, no parentheses, etc. Isolates field names and dispatches the fields
@@ -604,7 +411,6 @@ def parseFreeformQuery(qtext):
 			if not queryField:
 				queryField = "alltext"
 				queryWords = word.strip()
-				print "assuming alltext search for unspecified field for word "+word
 				#errorMessage = "Search query did not specify field to search."
 				# Searching in a field when we have nothing
 				#error = 1 
@@ -617,8 +423,6 @@ def parseFreeformQuery(qtext):
 		nSMax = nSMax or needScore
 		if errorMessage:
 			return [-1, 0, errorMessage]
-		print "Getting ready to submit final adjudication:"
-		print nSMax
 		return [queryDict, nSMax, ""]
 	else: # Got an error in a chunk
 		return [-1, 0, errorMessage]
@@ -645,14 +449,13 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 		Any error message generated
 	"""
 	
-	print "asked to assemble "+queryField+" / "+queryWords
-
 	global fieldTypes
 	queryWords = queryWords.strip()
 	if len(queryWords)==0:
 		return [queryDict, 0, "Error: Empty search field."]
 	
 	needScore = 0
+	exactPhrase = 0
 	fieldType = "str" if not queryField in fieldTypes else fieldTypes[queryField]
 	if fieldType=="flexstr":
 		#print "flexible string field, checking for quotation marks to see if we want a literal str or to ask the fulltext search."
@@ -662,6 +465,7 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 		if queryWords.strip()[0]=="\"" and queryWords.strip()[-1]=="\"":
 			queryWords = queryWords[1:-1].lower()
 			fieldType = "str"
+			exactPhrase = 1
 		else:
 			fieldType = "fulltext"
 
@@ -670,7 +474,12 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 			queryWords = queryWords[1:-1]
 		if queryWords.strip()[0]=="\"" and queryWords.strip()[-1]=="\"":
 			queryWords = queryWords[1:-1].lower()
-			print "alltext to regexp or"
+			# Whole-word phrases come straight from the phrase index
+			phraseIds = phraseIndex.phraseSearch(queryWords) if phraseIndex.canSearch(queryWords) else None
+			if phraseIds is not None:
+				queryDict = addToQueryDict(queryDict, "id", {"$in": phraseIds})
+				return [queryDict, needScore, ""]
+
 			# Do a fulltext query to isolate candidate superset
 			validIdStart = []
 			for r in db.voteview_rollcalls.find({"$text": {"$search": queryWords.lower().decode('utf-8')}}, {"_id": 0, "id": 1}):
@@ -682,7 +491,6 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
                         
 		        return [queryDict, needScore, ""]
 		else:
-			print "alltext to fulltext"
 			fieldType="fulltext"
 
 	# CODES: Search all code fields
@@ -696,6 +504,14 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 	elif fieldType=="str":		
 		if queryWords[0]=="\"" and queryWords[-1]=="\"":
 			queryWords = queryWords[1:-1]
+			exactPhrase = 1
+
+		# Quoted phrases come straight from the phrase index; unquoted str searches are substring matches.
+		if exactPhrase and queryField in phraseIndex.TEXT_FIELDS and phraseIndex.canSearch(queryWords):
+			phraseIds = phraseIndex.phraseSearch(queryWords, queryField)
+			if phraseIds is not None:
+				queryDict = addToQueryDict(queryDict, "id", {"$in": phraseIds})
+				return [queryDict, needScore, ""]
 
 		# Do a fulltext query to isolate candidate superset.
 		validIdStart = []
@@ -760,7 +576,6 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 		for name in nameSet:
 			try:
 				name = int(name)
-				print "i'm here with name ", name
 				queryDict = addToQueryDict(queryDict, "votes.icpsr", name)
 			except:
 				errorMessage = "Error: invalid member ID in voter search."
@@ -865,7 +680,6 @@ def assembleQueryChunk(queryDict, queryField, queryWords):
 		errorMessage = "Error: invalid field for search: "+queryField
 		return [queryDict, 0, errorMessage]
 
-	print "final ns for this tier", needScore
 	return [queryDict, needScore, ""]
 
 def addToQueryDict(queryDict, queryField, toAdd):
@@ -931,11 +745,143 @@ def addToQueryDict(queryDict, queryField, toAdd):
 		queryDict[queryField] = toAdd
 	return queryDict
 
+def encodeCursor(dateChamberRollnumber, score=None, maxScore=None):
+	""" Builds the opaque nextId token naming the last row of a page. Date-sorted pages only need the row's
+	date_chamber_rollnumber; score-sorted pages also carry its text score and the first page's best score.
+
+	Parameters
+	----------
+	dateChamberRollnumber: int
+		The last returned row's date_chamber_rollnumber
+	score: float, optional
+		The last returned row's text score, when sorting by score
+	maxScore: float, optional
+		The best text score of the whole result set, used for the relevance cutoff on later pages
+
+	Returns
+	-------
+	str
+		URL-safe token to hand back to the client as nextId
+	"""
+	cursor = {"d": dateChamberRollnumber}
+	if score is not None:
+		cursor["s"] = score
+		cursor["m"] = maxScore
+	return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":"))).rstrip("=")
+
+def decodeCursor(token):
+	""" Reverses encodeCursor. Returns an empty dict for a missing or invalid token (i.e. start at the first page).
+	Bare integers from clients still using the old nextId format are read as a date_chamber_rollnumber. """
+	if not token or str(token) == "0":
+		return {}
+
+	token = str(token)
+	try:
+		cursor = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+		if type(cursor) == type({}) and "d" in cursor:
+			return cursor
+	except:
+		pass
+
+	try:
+		return {"d": int(token)}
+	except:
+		return {}
+
+def facetPage(collection, pipeline, pageLimit, countCap=0, maxTimeMS=0, sort=None):
+	""" Runs a search pipeline and returns one page of rows together with the number of matching rows,
+	in a single aggregation round trip rather than a count() followed by a find().
+
+	Parameters
+	----------
+	collection: pymongo Collection
+		Collection to search
+	pipeline: list
+		Aggregation stages that match, sort and project the result set
+	pageLimit: int
+		Number of rows to return
+	countCap: int, optional
+		If set, stop counting after countCap+1 rows so broad searches don't pay for an exact count.
+		Date-sorted pipelines can walk the sort index and stop there.
+	maxTimeMS: int, optional
+		If set, the database gives up on the aggregation after this many milliseconds.
+	sort: SON, optional
+		Sort order for orders that no index gives (text score). Without countCap it
+		only sorts the page's side of the $facet, as a top-k sort, so counting every
+		match doesn't wait for all of them to be sorted.
+
+	Returns
+	-------
+	list
+		The page of rows
+	int
+		The number of matching rows (at most countCap+1 if countCap is set)
+	"""
+	pipeline = list(pipeline)
+	rows = [{"$limit": pageLimit}]
+	if sort is not None:
+		if countCap:
+			pipeline.append({"$sort": sort})
+		else:
+			rows.insert(0, {"$sort": sort})
+	if countCap:
+		pipeline.append({"$limit": countCap+1})
+	pipeline.append({"$facet": {"rows": rows, "total": [{"$count": "n"}]}})
+
+	options = {"maxTimeMS": maxTimeMS} if maxTimeMS else {}
+	facets = list(collection.aggregate(pipeline, **options))
+	if not facets:
+		return [], 0
+	total = facets[0]["total"][0]["n"] if facets[0]["total"] else 0
+	return facets[0]["rows"], total
+
+def dateChamberQuery(startdate=None, enddate=None, chamber=None):
+	""" The part of a query dict set by the startdate, enddate and chamber arguments of query().
+	Returns (queryDict, errorMessage, logMessage); the messages are None unless the arguments are invalid. """
+	queryDict = {}
+	if startdate is not None or enddate is not None:
+		nextyear = str(date.today().year + 1)
+		if startdate or enddate:
+			queryDict["date"] = {}
+		if startdate:
+			if startdate<"1787-01-01":
+				queryDict["date"]["$gte"] = "1787-01-01"
+			else:
+				queryDict["date"]["$gte"] = startdate
+		if enddate:
+			if enddate>nextyear+"-01-01":
+				queryDict["date"]["$lte"] = nextyear+"-01-01"
+			else:
+				queryDict["date"]["$lte"] = enddate
+		if startdate and enddate and startdate>enddate:
+			return queryDict, "Start Date should be on or before End Date", "Invalid query: Start date after emd date."
+
+	# Process the chamber
+	if chamber is not None:
+		chamber = chamber.title()
+		if chamber=="S":
+			chamber="Senate"
+		elif chamber=="H":
+			chamber="House"
+		if chamber not in ["House","Senate"]:
+			return queryDict, "Invalid chamber entered. Chamber can be \"House\" or \"Senate\".", "Invalid query: Invalid chamber"
+
+		queryDict["chamber"] = chamber
+	return queryDict, None, None
+
+# Rollcall fields returned with search results.
+ROLLCALL_FIELDS = {"codes.Clausen":1,"codes.Peltzman":1,"codes.Issue":1,
+		"description":1,"congress":1,"rollnumber":1,"date":1,"bill":1,"chamber":1,
+		"yea_count":1,"nay_count":1,"percent_support":1,
+		"vote_counts":1, "_id": 0, "id": 1, "date_chamber_rollnumber": 1, "key_flags": 1,
+		"vote_desc": 1, "vote_document_text": 1, "short_description": 1, "vote_question": 1, "question": 1, "vote_result":1,
+		'vote_title': 1, 'vote_question_text': 1, 'amendment_author': 1, "vote_description": 1, "bill_number": 1, "sponsor": 1}
+
 def query(qtext, startdate=None, enddate=None, chamber=None, 
           flds = ["id", "Issue", "Peltzman", "Clausen", "description", "descriptionLiteral",
                   "descriptionShort", "descriptionShortLiteral"],
           icpsr=None, rowLimit=5000, jsapi=0, rapi=0, sortDir=-1, sortSkip=0, sortScore=1, sortRoll=0, idsOnly=0,
-	  request=None):
+	  request=None, countCap=0, pageSize=0, maxTimeMS=0, keepKeys=0):
 	""" Takes the query, deals with any of the custom parameters coming in from the R package,
 	and then dispatches freeform text queries to the query dispatcher.
 
@@ -960,11 +906,22 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 		or returning as much as we can and erroring if the rowLimit is violated.
 	sortDir: int
 		Sort by date reversed or sort by date ascending
-	sortSkip: int
-		Pagination is slow as hell in MongoDB, so we can take a maximum ID to make
-		mock pagination. Then, we should return a "nextID" parameter for the next page.
+	sortSkip: str
+		Pagination is slow as hell in MongoDB, so instead of skipping we take the "nextId" cursor token
+		returned with the previous page (see encodeCursor) and resume right after the row it names.
 	request: Bottle.request Object
 		Passes user request details to the log/quota module; if none, assume command line.
+	countCap: int
+		For paginated (jsapi) searches, stop counting results past this many and report the
+		total as e.g. "10,000+" instead.
+	pageSize: int
+		If set, the rows are treated as consecutive pages of this size: results are
+		ordered page by page and "pageCursors" holds the nextId cursor after each page.
+	maxTimeMS: int
+		If set, paginated searches give up after this many milliseconds in the database.
+	keepKeys: int
+		Leave each row's date_chamber_rollnumber in the results (the person page looks
+		up the member's stored votes by it).
 	
 	Returns
 	-------
@@ -993,38 +950,11 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 		logQuota.logSearch(request, {"query": "", "resultNum": -1}) # Log the failed search: No search
 		return { 'recordcount':0,'rollcalls':[],'errormessage':"No query specified."} # Return the regular error.
 
-	if startdate is not None or enddate is not None:
-		nextyear = str(date.today().year + 1)
-		if startdate or enddate:
-			queryDict["date"] = {}
-		if startdate:
-			if startdate<"1787-01-01":
-				queryDict["date"]["$gte"] = "1787-01-01"
-			else:
-				queryDict["date"]["$gte"] = startdate
-		if enddate:
-			if enddate>nextyear+"-01-01":
-				queryDict["date"]["$lte"] = nextyear+"-01-01"
-			else:
-				queryDict["date"]["$lte"] = enddate
-		if startdate and enddate and startdate>enddate:
-			logQuota.addQuota(request, 1) # Add to quota
-			logQuota.logSearch(request, {"query": "Invalid query: Start date after emd date.", "resultNum": -1}) # Log the failed search: No search
-			return { 'recordcount':0,'rollcalls':[],'errormessage':"Start Date should be on or before End Date"}
-
-	# Process the chamber
-	if chamber is not None:
-		chamber = chamber.title()
-		if chamber=="S":
-			chamber="Senate"
-		elif chamber=="H":
-			chamber="House"
-		if chamber not in ["House","Senate"]:
-			logQuota.addQuota(request, 1) # Add to quota
-			logQuota.logSearch(request, {"query": "Invalid query: Invalid chamber", "resultNum": -1}) # Log the failed search: no search
-			return { 'recordcount':0,'rollcalls':[],'errormessage':"Invalid chamber entered. Chamber can be \"House\" or \"Senate\"."}
-
-		queryDict["chamber"] = chamber
+	queryDict, errorMessage, logMessage = dateChamberQuery(startdate, enddate, chamber)
+	if errorMessage:
+		logQuota.addQuota(request, 1) # Add to quota
+		logQuota.logSearch(request, {"query": logMessage, "resultNum": -1}) # Log the failed search: No search
+		return { 'recordcount':0,'rollcalls':[],'errormessage':errorMessage}
 
 	if qtext and len(qtext):
 		try:
@@ -1075,12 +1005,7 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 
 	# Get results
 	if not idsOnly:
-		fieldReturns = {"codes.Clausen":1,"codes.Peltzman":1,"codes.Issue":1,
-				"description":1,"congress":1,"rollnumber":1,"date":1,"bill":1,"chamber":1,
-				"yea_count":1,"nay_count":1,"percent_support":1,
-				"vote_counts":1, "_id": 0, "id": 1, "date_chamber_rollnumber": 1, "key_flags": 1,
-				"vote_desc": 1, "vote_document_text": 1, "short_description": 1, "vote_question": 1, "question": 1, "vote_result":1,
-                                'vote_title': 1, 'vote_question_text': 1, 'amendment_author': 1, "vote_description": 1, "bill_number": 1, "sponsor": 1}
+		fieldReturns = dict(ROLLCALL_FIELDS)
 	else:
 		fieldReturns = {"id": 1, "_id": 0, "date_chamber_rollnumber": 1}
 
@@ -1089,30 +1014,49 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 
 	quotaCost=0
 	votes = db.voteview_rollcalls
-	try:
-		sortSkip = int(sortSkip)
-	except:
-		sortSkip = 0
-
-	if sortSkip and not needScore:
+	cursor = decodeCursor(sortSkip)
+	sortByScore = needScore and sortScore
+
+	# Searches built only from voter:, congress: and chamber: (e.g. every member vote page)
+	# can be paged straight from the rollcall index without scanning vote arrays.
+	indexedPage = None
+	if jsapi and not needScore and not sortRoll:
+		indexedPage = rollcallIndex.page(queryDict, cursor.get("d"), sortDir, rowLimit+1)
+
+	# Keyset pagination: resume after the last row of the previous page. Date-sorted pages can do this
+	# in the query itself; score-sorted pages have to do it after the score is computed (see below).
+	if "d" in cursor and not sortByScore:
 		if sortDir==-1:
-			queryDict["date_chamber_rollnumber"] = {"$lt": sortSkip}
+			queryDict["date_chamber_rollnumber"] = {"$lt": cursor["d"]}
 		else:
-			queryDict["date_chamber_rollnumber"] = {"$gt": sortSkip}
+			queryDict["date_chamber_rollnumber"] = {"$gt": cursor["d"]}
+
+	# Paginated searches fetch the page and the count in one round trip (see facetPage).
+	scoreSort = None
+	if sortByScore:
+		pipeline = [{"$match": queryDict}, {"$project": fieldReturns}]
+		if "s" in cursor:
+			pipeline.append({"$match": {"$or": [{"score": {"$lt": cursor["s"]}},
+							    {"score": cursor["s"], "date_chamber_rollnumber": {"$lt": cursor["d"]}}]}})
+		scoreSort = SON([("score", -1), ("date_chamber_rollnumber", -1)])
+	else:
+		sortBy = "rollnumber" if sortRoll and not needScore else "date_chamber_rollnumber"
+		pipeline = [{"$match": queryDict}, {"$sort": {sortBy: sortDir}}, {"$project": fieldReturns}]
 
 	print queryDict
 	# Need to sort by text score
 	if needScore:
 		try:
-			resCount = votes.find(queryDict,fieldReturns).count()
 			rowLimit = baseRowLimit
 			if not jsapi:
+				resCount = votes.find(queryDict,fieldReturns).count()
 				results = votes.find(queryDict,fieldReturns).limit(rowLimit+5)
 			else:
-				if sortScore:
-					results = votes.find(queryDict,fieldReturns).sort([("score", {"$meta": "textScore"})]).skip(sortSkip).limit(rowLimit+5)
-                                else:
-					results = votes.find(queryDict,fieldReturns).sort("date_chamber_rollnumber", sortDir).skip(sortSkip).limit(rowLimit+5)
+				results, resCount = facetPage(votes, pipeline, rowLimit+5, countCap, maxTimeMS, scoreSort)
+		except pymongo.errors.ExecutionTimeout:
+			logQuota.addQuota(request, 10)
+			logQuota.logSearch(request, {"query": queryDict, "query_extra": "Query timed out", "resultNum": -1})
+			return {'rollcalls': [], 'recordcount': 0, 'errormessage': 'Your search took too long to complete. Please try a more specific search.'}
 		except pymongo.errors.OperationFailure, e:
 			try:
 				mongoErr = e.message
@@ -1137,13 +1081,20 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 			return returnDict			
 	else:
 		try:
-			resCount = votes.find(queryDict,fieldReturns).count()
 			rowLimit = baseRowLimit
 			if not jsapi:
+				resCount = votes.find(queryDict,fieldReturns).count()
 				results = votes.find(queryDict,fieldReturns).limit(rowLimit+5)
+			elif indexedPage is not None:
+				pageKeys, resCount = indexedPage
+				rows = dict((r["date_chamber_rollnumber"], r) for r in votes.find({"date_chamber_rollnumber": {"$in": pageKeys}}, fieldReturns))
+				results = [rows[k] for k in pageKeys if k in rows]
 			else:
-                                sortBy = "date_chamber_rollnumber" if not sortRoll else "rollnumber"
-				results = votes.find(queryDict, fieldReturns).sort(sortBy, sortDir).limit(rowLimit+5)
+				results, resCount = facetPage(votes, pipeline, rowLimit+5, countCap, maxTimeMS, scoreSort)
+		except pymongo.errors.ExecutionTimeout:
+			logQuota.addQuota(request, 10)
+			logQuota.logSearch(request, {"query": queryDict, "query_extra": "Query timed out", "resultNum": -1})
+			return {'rollcalls': [], 'recordcount': 0, 'errormessage': 'Your search took too long to complete. Please try a more specific search.'}
 		except pymongo.errors.OperationFailure, e:
 			try:
 				junk, mongoErr = e.message.split("failed: ")
@@ -1164,7 +1115,9 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 	# Mongo lazy-allocates results, so we need to loop to pull them in
 	mr = []
 	nextId = 0
-	maxScore = 0
+	maxScore = cursor.get("m", 0) if sortByScore else 0
+	lastKey = None
+	rowKeys = []
 	for res in results:
                 # Apply waterfall to text if jsapi
                 if jsapi or rapi:
@@ -1174,8 +1127,7 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 			maxScore = res["score"]
 
 		if len(mr)<rowLimit:
-			if "date_chamber_rollnumber" in res:
-				del res["date_chamber_rollnumber"]
+			dateChamberRollnumber = res.get("date_chamber_rollnumber") if keepKeys else res.pop("date_chamber_rollnumber", None)
 			if not needScore:
 				mr.append(res)
 			elif res["score"]>= SCORE_THRESHOLD and res["score"]>=SCORE_MULT_THRESHOLD * maxScore:
@@ -1183,16 +1135,33 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 			else:
 				nextId = 0
 				break
+			lastKey = (dateChamberRollnumber, res.get("score"))
+			rowKeys.append(lastKey)
 		else:
-			if not needScore:
-				nextId = str(res["date_chamber_rollnumber"])
+			# There's at least one more row: hand back a cursor naming the last row we returned.
+			if sortByScore:
+				nextId = encodeCursor(lastKey[0], lastKey[1], maxScore)
 			else:
-				nextId = sortSkip + rowLimit
+				nextId = encodeCursor(lastKey[0])
 			break
 
+	# Cursors for the page boundaries inside this batch; the last page's is nextId.
+	pageCursors = []
+	if pageSize:
+		for end in xrange(pageSize, len(mr), pageSize):
+			if sortByScore:
+				pageCursors.append(encodeCursor(rowKeys[end-1][0], rowKeys[end-1][1], maxScore))
+			else:
+				pageCursors.append(encodeCursor(rowKeys[end-1][0]))
+		pageCursors.append(nextId)
+
 	if needScore:
 		keyvoteBoost = 2
-		mr.sort(key=lambda x: -x["score"] - keyvoteBoost*int(bool(x.get("key_flags",[]))))
+		boostSort = lambda x: -x["score"] - keyvoteBoost*int(bool(x.get("key_flags",[])))
+		if pageSize:
+			mr = sum([sorted(mr[i:i+pageSize], key=boostSort) for i in xrange(0, len(mr), pageSize)], [])
+		else:
+			mr.sort(key=boostSort)
 
 	# Get ready to output
 	returnDict = {}
@@ -1200,8 +1169,13 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 	returnDict["rollcalls"] = mr
 	returnDict["recordcount"] = len(mr)
 	returnDict["recordcountTotal"] = resCount
+	if jsapi and countCap and resCount>countCap:
+		returnDict["recordcountTotal"] = "{:,d}+".format(countCap)
+		returnDict["recordcountCapped"] = 1
 	returnDict["apiversion"] = "Q3 2017-01-08"
 	returnDict["nextId"] = nextId 
+	if pageSize:
+		returnDict["pageCursors"] = pageCursors
 	if "$text" in queryDict:
 		returnDict["fulltextSearch"] = [v for k, v in queryDict["$text"].iteritems()][0]
 
@@ -1228,6 +1202,143 @@ def query(qtext, startdate=None, enddate=None, chamber=None,
 	print resCount
 	return returnDict
 
+def memberVotePage(icpsr, sortSkip=0, rowLimit=25, request=None):
+	""" One page of a member's votes, newest first, read straight off the stored
+	member votes (see memberVotes.py) by their (icpsr, dcr) index rather than
+	by searching the rollcalls' vote arrays.
+
+	Parameters
+	----------
+	icpsr: int
+		The member
+	sortSkip: str
+		The previous page's nextId cursor, or 0 for the first page
+	rowLimit: int
+		Rows per page
+	request: Bottle.request Object
+		Passes user request details to the log/quota module
+
+	Returns
+	-------
+	dict
+		Shaped like a query() result, plus "memberVotes": the stored records of
+		the page's rollcalls. None if nothing is stored for the member yet, in
+		which case the caller should fall back to query().
+	"""
+	quotaCheck = logQuota.checkQuota(request)
+	if quotaCheck["status"]:
+		return {"recordcount": 0, "rollcalls": [], "nextId": 0, "errormessage": quotaCheck["error_message"]}
+
+	cursor = decodeCursor(sortSkip)
+	queryDict = {"icpsr": int(icpsr)}
+	if "d" in cursor:
+		queryDict["dcr"] = {"$lt": cursor["d"]}
+	records = list(db.voteview_member_votes.find(queryDict, {"_id": 0, "built": 0}).sort("dcr", -1).limit(rowLimit+1))
+	if not records and not cursor:
+		return None
+
+	nextId = 0
+	if len(records)>rowLimit:
+		records = records[:rowLimit]
+		nextId = encodeCursor(records[-1]["dcr"])
+
+	rows = dict((r["date_chamber_rollnumber"], r) for r in
+		db.voteview_rollcalls.find({"date_chamber_rollnumber": {"$in": [r["dcr"] for r in records]}}, ROLLCALL_FIELDS))
+	rollcalls = []
+	for record in records:
+		res = rows.get(record["dcr"])
+		if res is None:
+			continue
+		del res["date_chamber_rollnumber"]
+		res["text"] = waterfallText(res)
+		res["question"] = waterfallQuestion(res)
+		rollcalls.append(res)
+
+	logQuota.addQuota(request, 1)
+	logQuota.logSearch(request, {"query": queryDict, "resultNum": len(rollcalls)})
+	return {"rollcalls": rollcalls, "recordcount": len(rollcalls), "nextId": nextId, "memberVotes": records}
+
+def searchFacets(qtext, startdate=None, enddate=None, chamber=None, request=None, maxTimeMS=0):
+	""" Per-facet result counts for the search sidebar, answered from the rollcall index
+	instead of one count() per facet value.
+
+	Parameters
+	----------
+	qtext : str
+		Search query, with the sidebar's facets folded in (see searchAssemble.facetQuery)
+	startdate: str
+		Format YYYY-MM-DD
+	enddate: str
+		Format YYYY-MM-DD
+	chamber: str
+		House or Senate
+	request: Bottle.request Object
+		Passes user request details to the quota module; if none, assume command line.
+	maxTimeMS: int
+		If set, give up after this many milliseconds in the database.
+
+	Returns
+	-------
+	dict
+		Total result count and {facet: {value: count}}; see rollcallIndex.facetCounts
+	"""
+	quotaCheck = logQuota.checkQuota(request)
+	if quotaCheck["status"]:
+		return {"errormessage": quotaCheck["error_message"]}
+
+	beginTime = time.time()
+	qtext = qtext.encode('utf-8') if qtext else ""
+	if not qtext.strip() and startdate is None and enddate is None and chamber is None:
+		return {"errormessage": "No query specified."}
+
+	queryDict, errorMessage, logMessage = dateChamberQuery(startdate, enddate, chamber)
+	if errorMessage:
+		logQuota.addQuota(request, 1)
+		logQuota.logSearch(request, {"query": logMessage, "query_extra": "Facet counts", "resultNum": -1})
+		return {"errormessage": errorMessage}
+
+	if qtext.strip():
+		try:
+			from urllib import unquote_plus
+			newQueryDict, needScore, errorMessage = queryDispatcher(unquote_plus(qtext))
+		except:
+			print traceback.format_exc()
+			logQuota.addQuota(request, 1)
+			logQuota.logSearch(request, {"query": "Invalid Query; parsing issue.", "query_extra": qtext, "resultNum": -1})
+			return {"errormessage": "Error parsing freeform query."}
+		if errorMessage:
+			logQuota.addQuota(request, 1)
+			logQuota.logSearch(request, {"query": "Invalid Query; parsing issue.", "query_extra": qtext, "resultNum": -1})
+			return {"errormessage": errorMessage}
+		queryDict.update(newQueryDict)
+
+	try:
+		res = rollcallIndex.facetCounts(queryDict, maxTimeMS)
+	except pymongo.errors.ExecutionTimeout:
+		logQuota.addQuota(request, 10)
+		logQuota.logSearch(request, {"query": queryDict, "query_extra": "Facet counts; query timed out", "resultNum": -1})
+		return {"errormessage": "Your search took too long to complete. Please try a more specific search."}
+	except pymongo.errors.OperationFailure:
+		logQuota.addQuota(request, 1)
+		logQuota.logSearch(request, {"query": queryDict, "query_extra": "Facet counts; database error", "resultNum": -1})
+		return {"errormessage": "Error during database query."}
+	if res is None:
+		return {"errormessage": "Search facets are not available right now."}
+
+	# Charged like query(): by execution time.
+	elapsedTime = time.time() - beginTime
+	res["elapsedTime"] = round(elapsedTime, 3)
+	if elapsedTime>10:
+		logQuota.addQuota(request, 10)
+		logQuota.logSearch(request, {"query": queryDict, "query_extra": "Facet counts; very slow query", "resultNum": res["total"]})
+	elif elapsedTime>2:
+		logQuota.addQuota(request, 2)
+		logQuota.logSearch(request, {"query": queryDict, "query_extra": "Facet counts; slow query", "resultNum": res["total"]})
+	else:
+		logQuota.addQuota(request, 1)
+		logQuota.logSearch(request, {"query": queryDict, "query_extra": "Facet counts", "resultNum": res["total"]})
+	return res
+
 if __name__ == "__main__":
 	start = time.time()
 	if len(sys.argv)>1:
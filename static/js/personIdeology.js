@@ -4,7 +4,7 @@ $(".nav-tabs > li > a").click(switchTab);
 (function loadData()
 {
 	$("#view_all_members").attr("href", "/congress/" + chamber + "/" + congressNum);
-	queue().defer(d3.json, "/api/getmembersbycongress?congress="+congressNum+"&api=Web_PI").await(fillLoyaltyDrawHist);	
+	queue().defer(d3.json, "/api/ideologyHistogram?congress="+congressNum+"&chamber="+chamber+"&bins="+numBins+"&icpsr="+memberICPSR).await(fillLoyaltyDrawHist);
 })();
 
 function switchTab(e) {
@@ -22,43 +22,6 @@ function switchTab(e) {
 	return false;
 }
 
-function getMedian(data, type) {
-	// Sort data
-	function sortVotes(a, b) { return a[0] - b[0]; }
-	function sortLoyalty(a, b) { return (a[1] / a[0]) - (b[1] / b[0]); }
-	function sortAttendance(a, b) { return (a[0] / (a[0] + a[2])) - (b[0] / (b[0] + b[2])); }
-	var sortedData = data.sort(type == "votes" ? sortVotes : type == "loyalty" ? sortLoyalty : sortAttendance);
-
-	// Okay, which is the median position
-	var middlePos = Math.floor((data.length - 1) / 2);
-
-	// Extractor functions for quantities of interest
-	function extractVote(item) { return item[0]; }
-	function extractLoyalty(item) { return 100 * (1 - (item[1] / item[0])); }
-	function extractAttendance(item) { return 100 * (item[0] / (item[0] + item[2])); }
-
-	// Simple case: single median
-	if(sortedData.length % 2) 
-	{
-		var item = sortedData[middlePos];
-		var out = type == "votes" ? extractVote(item) : type == "loyalty" ? extractLoyalty(item) : extractAttendance(item);
-	}
-	// More complex case, median is mean of middle 2.
-	else
-	{
-		var item1 = sortedData[middlePos];
-		var out1 = type == "votes" ? extractVote(item1) : type == "loyalty" ? extractLoyalty(item1) : extractAttendance(item1);
-
-		var item2 = sortedData[middlePos + 1];
-		var out2 = type == "votes" ? extractVote(item2) : type == "loyalty" ? extractLoyalty(item2) : extractAttendance(item2);
-
-		var out = (out1 + out2) / 2.0;
-	}
-	
-	// Round attendance / loyalty, but don't round votes.
-	return type == "votes" ? out : Math.round(out, 1);   
-}
-
 // From stackoverflow response, who borrowed it from Shopify--simple ordinal suffix.
 function getGetOrdinal(n) {
     var s=["th","st","nd","rd"],
@@ -70,17 +33,18 @@ function getGetOrdinal(n) {
 function reloadIdeology()
 {
 	congressNum = $("#congSelector").val();
-	queue().defer(d3.json, "/api/getmembersbycongress?congress="+congressNum+"&api=Web_PI").await(updateCongress);
+	// No chamber: the server uses the member's chamber in the new congress.
+	queue().defer(d3.json, "/api/ideologyHistogram?congress="+congressNum+"&bins="+numBins+"&icpsr="+memberICPSR).await(updateCongress);
 }
 
 // Wrapper to update default loadings for the person's ideal point.
 function updateCongress(error, data)
 {
 	// Fail if we didn't get data.
-	if(data==undefined) { return(0); }
+	if(data==undefined || data["member"]==undefined) { return(0); }
 
-	// Select the member that matches
-	var d = data["results"].filter(function(p) { return p.icpsr == memberICPSR; })[0];
+	// The server places our member in the distribution.
+	var d = data["member"];
 
 	// Update our globals.
 	memberIdeal = d.nominate.dim1;
@@ -116,59 +80,22 @@ function updateCongress(error, data)
 
 function fillLoyaltyDrawHist(error, data)
 {
-	if(data == undefined) { return(0); }
-
-	// For loyalty scores
-        var partyVotes=[];
-        var chamberVotes=[];
-
-	// For ideology scores
-	var congressNom = [];
-	var partyNom = [];
-	var chamberNom = [];
-	var partyChamberNom = [];
-	
-	// Iterate through data, building chamber and party results.
-	data["results"].forEach(function (d) {
-		// Skip people with no NOMINATE score.
-		if(d.nominate==undefined) { return true; }
-
-		// Log NOMINATE scores into arrays as appropriate.
-		congressNom.push(d.nominate.dim1);
-		if(d.party_code == memberPartyCode && d.chamber.toLowerCase() == chamber)
-		{
-			partyNom.push(d.nominate.dim1);
-			chamberNom.push(d.nominate.dim1);
-			partyChamberNom.push(d.nominate.dim1);
-		}
-		else if(d.party_code == memberPartyCode) partyNom.push(d.nominate.dim1);
-		else if(d.chamber.toLowerCase() == chamber) chamberNom.push(d.nominate.dim1);
-
-		if(d.chamber.toLowerCase() == chamber || chamber == 'president' || chamberTrue == 'President') {
-			chamberVotes.push([d.nvotes_yea_nay, d.nvotes_against_party, d.nvotes_abs]);
-		}
-
-		// If the current member is in the requested member's party:
-		if(d.party_code==memberPartyCode)
-		{
-			if(d.chamber.toLowerCase() == chamber || chamber == 'president' || chamberTrue == 'President') {
-				partyVotes.push([d.nvotes_yea_nay, d.nvotes_against_party, d.nvotes_abs]);
-			}
-	       }	    
-	});
-
-	// How many people are more conservative than this person?
-	function reduceSum(total, num) { return total + num; }	
-	function moreConservative(num) { return (memberIdeal > num); }
-	var mc = congressNom.map(moreConservative).reduce(reduceSum, 0); // Overall
-	var mcParty = partyNom.map(moreConservative).reduce(reduceSum, 0); // In their party
-	var mcChamber = chamberNom.map(moreConservative).reduce(reduceSum, 0); // In their chamber
-	var mcPartyChamber = partyChamberNom.map(moreConservative).reduce(reduceSum, 0); // In their party in their chamber
+	if(data == undefined || data["ranks"] == undefined) { return(0); }
+
+	// How many people are more conservative than this person? The server
+	// counts the members of the congress, chamber, and party in the chamber
+	// who are more liberal.
+	var mc = data["ranks"]["congress"]["below"]; // Overall
+	var mcChamber = data["ranks"]["chamber"]["below"]; // In their chamber
+	var mcPartyChamber = data["ranks"]["partyChamber"]["below"]; // In their party in their chamber
+	var congressTotal = data["ranks"]["congress"]["total"];
+	var chamberTotal = data["ranks"]["chamber"]["total"];
+	var partyChamberTotal = data["ranks"]["partyChamber"]["total"];
 
 	// Okay, now convert to percentages.
-	var conPct = 100 * mc / (congressNom.length - 1);
-	var conPctChamber = 100 * mcChamber / (chamberNom.length - 1);
-	var conPctPC = 100 * mcPartyChamber / (partyChamberNom.length - 1);
+	var conPct = 100 * mc / (congressTotal - 1);
+	var conPctChamber = 100 * mcChamber / (chamberTotal - 1);
+	var conPctPC = 100 * mcPartyChamber / (partyChamberTotal - 1);
 
 	// Prep label: first, capitalize chamber name.
 	var chamberCap = chamber.substring(0, 1).toUpperCase() + chamber.substring(1);
@@ -176,23 +103,23 @@ function fillLoyaltyDrawHist(error, data)
 	var label = "<strong>Ideology Score:</strong> "+memberIdeal+" <em>(DW-NOMINATE first dimension)</em><br/><br/>";
 	// Waterfall labels: Requested is most liberal
 	if(mc == 0) { label += "The most liberal member of the " + getGetOrdinal(congressNum) + " congress."; }
-	else if(mc == congressNom.length - 1) { label += "The most conservative member of the " + getGetOrdinal(congressNum) + " congress."; }
+	else if(mc == congressTotal - 1) { label += "The most conservative member of the " + getGetOrdinal(congressNum) + " congress."; }
 	else if(mcChamber == 0) { label += "The most liberal member of the " + getGetOrdinal(congressNum) + " " + chamberCap; }
-	else if(mcChamber == chamberNom.length - 1) { label += "The most conservative member of the " + getGetOrdinal(congressNum) + " " + chamberCap; }
+	else if(mcChamber == chamberTotal - 1) { label += "The most conservative member of the " + getGetOrdinal(congressNum) + " " + chamberCap; }
 	else
 	{
 		// They aren't superlative, let's compare them to their overall chamber and their party in that chamber.
 
 		// First, overall -- how do they compare to their chamber?
-		if(mcChamber > (chamberNom.length - 1) / 2) label += "More conservative than " + Math.floor(conPctChamber, 1) + "% of the " + getGetOrdinal(congressNum) + " " + chamberCap + "<br/>"; 
+		if(mcChamber > (chamberTotal - 1) / 2) label += "More conservative than " + Math.floor(conPctChamber, 1) + "% of the " + getGetOrdinal(congressNum) + " " + chamberCap + "<br/>"; 
 		else label += "More liberal than " + Math.floor(100 - conPctChamber, 1) + "% of the " + getGetOrdinal(congressNum) + " " + chamberCap + "<br/>";
 
 		// Now, compared to their party?
-		if(partyChamberNom.length > 1)
+		if(partyChamberTotal > 1)
 		{
 			if(mcPartyChamber == 0) { label += "The most liberal " + memberNoun + " of the " + getGetOrdinal(congressNum) + " " + chamberCap + "."; }
-			else if(mcPartyChamber == partyChamberNom.length - 1) { label += "The most conservative " + memberNoun + " of the " + getGetOrdinal(congressNum) + " " + chamberCap + "."; }
-			else if(mcPartyChamber > (partyChamberNom.length - 1) / 2) { label += "More conservative than " + Math.floor(conPctPC, 1) + "% of " + memberNoun + "s in the " + getGetOrdinal(congressNum) + " " + chamberCap; }
+			else if(mcPartyChamber == partyChamberTotal - 1) { label += "The most conservative " + memberNoun + " of the " + getGetOrdinal(congressNum) + " " + chamberCap + "."; }
+			else if(mcPartyChamber > (partyChamberTotal - 1) / 2) { label += "More conservative than " + Math.floor(conPctPC, 1) + "% of " + memberNoun + "s in the " + getGetOrdinal(congressNum) + " " + chamberCap; }
 			else { label += "More liberal than " + Math.floor(100 - conPctPC, 1) + "% of " + memberNoun + "s in the " + getGetOrdinal(congressNum) + " " + chamberCap; }
 		}
 	}
@@ -207,15 +134,15 @@ function fillLoyaltyDrawHist(error, data)
 
 	// Build loyalty table
 	loyaltyTable(
-		{"party": partyVotes, "chamber": chamberVotes},
+		{"party": data["loyalty"]["parties"][memberPartyCode] || {}, "chamber": data["loyalty"]["chamber"]},
 		{"lastName": memberLastName, "noun": memberNoun, "votes": memberVotes, "attendance": memberAttendance, "loyalty": memberLoyalty, "party": memberPartyCode},
 		{"chamberCap": chamberCap}
 	);
 
-	// Build crossfilter, because dc needs one for a histogram
-	var ndx = crossfilter(chamberNom);
-	var oneDimDimension = ndx.dimension(function(d) { return d; });
-	var oneDimGroup = oneDimDimension.group(function(d) { return Math.floor(d*numBins); });
+	// Build crossfilter, because dc needs one for a histogram; the bins arrive already counted.
+	var ndx = crossfilter(data["histogram"]);
+	var oneDimDimension = ndx.dimension(function(d) { return d.key; });
+	var oneDimGroup = oneDimDimension.group().reduceSum(function(d) { return d.count; });
 
 	// Build the histogram
 	var nominateHist = dc.barChart("#nominateHist");
@@ -297,13 +224,13 @@ function loyaltyTable(votes, member, meta)
 			meta["chamberCap"] + " Median"];
 
 	var voteRow = ["Votes Cast", member["votes"], 
-			getMedian(votes["party"], "votes"), 
-			getMedian(votes["chamber"], "votes")];
+			votes["party"]["votes"], 
+			votes["chamber"]["votes"]];
 
 	var attendanceRow = ["Attendance",
 				Math.round(member["attendance"], 1) + "%",
-				getMedian(votes["party"], "attendance") + "%",
-				getMedian(votes["chamber"], "attendance") + "%"];
+				Math.round(votes["party"]["attendance"], 1) + "%",
+				Math.round(votes["chamber"]["attendance"], 1) + "%"];
 
 	// Assemble
 	assembleRow(headerRow).appendTo($("#loyaltyTable"));
@@ -315,8 +242,8 @@ function loyaltyTable(votes, member, meta)
 	{
 		var loyaltyRow = ["Party Loyalty",
 					Math.round(member["loyalty"], 1) + "%",
-					getMedian(votes["party"], "loyalty") + "%",
-					getMedian(votes["chamber"], "loyalty") + "%"];
+					Math.round(votes["party"]["loyalty"], 1) + "%",
+					Math.round(votes["chamber"]["loyalty"], 1) + "%"];
 
 		// Add the tooltip to each cell individually.
 		var loyaltyAssembled = assembleRow(loyaltyRow);
@@ -17,7 +17,6 @@ function nextPageSearch()
 {
 		if(!globalNextId) $("#memberVotesTable").animate({opacity: 0});
 		else $("#loadIndicator").fadeIn();
-		if(globalNextId) { globalNextId++; }
 		$.ajax("/api/getMemberVotesAssemble?icpsr="+memberICPSR+"&qtext="+$("#memberSearchBox").val()+"&skip="+globalNextId, 	
 			{"type": "GET", "success": function(d, status, xhr)
 				{
@@ -8,7 +8,7 @@ var resultCount = 0;
 var cachedVotes = {};
 var globalQueueRequests = 0;
 var requestQueue;
-var nextId = 0; // What skip value we send to the next page loader.
+var nextId = 0; // Opaque cursor naming the last result shown, sent to the next page loader.
 var metaPageloaded = 0; // How many pages we've auto-loaded on this search.
 var blockAutoscroll = 0; // If there's a load still in progress.
 
@@ -346,7 +346,7 @@ $(document).ready(function(){
 	$(window).scroll(function() { // Scroll listener
 		// Load next page when scroll is >95% through the whole document, there's a next page to load,
 		// and we've loaded fewer than 10 pages already and there's not a request currently underway.
-		if($(window).scrollTop() + $(window).height() >= $(document).height()*0.95 && nextId>0 & metaPageloaded<10 & !blockAutoscroll)
+		if($(window).scrollTop() + $(window).height() >= $(document).height()*0.95 && nextId && nextId!=0 & metaPageloaded<10 & !blockAutoscroll)
 		{
 			blockAutoscroll=1;
 			getRollcallsPage();
@@ -551,7 +551,10 @@ var globalSlowLoadTimer;
 
 					}
 				}
-				var resultsNumber = parseInt(xhr.getResponseHeader("Rollcall-Number"));
+				// Large result counts are capped server-side and reported as e.g. "10,000+".
+				var resultsNumberText = xhr.getResponseHeader("Rollcall-Number") || "0";
+				var resultsNumber = parseInt(resultsNumberText.replace(/,/g, ""));
+				var resultsCapped = resultsNumberText.endsWith("+") ? "+" : "";
 				var memberNumber = parseInt(xhr.getResponseHeader("Member-Number"));
 				var partyNumber = parseInt(xhr.getResponseHeader("Party-Number"));
 			        var needScore = parseInt(xhr.getResponseHeader("Need-Score"));
@@ -578,13 +581,14 @@ var globalSlowLoadTimer;
 				if(memberNumber > 8) baseString += " (showing 8)";
 				if(memberNumber) baseString += ", ";
 				if(baseString && resultsNumber) baseString += "and ";
-				if(resultsNumber) baseString += numberWithCommas(resultsNumber) + " " + voteLabelText;
+				if(resultsNumber) baseString += numberWithCommas(resultsNumber) + resultsCapped + " " + voteLabelText;
 				if(!partyNumber && !memberNumber && resultsNumber == 0) baseString = "0 results ";
 				if(baseString.endsWith(", ")) baseString = baseString.replace(/, $/gi, "");
 				baseString += " found.";
 				if(resultsNumber < 0) baseString = "";
 
 				$("#results-number").html(baseString);
+				if(resultsNumber > 0) { getFacetCounts(); } else { $(".facet-count").remove(); }
 			   
 			        // Control how sorting buttons appear
 			        if(needScore && $("#sortScore").val() == 1)
@@ -672,6 +676,31 @@ var globalSlowLoadTimer;
 		});
 	}
 
+// Show next to each sidebar facet how many of the current search's results it would keep.
+function getFacetCounts()
+{
+	$(".facet-count").remove();
+	$.ajax({
+		type: "POST",
+		dataType: "JSON",
+		url: "/api/searchFacets",
+		data: $('#faceted-search-form').serialize(),
+		success: function(res, status, xhr)
+		{
+			if(res["errormessage"] || !res["facets"]) { return; }
+			$.each(["chamber", "clausen", "peltzman", "keyvote"], function(i, facet)
+			{
+				var counts = res["facets"][facet] || {};
+				$('#faceted-search-form input[name='+facet+']').each(function()
+				{
+					var count = counts[$(this).val()] || 0;
+					$(this).parent().append('<span class="facet-count text-muted"> ('+numberWithCommas(count)+')</span>');
+				});
+			});
+		}
+	});
+}
+
 function selectIncludedVotes()
 {
 	$('input[name=ids]').prop('checked',false);
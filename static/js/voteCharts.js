@@ -13,17 +13,24 @@ var globalData;
 // Makes the bootstrap tooltip run for votes from before states were contiguous.
 $(document).ready(function(){$('[data-toggle="tooltip"]').tooltip();});
 
+// The page embeds the rollcall payload; only fetch it if it's missing.
+function loadRollcall(callback)
+{
+	if(typeof rollcallData !== "undefined" && rollcallData != null) { callback(null, rollcallData); }
+	else { d3.json("/api/download/"+rcID, callback); }
+}
+
 // Initial asynchronous load
 (function loadData(){
     if (chamber == "House") {
         queue()
-          .defer(d3.json, "/api/download/"+rcID)
+          .defer(loadRollcall)
           .defer(d3.json, "/static/json/districts"+congressNum+".json")
 	  .defer(d3.json, "/static/json/usa.topojson")
           .await(drawWidgets);
     } else if (chamber == "Senate") {
         queue()
-          .defer(d3.json, "/api/download/"+rcID)
+          .defer(loadRollcall)
           .defer(d3.json, "/static/json/states"+congressNum+".json")
 	  .defer(d3.json, "/static/json/usa.topojson")
           .await(drawWidgets);
@@ -172,7 +179,7 @@ function drawWidgets(error, data, geodata, usaboundaries)
 	{
 		var tryLoadingOneLower = "/static/"+error.responseURL.replace(congressNum,congressNum-1).split("/static/")[1];
 		fallback=1;
-		queue().defer(d3.json, "/api/download/"+rcID).defer(d3.json, tryLoadingOneLower).await(drawWidgets);
+		queue().defer(loadRollcall).defer(d3.json, tryLoadingOneLower).await(drawWidgets);
 		return(0);
 	}
 	// If we still have an error, give up on the map but still load the vote.
@@ -182,7 +189,7 @@ function drawWidgets(error, data, geodata, usaboundaries)
 		if(error.status == 404 && error.responseURL.indexOf(".json") != -1)
 		{
 			errorMessage = "Unable to download geographic data for this session.";
-			queue().defer(d3.json, "/api/download/"+rcID).await(drawWidgetsFailMap);
+			queue().defer(loadRollcall).await(drawWidgetsFailMap);
 		}
 		$("#errorContent > div > div.errorMessage").html(errorMessage);
 		$("#errorContent").animate({"height": "toggle", "opacity": "toggle"},"slow");
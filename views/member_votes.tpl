@@ -2,7 +2,7 @@
 % rcSuffix = lambda n: "%d%s" % (n,"tsnrhtdd"[(n/10%10!=1)*(n%10<4)*n%10::4])
 % import model.prepVotes
 % if len(votes):
-		% if not int(skip):
+		% if not skip:
                 <table class="table table-hover dc-data-table" id="voteDataTable">
 			<thead>
 				<tr class="header">
@@ -103,7 +103,7 @@
                         </tr>
 			% lastDate = vote["date"]
                     % end
-		% if not int(skip):
+		% if not skip:
                 </table>
 		% end
 % else:
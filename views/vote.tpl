@@ -138,6 +138,7 @@
 var chamber = "{{ rollcall["chamber"] }}";
 var congressNum = "{{ str(rollcall["congress"]).zfill(3) }}";
 var rcID = "{{ rollcall["id"] }}";
+var rollcallData = {{! rollcallJSON }};
 var mapParties = {{ mapParties }};
 var nomDWeight = {{ dimweight }};
 var nomBeta = {{ nomBeta }};